@@ -1,66 +1,77 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+from modules.startup import load_key, startup_data, wait_for_data
+from modules.perf import begin_rerun, end_rerun, span
+from modules.figures import chart, extend_query
+from modules.sketches import METRICS_DIMENSIONS, metrics_cube
+from modules.anomalies import METHODS, metrics_anomalies
+from modules.adherence import COMPLIANCE_TARGET, metrics_adherence
+from modules.correlations import CORRELATION_METRICS, correlation_matrix, metrics_moments, regression_line
+from modules.warmup import PAGE_MODULES, start_warmup
+from modules.export import export_controls
+from modules.filters import session_cascade
+from modules.querylog import QUERY_PAGES, cascade_filters, record_view, selection_query
 
-# Load Dataset from S3 or Local File
-S3_DATA_URL = "https://althealth.s3.us-east-1.amazonaws.com/Synthetic_Dataset_Metrics_Final_Fixed.xlsx"
+begin_rerun()
 
-@st.cache_data
-def load_data():
-    df = pd.read_excel(S3_DATA_URL)
-    df["RecordDate"] = pd.to_datetime(df["RecordDate"], errors='coerce')
-    df["Week"] = df["RecordDate"].dt.to_period("W").astype(str)
-    df["Month"] = df["RecordDate"].dt.to_period("M").astype(str)
-    return df
-
-
-# Load the dataset
-with st.spinner("Loading data, please wait..."):
-    df = load_data()
+# Load the metrics and survey datasets from S3 or local files (override with ALTHEALTH_METRICS_SOURCE /
+# ALTHEALTH_SURVEY_SOURCE). Both are loaded concurrently, once per process, and shared by all sessions;
+# only the metrics are waited for here, the pages that read the survey workbook wait for it themselves.
+with span("load_data (startup loader)"):
+    loader = startup_data()
+    wait_for_data(loader, ["metrics"])
+    df = loader.result("metrics")
 
 st.title("Wellness & Activity Tracking Dashboard")
-page = st.radio("Select Analysis", ["Main Dashboard", "Steps Analysis", "Sleep Analysis", "Heart Rate Analysis", "Comparison Analysis","Survey Analysis"], horizontal=True)
+page = st.radio("Select Analysis", ["Main Dashboard", "Steps Analysis", "Sleep Analysis", "Heart Rate Analysis", "Comparison Analysis", "Physician Caseload", "Survey Analysis"], horizontal=True)
 
 
 # Sidebar Filters - Hide for Survey Analysis
 if page != "Survey Analysis":
-    st.sidebar.header("🔍 Filters")
-    org_filter = st.sidebar.selectbox("Select Organization", ["All"] + list(df["OrganizationName"].dropna().unique()), key="org_filter")
-    filtered_df = df[df["OrganizationName"] == org_filter] if org_filter != "All" else df
+    with span("filter cascade"):
+        st.sidebar.header("🔍 Filters")
+        # Each level narrows the previous one; the session's cascade re-evaluates only what changed since the last rerun.
+        cascade = session_cascade(df)
+        org_filter = st.sidebar.selectbox("Select Organization", ["All"] + cascade.options("OrganizationName"), key="org_filter")
+        cascade.equals("OrganizationName", org_filter)
 
-    cohort_filter = st.sidebar.selectbox("Select Cohort", ["All"] + list(filtered_df["CohortName"].dropna().unique()), key="cohort_filter")
-    filtered_df = filtered_df[filtered_df["CohortName"] == cohort_filter] if cohort_filter != "All" else filtered_df
+        cohort_filter = st.sidebar.selectbox("Select Cohort", ["All"] + cascade.options("CohortName"), key="cohort_filter")
+        cascade.equals("CohortName", cohort_filter)
 
-    program_filter = st.sidebar.selectbox("Select Program", ["All"] + list(filtered_df["ProgramName"].dropna().unique()), key="program_filter")
-    filtered_df = filtered_df[filtered_df["ProgramName"] == program_filter] if program_filter != "All" else filtered_df
+        program_filter = st.sidebar.selectbox("Select Program", ["All"] + cascade.options("ProgramName"), key="program_filter")
+        cascade.equals("ProgramName", program_filter)
 
-    gender_filter = st.sidebar.selectbox("Select Gender", ["All"] + list(filtered_df["ParticipantGender"].dropna().unique()), key="gender_filter")
-    filtered_df = filtered_df[filtered_df["ParticipantGender"] == gender_filter] if gender_filter != "All" else filtered_df
+        gender_filter = st.sidebar.selectbox("Select Gender", ["All"] + cascade.options("ParticipantGender"), key="gender_filter")
+        cascade.equals("ParticipantGender", gender_filter)
 
-    ethnicity_filter = st.sidebar.selectbox("Select Ethnicity", ["All"] + list(filtered_df["Ethnicity"].dropna().unique()), key="ethnicity_filter")
-    filtered_df = filtered_df[filtered_df["Ethnicity"] == ethnicity_filter] if ethnicity_filter != "All" else filtered_df
+        ethnicity_filter = st.sidebar.selectbox("Select Ethnicity", ["All"] + cascade.options("Ethnicity"), key="ethnicity_filter")
+        cascade.equals("Ethnicity", ethnicity_filter)
 
-    age_group_filter = st.sidebar.selectbox("Select Age Group", ["All"] + list(filtered_df["AgeGroup"].dropna().unique()), key="age_group_filter")
-    filtered_df = filtered_df[filtered_df["AgeGroup"] == age_group_filter] if age_group_filter != "All" else filtered_df
+        age_group_filter = st.sidebar.selectbox("Select Age Group", ["All"] + cascade.options("AgeGroup"), key="age_group_filter")
+        cascade.equals("AgeGroup", age_group_filter)
 
-    city_filter = st.sidebar.selectbox("Select City", ["All"] + list(filtered_df["City"].dropna().unique()), key="city_filter")
-    filtered_df = filtered_df[filtered_df["City"] == city_filter] if city_filter != "All" else filtered_df
+        city_filter = st.sidebar.selectbox("Select City", ["All"] + cascade.options("City"), key="city_filter")
+        cascade.equals("City", city_filter)
 
-    # Range Filters
-    weight_range = st.sidebar.slider("Select Weight (Kg) Range", 10, 200, (10, 200), key="weight_filter")
-    filtered_df = filtered_df[(filtered_df["WeightKg"] >= weight_range[0]) & (filtered_df["WeightKg"] <= weight_range[1])]
+        # Range Filters
+        weight_range = st.sidebar.slider("Select Weight (Kg) Range", 10, 200, (10, 200), key="weight_filter")
+        cascade.between("WeightKg", *weight_range)
 
-    height_range = st.sidebar.slider("Select Height (Cm) Range", 70, 220, (70, 220), key="height_filter")
-    filtered_df = filtered_df[(filtered_df["HeightCm"] >= height_range[0]) & (filtered_df["HeightCm"] <= height_range[1])]
+        height_range = st.sidebar.slider("Select Height (Cm) Range", 70, 220, (70, 220), key="height_filter")
+        cascade.between("HeightCm", *height_range)
 
-    # Date Range Filter (Fixed to 2024-2025)
-    from_date = st.sidebar.date_input("From Date", pd.to_datetime("2024-01-01"), key="from_date")
-    to_date = st.sidebar.date_input("To Date", pd.to_datetime("2025-12-31"), key="to_date")
+        # Date Range Filter (Fixed to 2024-2025)
+        from_date = st.sidebar.date_input("From Date", pd.to_datetime("2024-01-01"), key="from_date")
+        to_date = st.sidebar.date_input("To Date", pd.to_datetime("2025-12-31"), key="to_date")
 
-    if from_date > to_date:
-        st.sidebar.error("❌ 'From Date' cannot be greater than 'To Date'. Please adjust the selection.")
-    else:
-        filtered_df = filtered_df[(filtered_df["RecordDate"] >= pd.to_datetime(from_date)) & (filtered_df["RecordDate"] <= pd.to_datetime(to_date))]
+        if from_date > to_date:
+            st.sidebar.error("❌ 'From Date' cannot be greater than 'To Date'. Please adjust the selection.")
+            cascade.between("RecordDate")
+        else:
+            cascade.between("RecordDate", pd.to_datetime(from_date), pd.to_datetime(to_date))
+        filtered_df = cascade.frame()
+        # Figures of this selection are cached under its query rather than a hash of its rows.
+        query = selection_query(cascade_filters(predicate for predicate, _ in cascade.levels))
 
 # Main Page Navigation
 # st.title("Wellness & Activity Tracking Dashboard")
@@ -68,17 +79,24 @@ if page != "Survey Analysis":
 
 # Display the selected page
 if page == "Main Dashboard":
-    total_participants = filtered_df["ParticipantID"].nunique()
-    avg_steps = filtered_df["Steps"].mean()
-    avg_sleep = filtered_df["DurationAsleep"].mean() / 3600  # Convert seconds to hours
-    avg_hr = filtered_df["HeartRateAvg"].mean()
-
-    total_programs = (filtered_df["OrganizationName"] + "_" + filtered_df["ProgramName"]).nunique()
-    total_cohorts = filtered_df["CohortName"].nunique()
-    total_cities = filtered_df["City"].nunique()
-    total_age_groups = filtered_df["AgeGroup"].nunique()
-    avg_weight = filtered_df["WeightKg"].mean()
-    avg_height = filtered_df["HeightCm"].mean()
+    with span("aggregate: key metrics"):
+        # Distinct counts come from merging the per-cell sketches of the cube (falls back to filtered_df when not exact).
+        cube = metrics_cube(load_key("metrics"), df)
+        selection = {column: value for column, value in zip(METRICS_DIMENSIONS, [org_filter, cohort_filter, program_filter, gender_filter, ethnicity_filter, age_group_filter, city_filter]) if value != "All"}
+        restriction = cube.restriction({"WeightKg": weight_range, "HeightCm": height_range}, (from_date, to_date) if from_date <= to_date else None)
+        distinct = cube.totals(selection, restriction, fallback_df=filtered_df)
+
+        total_participants = distinct["participants"]
+        avg_steps = filtered_df["Steps"].mean()
+        avg_sleep = filtered_df["DurationAsleep"].mean() / 3600  # Convert seconds to hours
+        avg_hr = filtered_df["HeartRateAvg"].mean()
+
+        total_programs = distinct["programs"]
+        total_cohorts = distinct["cohorts"]
+        total_cities = distinct["cities"]
+        total_age_groups = filtered_df["AgeGroup"].nunique()
+        avg_weight = filtered_df["WeightKg"].mean()
+        avg_height = filtered_df["HeightCm"].mean()
     
     st.markdown("### Key Metrics")
     col1, col2, col3 = st.columns(3)
@@ -126,9 +144,9 @@ if page == "Main Dashboard":
     
       # Organization-Wise Participant Distribution
     st.subheader("Organization-Wise Participant Distribution")
-    org_participants = filtered_df.groupby("OrganizationName")["ParticipantID"].nunique().reset_index()
-    fig_org_part = px.bar(org_participants, x="OrganizationName", y="ParticipantID", title="Participants per Organization")
-    st.plotly_chart(fig_org_part)
+    with span("aggregate: ParticipantID per OrganizationName"):
+        org_participants = cube.count_by(["OrganizationName"], "participants", selection, restriction, fallback_df=filtered_df, value_name="ParticipantID")
+    chart("bar", org_participants, query, x="OrganizationName", y="ParticipantID", title="Participants per Organization")
 
     # # Cohort & Program  Distribution
     # st.subheader("Cohort & Program Distribution")
@@ -138,33 +156,33 @@ if page == "Main Dashboard":
     
     # City-Wise Participant Distribution
     st.subheader("Cohort-Wise Program Distribution")
-    city_participants = filtered_df.groupby(["OrganizationName","CohortName"])["ProgramName"].nunique().reset_index()
-    fig_city_part = px.bar(city_participants, x="CohortName", y="ProgramName", title="ProgramName per Cohort")
-    st.plotly_chart(fig_city_part)
+    with span("aggregate: ProgramName per CohortName"):
+        city_participants = cube.count_by(["OrganizationName", "CohortName"], "programs", selection, restriction, fallback_df=filtered_df, value_name="ProgramName")
+    chart("bar", city_participants, query, x="CohortName", y="ProgramName", title="ProgramName per Cohort")
 
     # City-Wise Participant Distribution
     st.subheader("City-Wise Participant Distribution")
-    city_participants = filtered_df.groupby(["OrganizationName","City"])["ParticipantID"].nunique().reset_index()
-    fig_city_part = px.bar(city_participants, x="City", y="ParticipantID", title="Participants per City")
-    st.plotly_chart(fig_city_part)
+    with span("aggregate: ParticipantID per City"):
+        city_participants = cube.count_by(["OrganizationName", "City"], "participants", selection, restriction, fallback_df=filtered_df, value_name="ParticipantID")
+    chart("bar", city_participants, query, x="City", y="ParticipantID", title="Participants per City")
     
         # City-Wise Participant Distribution
     st.subheader("Gender-Wise Participant Distribution")
-    city_participants = filtered_df.groupby(["OrganizationName","ParticipantGender"])["ParticipantID"].nunique().reset_index()
-    fig_city_part = px.bar(city_participants, x="ParticipantGender", y="ParticipantID", title="Participants per Gender")
-    st.plotly_chart(fig_city_part)
+    with span("aggregate: ParticipantID per ParticipantGender"):
+        city_participants = cube.count_by(["OrganizationName", "ParticipantGender"], "participants", selection, restriction, fallback_df=filtered_df, value_name="ParticipantID")
+    chart("bar", city_participants, query, x="ParticipantGender", y="ParticipantID", title="Participants per Gender")
     
       # City-Wise Participant Distribution
     st.subheader("AgeGroup-Wise Participant Distribution")
-    city_participants = filtered_df.groupby(["OrganizationName","AgeGroup"])["ParticipantID"].nunique().reset_index()
-    fig_city_part = px.bar(city_participants, x="AgeGroup", y="ParticipantID", title="Participants per AgeGroup")
-    st.plotly_chart(fig_city_part)
+    with span("aggregate: ParticipantID per AgeGroup"):
+        city_participants = cube.count_by(["OrganizationName", "AgeGroup"], "participants", selection, restriction, fallback_df=filtered_df, value_name="ParticipantID")
+    chart("bar", city_participants, query, x="AgeGroup", y="ParticipantID", title="Participants per AgeGroup")
     
        # City-Wise Participant Distribution
     st.subheader("Ethnicity-Wise Participant Distribution")
-    city_participants = filtered_df.groupby(["OrganizationName","Ethnicity"])["ParticipantID"].nunique().reset_index()
-    fig_city_part = px.bar(city_participants, x="Ethnicity", y="ParticipantID", title="Participants per Ethnicity")
-    st.plotly_chart(fig_city_part)
+    with span("aggregate: ParticipantID per Ethnicity"):
+        city_participants = cube.count_by(["OrganizationName", "Ethnicity"], "participants", selection, restriction, fallback_df=filtered_df, value_name="ParticipantID")
+    chart("bar", city_participants, query, x="Ethnicity", y="ParticipantID", title="Participants per Ethnicity")
     
     
 
@@ -211,25 +229,87 @@ if page == "Main Dashboard":
     # fig_hr = px.line(filtered_df, x="RecordDate", y="HeartRateAvg", title="Daily Average Heart Rate Trend")
     # st.plotly_chart(fig_hr)
     
-    # # Anomalies Over Time
-    # st.subheader("Anomalies Over Time")
-    # anomaly_counts = filtered_df.groupby("RecordDate")["AnomalyType"].count().reset_index()
-    # fig_anomalies = px.bar(anomaly_counts, x="RecordDate", y="AnomalyType", title="Anomalies Detected Over Time")
-    # st.plotly_chart(fig_anomalies)
+    # Anomalies Over Time (served from the precomputed anomaly table)
+    st.subheader("Anomalies Over Time")
+    method = st.radio("Baseline", list(METHODS), horizontal=True, key="anomaly_method")
+    with span("anomalies: counts over time"):
+        detector = metrics_anomalies(load_key("metrics"), METHODS[method], df)
+        participants = filtered_df["ParticipantID"].unique()
+        anomaly_counts = detector.counts_over_time(participants, filtered_df["RecordDate"].min(), filtered_df["RecordDate"].max())
+    chart("bar", anomaly_counts, extend_query(query, method), x="RecordDate", y="Anomalies", color="AnomalyType", title="Anomalies Detected Over Time")
+    with st.expander("Recent Anomalies"):
+        recent = detector.query(participants, filtered_df["RecordDate"].min(), filtered_df["RecordDate"].max()).tail(100).iloc[::-1]
+        st.dataframe(recent, hide_index=True)
+
+    # Device Adherence (served from the per-participant day bitsets)
+    st.subheader("Device Adherence")
+    with span("adherence: compliance summary"):
+        adherence = metrics_adherence(load_key("metrics"), df)
+        window = (from_date, to_date) if from_date <= to_date else (None, None)
+        wear = adherence.summary(filtered_df["ParticipantID"].unique(), *window)
+        cohort_compliance = adherence.compliance_by("CohortName", summary=wear)
+    col7, col8, col9 = st.columns(3)
+    with col7:
+        st.metric("Avg Compliant Days (%)", round(wear["Compliance"].mean(), 2))
+    with col8:
+        st.metric(f"Participants ≥ {COMPLIANCE_TARGET:.0%} Compliant", int((wear["Compliance"] >= 100 * COMPLIANCE_TARGET).sum()))
+    with col9:
+        st.metric("Longest Gap (days)", int(wear["LongestGap"].max()) if len(wear) else 0)
+    chart("bar", cohort_compliance, query, x="CohortName", y="Compliance", color="CohortName", title="Average % Compliant Days per Cohort")
+    with st.expander("Least Adherent Participants"):
+        st.dataframe(wear.sort_values(["Compliance", "LongestGap"], ascending=[True, False]).head(20), hide_index=True)
+
+    # Metric Correlations (summed from the per-cell moment cube)
+    st.subheader("Metric Correlations")
+    with span("correlations: moment cube"):
+        moments = metrics_moments(load_key("metrics"), df).query(selection, *window, ranges={"WeightKg": weight_range, "HeightCm": height_range}, fallback_df=filtered_df)
+        correlations = correlation_matrix(moments)
+    chart("heatmap", correlations, query, text_auto=".2f", color_continuous_scale="RdBu_r", zmin=-1, zmax=1, title="Pearson Correlation Between Metrics")
+    col10, col11 = st.columns(2)
+    x_metric = col10.selectbox("X Metric", CORRELATION_METRICS, index=CORRELATION_METRICS.index("RestingHeartRate"), key="regression_x")
+    y_metric = col11.selectbox("Y Metric", CORRELATION_METRICS, index=CORRELATION_METRICS.index("HRV-avgHRV"), key="regression_y")
+    fit = regression_line(moments, x_metric, y_metric)
+    st.caption(f"{y_metric} = {fit['slope']:.4g} × {x_metric} + {fit['intercept']:.4g}  (r = {fit['r']:.3f}, n = {fit['n']})")
+
+    # Data Quality (published by the ingest validation pass; failing rows are quarantined, not shown)
+    st.subheader("Data Quality")
+    quality, quarantine = loader.result("metrics quality"), loader.result("metrics quarantine")
+    col12, col13, col14 = st.columns(3)
+    col12.metric("Rows Loaded", quality["rows"])
+    col13.metric("Clean Rows", quality["clean"])
+    col14.metric("Quarantined Rows", quality["quarantined"])
+    with st.expander("Validation Checks & Null Rates"):
+        st.dataframe(quality["checks"][quality["checks"]["Rows"] > 0], hide_index=True)
+        st.dataframe(quality["null_rates"][quality["null_rates"]["Null Rate"] > 0], hide_index=True)
+    if len(quarantine):
+        with st.expander("Quarantined Rows"):
+            st.dataframe(quarantine.head(1000), hide_index=True)
+
+    # Export of the selected rows plus the dashboard's aggregates (built on click)
+    export_controls("main", filtered_df, {
+        "Participants per Organization": lambda: org_participants,
+        "Anomalies": lambda: detector.query(participants, filtered_df["RecordDate"].min(), filtered_df["RecordDate"].max()),
+        "Device Adherence": lambda: wear,
+        "Metric Correlations": lambda: correlations.reset_index(names="Metric"),
+        "Quarantined Rows": lambda: quarantine,
+    }, file_stem="main_dashboard")
 else:
-    page_mapping = {
-        "Steps Analysis": "modules.step_analysis",
-        "Sleep Analysis": "modules.sleep_analysis",
-        "Heart Rate Analysis": "modules.heart_rate_analysis",
-        "Comparison Analysis": "modules.comparison_analysis",
-        "Survey Analysis": "modules.survey_analysis"
-    }
-    
-    if page in page_mapping:
-        module = __import__(page_mapping[page], fromlist=['show_page'])
-        if page == "Survey Analysis":
-            st.sidebar.info("📌 Survey Analysis uses independent filters.")
-            module.show_page()  # ✅ Do NOT pass filtered_df
-        else:
-            module.show_page(filtered_df)  # ✅ Pass filtered_df only to other pages
+    if page in PAGE_MODULES:
+        with span(f"import {PAGE_MODULES[page]}"):
+            module = __import__(PAGE_MODULES[page], fromlist=['show_page'])
+        with span(f"page: {page}"):
+            if page == "Survey Analysis":
+                st.sidebar.info("📌 Survey Analysis uses independent filters.")
+                module.show_page()  # ✅ Do NOT pass filtered_df
+            else:
+                module.show_page(filtered_df, query)  # ✅ Pass filtered_df only to other pages
+
+# Count this view in the query log, so the most frequent views are prewarmed after the next data load.
+if page in QUERY_PAGES:
+    record_view(page, cascade, st.session_state)
+
+# Import the other pages and build their engines in the background once this rerun has painted.
+start_warmup(df, filtered_df if page != "Survey Analysis" else None)
+
+end_rerun(page=page)
 
@@ -0,0 +1,425 @@
+"""Concurrent-session load test for app.py.
+
+Starts the app under `streamlit run` on a local port and drives N simulated sessions at once
+through scripted click paths (filter changes, page switches, participant drill-downs). Each
+session speaks Streamlit's websocket protocol the way a browser tab does: it sends a rerun
+request carrying its widget states and waits for the script to finish, reading the widgets
+the run rendered to pick its next click. All sessions share the one server process, as they
+do on a deployed node. For each session count the harness reports p50/p95/p99 rerun latency,
+throughput, and the server's CPU use and RSS.
+
+Everything runs offline: the metrics and survey sources are the synthetic Parquet datasets
+used by run_benchmarks, and profile photo URLs are rewritten to a local stand-in server.
+CPU and RSS are read from /proc, so they are only reported on Linux.
+
+Usage (from the repository root):
+    python -m benchmarks.load_test --sessions 1,2,4,8 --scale 10 --output load.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.local_server import serve_directory
+from benchmarks.run_benchmarks import APP_PATH, REPO_ROOT, dataset_dirs, environment_info
+from benchmarks.synthetic_data import PHOTO_BASE_URL, write_photos
+from modules.data_sources import METRICS_SOURCE_ENV, SURVEY_SOURCE_ENV
+from modules.photos import PHOTO_CACHE_DIR_ENV
+from modules.warmup import WARMUP_ENV
+
+PAGE = "Select Analysis"  # the page radio has no key; it is found by its label
+ANY = object()  # pick a random option other than "All"
+WIDGET_TYPES = {"selectbox": "string_value", "radio": "string_value", "multiselect": "string_array_value"}
+PHOTO_COLUMNS = ["ParticipantPhotoURL", "PhysicianPhoto"]
+PERCENTILES = [50, 95, 99]
+SAMPLE_INTERVAL = 0.05  # seconds between server CPU/RSS samples
+SERVER_START_TIMEOUT = 60
+
+# Scripted click paths: (widget key, value) steps, each applied with one rerun. Sessions start on
+# different paths and cycle through them, so concurrent sessions mix pages and filter values.
+CLICK_PATHS = {
+    "dashboard filters": [
+        (PAGE, "Main Dashboard"),
+        ("org_filter", ANY),
+        ("cohort_filter", ANY),
+        ("anomaly_method", "EWMA"),
+        ("org_filter", "All"),
+    ],
+    "steps drill-down": [
+        (PAGE, "Steps Analysis"),
+        ("org_filter_steps", ANY),
+        ("physician_filter_steps", ANY),
+        ("participant_filter_steps", ANY),
+        ("time_interval_steps", "Weekly"),
+    ],
+    "sleep drill-down": [
+        (PAGE, "Sleep Analysis"),
+        ("org_filter_sleep", ANY),
+        ("participant_filter_sleep", ANY),
+        ("time_interval_sleep", "Monthly"),
+    ],
+    "heart rate drill-down": [
+        (PAGE, "Heart Rate Analysis"),
+        ("org_filter_hr", ANY),
+        ("physician_filter_hr", ANY),
+        ("participant_filter_hr", ANY),
+    ],
+    "comparison": [
+        (PAGE, "Comparison Analysis"),
+        ("org_filter_cmp", ANY),
+        ("participant_filter_cmp", ANY),
+    ],
+    "caseload": [
+        (PAGE, "Physician Caseload"),
+        ("physician_filter_caseload", ANY),
+        ("caseload_metric", ANY),
+    ],
+    "survey": [
+        (PAGE, "Survey Analysis"),
+        ("survey_filter", ANY),
+        ("timepoint_filter", ANY),
+        ("org_filter_survey", ANY),
+    ],
+}
+
+
+def _process_tree(pid):
+    """ `pid` and all of its descendants (the startup loader may spawn worker processes). """
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        tree.append(stack.pop())
+        stack.extend(children.get(tree[-1], []))
+    return tree
+
+
+def process_stats(pid):
+    """ (CPU seconds, RSS bytes) of a process tree, or (None, None) without /proc. """
+    ticks, page_size = os.sysconf("SC_CLK_TCK"), os.sysconf("SC_PAGE_SIZE")
+    cpu = rss = 0
+    try:
+        tree = _process_tree(pid)
+    except OSError:
+        return None, None
+    for p in tree:
+        try:
+            with open(f"/proc/{p}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{p}/statm") as f:
+                rss += int(f.read().split()[1]) * page_size
+        except OSError:
+            continue  # exited between the listing and the read
+        cpu += (int(fields[11]) + int(fields[12])) / ticks  # utime + stime
+    return cpu, rss
+
+
+class ServerMonitor:
+    """ Samples the server's RSS on a background thread while the block runs; keeps the peak. """
+
+    def __init__(self, pid, interval=SAMPLE_INTERVAL):
+        self.pid = pid
+        self.interval = interval
+        self.cpu_start, self.rss_start = process_stats(pid)
+        self.rss_peak = self.rss_start
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="server-monitor", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = process_stats(self.pid)[1]
+            if rss is not None:
+                self.rss_peak = max(self.rss_peak, rss)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.cpu_end, rss = process_stats(self.pid)
+        if rss is not None:
+            self.rss_peak = max(self.rss_peak, rss)
+
+    @property
+    def cpu(self):
+        return None if self.cpu_start is None else self.cpu_end - self.cpu_start
+
+
+def wait_idle(pid, quiet=1.0, timeout=300):
+    """ Blocks until the server has used no CPU for `quiet` seconds (e.g. its warm-up finished). """
+    deadline = time.monotonic() + timeout
+    last, since = process_stats(pid)[0], time.monotonic()
+    while last is not None and time.monotonic() < deadline:
+        time.sleep(SAMPLE_INTERVAL * 4)
+        cpu = process_stats(pid)[0]
+        if cpu - last > 0.01:
+            last, since = cpu, time.monotonic()
+        elif time.monotonic() - since >= quiet:
+            return
+
+
+def local_metrics_source(metrics_dir, target_dir, photo_dir, base_url):
+    """ Copy of the metrics dataset whose profile photos point at the local server; writes those photos. """
+    os.makedirs(target_dir, exist_ok=True)
+    # One generated JPEG stands in for every profile photo the dataset references.
+    sample = os.path.join(photo_dir, write_photos(photo_dir, count=1)[0])
+    for name in os.listdir(metrics_dir):
+        df = pd.read_parquet(os.path.join(metrics_dir, name))
+        for column in PHOTO_COLUMNS:
+            df[column] = df[column].str.replace(PHOTO_BASE_URL, base_url, regex=False)
+        df.to_parquet(os.path.join(target_dir, name), index=False)
+        for url in pd.unique(df[PHOTO_COLUMNS].to_numpy().ravel()):
+            photo = os.path.join(photo_dir, url.strip("'").rsplit("/", 1)[1])
+            if not os.path.exists(photo):
+                shutil.copyfile(sample, photo)
+    return target_dir
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(env, port, timeout=SERVER_START_TIMEOUT):
+    """ Launches `streamlit run app.py` on `port` and waits for its health check. """
+    command = [sys.executable, "-m", "streamlit", "run", APP_PATH, "--server.headless", "true", "--server.port", str(port),
+               "--server.address", "127.0.0.1", "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false"]
+    server = subprocess.Popen(command, cwd=REPO_ROOT, env={**os.environ, **env}, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"streamlit exited with {server.returncode}: {server.stderr.read()[-2000:]}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"streamlit did not answer on port {port} within {timeout}s")
+
+
+def _choose(kind, options, value, rng):
+    """ Value to set for a step: `value` itself, or a random non-"All" option for ANY. """
+    if value is not ANY:
+        return value
+    options = [o for o in options if o != "All"]
+    if not options:
+        return None
+    if kind == "multiselect":
+        return rng.sample(options, min(len(options), rng.randint(1, 3)))
+    return rng.choice(options)
+
+
+class Session:
+    """ One simulated browser tab: a websocket session following click paths and timing every rerun. """
+
+    def __init__(self, url, index, paths, think, seed, timeout):
+        self.url = url
+        self.index = index
+        self.paths = paths
+        self.think = think
+        self.timeout = timeout
+        self.rng = random.Random(seed * 1000 + index)
+        self.widgets = {}  # key (or label for keyless widgets) -> (type, id, options) from the last run
+        self.states = {}  # widget id -> WidgetState sent with every rerun, as the browser does
+        self.latencies = []
+        self.skipped = 0
+        self.errors = []
+
+    def _rerun(self, ws):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        message.rerun_script.widget_states.widgets.extend(self.states.values())
+        widgets = {}
+        start = time.perf_counter()
+        ws.send(message.SerializeToString())
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(ws.recv(timeout=self.timeout))
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type in WIDGET_TYPES:
+                    widget = getattr(element, element_type)
+                    key = widget.id.split("-", 2)[-1]
+                    widgets[widget.label if key == "None" else key] = (element_type, widget.id, list(widget.options))
+                elif element_type == "exception":
+                    self.errors.append(element.exception.message)
+            elif kind == "script_finished" and forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                self.latencies.append(time.perf_counter() - start)
+                if forward.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    self.errors.append("script compile error")
+                break
+        self.widgets = widgets
+        live = {widget_id for _, widget_id, _ in widgets.values()}
+        self.states = {widget_id: state for widget_id, state in self.states.items() if widget_id in live}
+
+    def _set(self, key, value):
+        """ Records the new value of a widget; False when the step doesn't apply to the current page. """
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        if key not in self.widgets:
+            return False
+        kind, widget_id, options = self.widgets[key]
+        choice = _choose(kind, options, value, self.rng)
+        if choice is None:
+            return False
+        state = WidgetState(id=widget_id)
+        if WIDGET_TYPES[kind] == "string_array_value":
+            state.string_array_value.data.extend(choice)
+        else:
+            state.string_value = choice
+        self.states[widget_id] = state
+        return True
+
+    def run(self, n_paths):
+        from websockets.sync.client import connect
+
+        names = list(self.paths)
+        try:
+            with connect(self.url, subprotocols=["streamlit"], max_size=None, open_timeout=self.timeout) as ws:
+                self._rerun(ws)
+                for p in range(n_paths):
+                    for key, value in self.paths[names[(self.index + p) % len(names)]]:
+                        if not self._set(key, value):
+                            self.skipped += 1
+                            continue
+                        if self.think:
+                            time.sleep(self.think * self.rng.uniform(0.5, 1.5))
+                        self._rerun(ws)
+        except Exception as e:
+            self.errors.append(repr(e))
+
+
+def run_sessions(url, pid, n_sessions, paths_per_session, think, seed, timeout):
+    """ Runs `n_sessions` concurrent sessions; returns rerun latency percentiles and server CPU/RSS. """
+    sessions = [Session(url, i, CLICK_PATHS, think, seed, timeout) for i in range(n_sessions)]
+    threads = [threading.Thread(target=s.run, args=(paths_per_session,), name=f"session-{s.index}") for s in sessions]
+    wall_start = time.perf_counter()
+    with ServerMonitor(pid) as monitor:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    wall = time.perf_counter() - wall_start
+    latencies = np.array([latency for s in sessions for latency in s.latencies])
+    result = {
+        "sessions": n_sessions,
+        "reruns": len(latencies),
+        "skipped_steps": sum(s.skipped for s in sessions),
+        "errors": [e for s in sessions for e in s.errors],
+        "wall_s": wall,
+        "reruns_per_s": len(latencies) / wall if wall else 0.0,
+        "mean_s": float(latencies.mean()) if len(latencies) else None,
+        "cpu_s": monitor.cpu,
+        "cpu_percent": None if monitor.cpu is None else 100 * monitor.cpu / wall,
+        "rss_start_mb": None if monitor.rss_start is None else monitor.rss_start / 2**20,
+        "rss_peak_mb": None if monitor.rss_peak is None else monitor.rss_peak / 2**20,
+    }
+    for p in PERCENTILES:
+        result[f"p{p}_s"] = float(np.percentile(latencies, p)) if len(latencies) else None
+    return result
+
+
+def print_table(results):
+    def cell(value, spec):
+        return format(value, spec) if value is not None else format("-", spec.split(".")[0].rstrip("f") + "s")
+
+    print(f"\n{'sessions':>8} {'reruns':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'rerun/s':>8} {'cpu %':>7} {'rss MB':>8} {'errors':>7}")
+    for r in results:
+        print(f"{r['sessions']:>8} {r['reruns']:>7} " + " ".join(cell(r[f"p{p}_s"], ">8.3f") for p in PERCENTILES)
+              + f" {r['reruns_per_s']:>8.2f} {cell(r['cpu_percent'], '>7.0f')} {cell(r['rss_peak_mb'], '>8.0f')} {len(r['errors']):>7}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the wellness dashboard with concurrent simulated sessions.")
+    parser.add_argument("--sessions", default="1,2,4,8", help="Comma-separated concurrent session counts.")
+    parser.add_argument("--scale", type=int, default=1, help="Synthetic dataset scale (multiples of the base participant count).")
+    parser.add_argument("--paths", type=int, default=len(CLICK_PATHS), help="Click paths each session walks through.")
+    parser.add_argument("--think", type=float, default=0.0, help="Mean pause between clicks in seconds (0 = back-to-back reruns).")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the random filter picks.")
+    parser.add_argument("--photo-latency", type=float, default=0.02, help="Per-request delay of the local photo server in seconds.")
+    parser.add_argument("--timeout", type=float, default=600, help="Per-rerun timeout in seconds.")
+    parser.add_argument("--port", type=int, default=None, help="Port for the app server (default: a free one).")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "althealth_bench_data"), help="Where synthetic datasets are generated and reused.")
+    parser.add_argument("--no-warmup", action="store_true", help="Disable the app's background warm-up and the untimed priming pass.")
+    parser.add_argument("--output", default=None, help="JSON results file (default: benchmarks/results/load-<timestamp>.json).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    counts = [int(n) for n in args.sessions.split(",") if n]
+    metrics_dir, survey_dir = dataset_dirs(args.data_dir, args.scale)
+    port = args.port or _free_port()
+    url = f"ws://127.0.0.1:{port}/_stcore/stream"
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        photo_dir = os.path.join(tmp, "photos")
+        os.makedirs(photo_dir)
+        with serve_directory(photo_dir, latency=args.photo_latency) as photos:
+            env = {
+                METRICS_SOURCE_ENV: local_metrics_source(metrics_dir, os.path.join(tmp, "metrics"), photo_dir, photos.base_url),
+                SURVEY_SOURCE_ENV: survey_dir,
+                PHOTO_CACHE_DIR_ENV: os.path.join(tmp, "photo_cache"),
+                WARMUP_ENV: "0" if args.no_warmup else "1",
+            }
+            print(f"Starting the app on port {port} ...", flush=True)
+            server = start_server(env, port)
+            try:
+                if not args.no_warmup:
+                    # Untimed priming pass, so the one-off load and engine builds are not charged to the
+                    # first session count; the server then behaves like a node that is already serving.
+                    print("Priming (one session, every path) ...", flush=True)
+                    Session(url, 0, CLICK_PATHS, 0, args.seed, args.timeout).run(len(CLICK_PATHS))
+                    wait_idle(server.pid)
+                for n in counts:
+                    print(f"{n} concurrent session(s) ...", flush=True)
+                    results.append(run_sessions(url, server.pid, n, args.paths, args.think, args.seed, args.timeout))
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+            photo_requests = photos.request_count
+
+    output = args.output or os.path.join(REPO_ROOT, "benchmarks", "results", "load-" + datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "data_dir", "port")}
+    with open(output, "w") as f:
+        json.dump({"environment": environment_info(), "config": config, "cpu_count": os.cpu_count(), "photo_requests": photo_requests, "results": results}, f, indent=2)
+    print_table(results)
+    print(f"\nWrote {output}")
+    errors = [e for r in results for e in r["errors"]]
+    if errors:
+        print(f"{len(errors)} error(s), first: {errors[0]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Local stand-in HTTP server for exercising the network code paths offline.
+
+    with serve_directory("/tmp/data") as server:
+        requests.get(server.url("survey/Survey Responses.parquet"))
+        server.request_count  # number of GETs served so far
+"""
+import functools
+import os
+import threading
+from contextlib import contextmanager
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+
+
+class _CountingHandler(SimpleHTTPRequestHandler):
+    """ Static file handler that counts requests and stays quiet. """
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.request_count += 1
+        delay = self.server.latency
+        if delay:
+            threading.Event().wait(delay)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, directory, latency=0.0):
+        super().__init__(("127.0.0.1", 0), functools.partial(_CountingHandler, directory=directory))
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.latency = latency
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def url(self, relative_path):
+        return f"{self.base_url}/{quote(relative_path.replace(os.sep, '/'))}"
+
+
+@contextmanager
+def serve_directory(directory, latency=0.0):
+    """ Serves `directory` over HTTP on a free localhost port for the duration of the block.
+
+    `latency` adds a fixed per-request delay in seconds to mimic a remote store.
+    """
+    server = LocalServer(directory, latency)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
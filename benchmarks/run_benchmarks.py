@@ -0,0 +1,576 @@
+"""Benchmark harness for app.py and the modules/*.show_page functions.
+
+Generates (or reuses) deterministic synthetic datasets at each requested scale, then
+times the load, filter cascade, aggregation and figure-construction stages of every
+page as pure functions, plus full page reruns under Streamlit's AppTest. Cold module
+import times are recorded under the "Startup" page. Results are written as JSON so two
+runs can be compared for regressions.
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks --scales 1,10,100,1000 --output bench.json
+    python -m benchmarks.run_benchmarks --scales 1,10 --compare bench.json
+"""
+import argparse
+import ast
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import plotly
+import plotly.express as px
+import plotly.io as pio
+import streamlit as st
+from streamlit.logger import set_log_level
+
+from benchmarks.local_server import serve_directory
+from benchmarks.synthetic_data import write_dataset, write_photos, write_workbooks
+from modules import data_sources, warmup
+from modules.sections import LAZY_SECTIONS_ENV
+from modules.sketches import build_metrics_cube, build_survey_cube
+from modules.leaderboard import DAILY_METRICS, Leaderboard
+from modules.anomalies import AnomalyDetector
+from modules.adherence import AdherenceIndex
+from modules.correlations import MomentCube, correlation_matrix
+from modules.export import iter_chunks, write_export
+from modules.sleep_metrics import SleepEngine
+from modules.intraday import IntradayPyramid
+from modules.filters import FilterCascade, FilterIndex
+from modules.forecasts import FIT_DAYS, ForecastModel, _design
+from modules.validation import validate_metrics
+from modules.outcomes import ACTIVITY_METRICS, OutcomeActivityIndex, WINDOW_DAYS
+from modules.caseload import CaseloadTable
+from modules.survey_items import ItemMatrix
+from modules.bootstrap import REPLICATES, bootstrap_totals
+from modules.startup import StartupLoader, startup_data
+from modules.querylog import QUERY_LOG_ENV, QUERY_PAGES, query_log, view_query
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_ROOT, "app.py")
+PAGES = ["Main Dashboard", "Steps Analysis", "Sleep Analysis", "Heart Rate Analysis", "Comparison Analysis", "Physician Caseload", "Survey Analysis"]
+BREAKDOWN_COLUMNS = ["OrganizationName", "AgeGroup", "ParticipantGender", "Ethnicity", "City"]
+SIDEBAR_CASCADE = ["OrganizationName", "CohortName", "ProgramName", "ParticipantGender", "Ethnicity", "AgeGroup", "City"]
+REGRESSION_THRESHOLD = 1.2
+IMPORT_PROFILE = ["streamlit", "pandas", "plotly.express", "modules.figures", "modules.startup", "modules.sketches", "modules.warmup",
+                  "modules.step_analysis", "modules.sleep_analysis", "modules.heart_rate_analysis", "modules.comparison_analysis", "modules.caseload_analysis", "modules.survey_analysis"]
+
+
+def timed(fn, repeat):
+    """ Runs `fn` `repeat` times and returns the per-run wall times in seconds. """
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def dataset_dirs(data_dir, scale):
+    """ Returns (metrics_dir, survey_dir) for `scale`, generating the dataset on first use. """
+    scale_dir = os.path.join(data_dir, f"scale_{scale}")
+    metrics_dir, survey_dir = os.path.join(scale_dir, "metrics"), os.path.join(scale_dir, "survey")
+    if not (os.path.isdir(metrics_dir) and os.path.isdir(survey_dir)):
+        print(f"  generating synthetic dataset at {scale}x ...", flush=True)
+        write_dataset(scale_dir, scale=scale)
+    return metrics_dir, survey_dir
+
+
+def use_sources(metrics_dir, survey_dir):
+    """ Points the app at the synthetic dataset and drops state cached for a previous one. """
+    os.environ[data_sources.METRICS_SOURCE_ENV] = metrics_dir
+    os.environ[data_sources.SURVEY_SOURCE_ENV] = survey_dir
+    sys.modules.pop("modules.survey_analysis", None)
+    st.cache_data.clear()
+    st.cache_resource.clear()
+
+
+def load_metrics(metrics_dir):
+    """ Pure-function equivalent of the startup loader's metrics load (local Parquet, no worker processes). """
+    return data_sources.prepare_metrics(data_sources.read_source(metrics_dir))
+
+
+def filter_cascade(df):
+    """ Mirrors the main sidebar cascade with the most frequent value picked at every level. """
+    for column in SIDEBAR_CASCADE:
+        df = df[df[column] == df[column].value_counts().index[0]]
+    df = df[(df["WeightKg"] >= 10) & (df["WeightKg"] <= 200)]
+    df = df[(df["HeightCm"] >= 70) & (df["HeightCm"] <= 220)]
+    return df[(df["RecordDate"] >= pd.to_datetime("2024-01-01")) & (df["RecordDate"] <= pd.to_datetime("2025-12-31"))]
+
+
+def cascade_selection(df):
+    """ The values filter_cascade() picks: the most frequent value at every level. """
+    selection = {}
+    for column in SIDEBAR_CASCADE:
+        selection[column] = df[column].value_counts().index[0]
+        df = df[df[column] == selection[column]]
+    return selection
+
+
+def cascade_pass(cascade, selection):
+    """ One rerun of the sidebar cascade on a FilterCascade (options included); unselected levels are "All". """
+    cascade.begin()
+    for column in SIDEBAR_CASCADE:
+        cascade.options(column)
+        cascade.equals(column, selection.get(column, "All"))
+    cascade.between("WeightKg", 10, 200)
+    cascade.between("HeightCm", 70, 220)
+    cascade.between("RecordDate", pd.to_datetime("2024-01-01"), pd.to_datetime("2025-12-31"))
+    return cascade.frame()
+
+
+def main_dashboard_aggregates(df):
+    """ Key metrics and distribution tables computed inline by app.py. """
+    return {
+        "participants": df["ParticipantID"].nunique(),
+        "programs": (df["OrganizationName"] + "_" + df["ProgramName"]).nunique(),
+        "cohorts": df["CohortName"].nunique(),
+        "org_participants": df.groupby("OrganizationName")["ParticipantID"].nunique().reset_index(),
+        "cohort_programs": df.groupby(["OrganizationName", "CohortName"])["ProgramName"].nunique().reset_index(),
+        **{column: df.groupby(["OrganizationName", column])["ParticipantID"].nunique().reset_index() for column in ["City", "ParticipantGender", "AgeGroup", "Ethnicity"]},
+    }
+
+
+def main_dashboard_distinct(cube):
+    """ The same distinct counts as main_dashboard_aggregates, merged from the cube's sketches. """
+    restriction = cube.restriction({"WeightKg": (10, 200), "HeightCm": (70, 220)}, ("2024-01-01", "2025-12-31"))
+    out = {"totals": cube.totals({}, restriction), "cohort_programs": cube.count_by(["OrganizationName", "CohortName"], "programs", {}, restriction)}
+    for column in ["OrganizationName", "City", "ParticipantGender", "AgeGroup", "Ethnicity"]:
+        out[column] = cube.count_by(list(dict.fromkeys(["OrganizationName", column])), "participants", {}, restriction)
+    return out
+
+
+def metric_page_aggregates(df, aggregate, metric, scale_factor=1):
+    """ Trend aggregates for every interval plus the breakdowns and top-10 of a metric page. """
+    aggregate = getattr(aggregate, "__wrapped__", aggregate)
+    values = df[metric] / scale_factor
+    out = {interval: aggregate(df, interval) for interval in ["Daily", "Weekly", "Monthly"]}
+    for column in BREAKDOWN_COLUMNS:
+        out[column] = values.groupby(df[column]).mean().reset_index()
+    out["top10"] = values.groupby(df["Participant Name"]).sum().reset_index().nlargest(10, metric)
+    return out
+
+
+def survey_aggregates(responses):
+    """ Submission counts and outcome tables of the survey page. """
+    grouped = responses.drop_duplicates(subset=["ParticipantID", "SurveyName", "SurveyTimepoint"]).groupby(["SurveyName", "SurveyTimepoint", "Outcome Category"]).size().reset_index(name="Submission Count")
+    return {
+        "submissions": responses.groupby(["ParticipantID", "SurveyName", "SurveyTimepoint"]).ngroups,
+        "outcomes": grouped.groupby(["Outcome Category"])["Submission Count"].sum().reset_index(),
+        "progression": responses.groupby(["SurveyName", "SurveyTimepoint", "Outcome Category"]).size().reset_index(name="Submission Count"),
+    }
+
+
+def outcome_activity_merge(df, scores, survey="GAD-7"):
+    """ Ad-hoc equivalent of OutcomeActivityIndex.changes(): merge, window filter, average, pivot. """
+    scores = scores[scores["SurveyName"] == survey]
+    merged = scores.merge(df[["ParticipantID", "RecordDate", *ACTIVITY_METRICS]], on="ParticipantID")
+    submitted = pd.to_datetime(merged["SubmissionDate"])
+    merged = merged[(merged["RecordDate"] < submitted) & (merged["RecordDate"] >= submitted - pd.Timedelta(days=WINDOW_DAYS))]
+    averages = merged.groupby(["ParticipantID", "SurveyTimepoint"])[["Total Score", *ACTIVITY_METRICS]].mean().unstack("SurveyTimepoint")
+    return averages.xs("END", axis=1, level=1) - averages.xs("START", axis=1, level=1)
+
+
+def caseload_groupby_raw(df, scores, physician, windows=(7, 28)):
+    """ Ad-hoc equivalent of one CaseloadTable.view(): filter the physician's history, window averages, latest rows and surveys. """
+    rows = df[df["PhysicianName"] == physician].sort_values("RecordDate")
+    end = df["RecordDate"].max()
+    metrics = ["Steps", "DurationAsleep", "RestingHeartRate"]
+    table = rows.groupby("ParticipantID")[metrics].last().join(rows.groupby("ParticipantID")["RecordDate"].max())
+    for window in windows:
+        recent = rows[rows["RecordDate"] > end - pd.Timedelta(days=window)]
+        table = table.join(recent.groupby("ParticipantID")[metrics].mean(), rsuffix=f" ({window}d)")
+    latest = scores.assign(SubmissionDate=pd.to_datetime(scores["SubmissionDate"])).sort_values("SubmissionDate").groupby("ParticipantID").tail(1)
+    return table.join(latest.set_index("ParticipantID")[["SurveyName", "Total Score", "Outcome Category"]])
+
+
+def item_pivot_raw(responses, survey="GAD-7"):
+    """ Ad-hoc equivalent of ItemMatrix's per-question views: pivot the long rows, then distribution, item-total r and change. """
+    rows = responses[responses["SurveyName"] == survey]
+    distribution = rows.groupby(["QuestionText", "Response"]).size()
+    items = rows.pivot_table(index=["ParticipantID", "SurveyTimepoint"], columns="QuestionText", values="Response").dropna()
+    rest = items.sum(axis=1).to_numpy()[:, None] - items.to_numpy()
+    item_total = [np.corrcoef(items.iloc[:, j], rest[:, j])[0, 1] for j in range(items.shape[1])]
+    start, end = items.xs("START", level=1), items.xs("END", level=1)
+    both = start.index.intersection(end.index)
+    return distribution, item_total, (end.loc[both] - start.loc[both]).mean()
+
+
+def bootstrap_loop_raw(df, column, metric, replicates=REPLICATES, seed=0):
+    """ Per-group, per-replicate loop equivalent of the batched participant bootstrap behind the breakdown error bars. """
+    rng = np.random.default_rng(seed)
+    units = df.groupby([column, "ParticipantID"], observed=True)[metric].agg(["sum", "count"])
+    intervals = {}
+    for group, rows in units.groupby(level=0):
+        sums, counts = rows["sum"].to_numpy(), rows["count"].to_numpy()
+        means = []
+        for _ in range(replicates):
+            picks = rng.integers(0, len(sums), len(sums))
+            means.append(sums[picks].sum() / counts[picks].sum())
+        intervals[group] = np.percentile(means, [2.5, 97.5])
+    return intervals
+
+
+def sleep_rolling_raw(df, window=14):
+    """ Per-participant groupby-rolling equivalent of the sleep engine's duration variability ranking. """
+    hours = df.sort_values("RecordDate").assign(Hours=df["DurationAsleep"] / 3600)
+    rolling = hours.groupby("ParticipantID")["Hours"].rolling(window, min_periods=5).std()
+    return rolling.groupby(level=0).mean().nlargest(10)
+
+
+def intraday_parse_raw(df, participant):
+    """ Per-row literal_eval of one participant's heart-rate samples, as the page used to do for a day. """
+    rows = df.loc[df["ParticipantID"] == participant, "HeartRateSamples"].dropna()
+    frames = [pd.DataFrame(ast.literal_eval(samples), columns=["Timestamp", "HeartRate"]) for samples in rows]
+    return pd.concat(frames, ignore_index=True).assign(Timestamp=lambda frame: pd.to_datetime(frame["Timestamp"], unit="s"))
+
+
+def forecast_loop_raw(df, metric="Steps"):
+    """ Per-participant np.linalg.lstsq equivalent of ForecastModel's fit of one metric. """
+    last = df["RecordDate"].max()
+    recent = df[df["RecordDate"] > last - pd.Timedelta(days=FIT_DAYS)]
+    origin = int(last.to_datetime64().astype("datetime64[D]").astype("int64"))
+    coefficients = {}
+    for participant, rows in recent.groupby("ParticipantID"):
+        daily = rows.groupby("RecordDate")[metric].mean().dropna()
+        design = _design(daily.index.to_numpy().astype("datetime64[D]").astype("int64"), origin)
+        coefficients[participant] = np.linalg.lstsq(design, daily.to_numpy(), rcond=None)[0]
+    return coefficients
+
+
+def build_figures(tables, df, metric):
+    """ Builds and serialises the figures a metric page draws from its aggregate tables. """
+    figures = [px.line(tables["Daily"][0], x=tables["Daily"][1], y=tables["Daily"][0].columns[-1]), px.histogram(df, x=metric, nbins=20)]
+    for column in BREAKDOWN_COLUMNS:
+        figures.append(px.bar(tables[column], x=column, y=tables[column].columns[-1], color=column))
+    figures.append(px.bar(tables["top10"], x="Participant Name", y=tables["top10"].columns[-1], color="Participant Name"))
+    return [pio.to_json(fig, validate=False) for fig in figures]
+
+
+def page_modules():
+    """ Imports the page modules against the currently configured data sources. """
+    from modules import step_analysis, sleep_analysis, heart_rate_analysis, comparison_analysis, caseload_analysis, survey_analysis
+    return {
+        "Steps Analysis": step_analysis,
+        "Sleep Analysis": sleep_analysis,
+        "Heart Rate Analysis": heart_rate_analysis,
+        "Comparison Analysis": comparison_analysis,
+        "Physician Caseload": caseload_analysis,
+        "Survey Analysis": survey_analysis,
+    }
+
+
+def bench_pure(scale, metrics_dir, survey_dir, repeat):
+    """ Times every stage as a plain function call (Streamlit in bare mode, caches cleared). """
+    from modules.heart_rate_analysis import aggregate_heart_rate
+    from modules.sleep_analysis import aggregate_sleep
+    from modules.step_analysis import aggregate_steps
+
+    results = []
+
+    def record(page, stage, fn):
+        runs = timed(fn, repeat)
+        results.append({"scale": scale, "mode": "pure", "page": page, "stage": stage, "median_s": statistics.median(runs), "min_s": min(runs), "runs": runs})
+
+    df = load_metrics(metrics_dir)
+    record("All", "load_metrics", lambda: load_metrics(metrics_dir))
+    raw = data_sources.read_source(metrics_dir)
+    record("All", "validate_metrics", lambda: validate_metrics(raw))
+    record("Survey Analysis", "load_survey", lambda: data_sources.read_source(survey_dir, sheet_name=None))
+    record("All", "filter_cascade", lambda: filter_cascade(df))
+    # Cold pass of the session cascade, then picking the City once everything above it is selected.
+    filters, selection = FilterIndex(df), cascade_selection(df)
+    record("All", "filter_cascade_positions", lambda: cascade_pass(FilterCascade(filters), selection))
+    narrowing = FilterCascade(filters)
+    cascade_pass(narrowing, {column: value for column, value in selection.items() if column != "City"})
+    baseline = narrowing.levels
+
+    def narrow():
+        narrowing.levels = baseline
+        return cascade_pass(narrowing, selection)
+
+    record("All", "filter_cascade_narrow", narrow)
+
+    record("Main Dashboard", "aggregate", lambda: main_dashboard_aggregates(df))
+    record("Main Dashboard", "cube_build", lambda: build_metrics_cube(df))
+    cube = build_metrics_cube(df)
+    record("Main Dashboard", "aggregate_sketch", lambda: main_dashboard_distinct(cube))
+    metric_pages = [("Steps Analysis", aggregate_steps, "Steps", 1), ("Sleep Analysis", aggregate_sleep, "DurationAsleep", 3600), ("Heart Rate Analysis", aggregate_heart_rate, "HeartRateAvg", 1)]
+    for page, aggregate, metric, scale_factor in metric_pages:
+        record(page, "aggregate", lambda: metric_page_aggregates(df, aggregate, metric, scale_factor))
+        tables = metric_page_aggregates(df, aggregate, metric, scale_factor)
+        record(page, "figures", lambda: build_figures(tables, df, metric))
+
+    # Participant bootstrap behind the breakdown error bars (steps by city).
+    def bootstrap_groups():
+        units = df.groupby(["City", "ParticipantID"], observed=True)["Steps"].agg(["sum", "count"]).reset_index()
+        return bootstrap_totals(pd.factorize(units["City"])[0], units["sum"].to_numpy(), units["count"].to_numpy())
+
+    record("Steps Analysis", "bootstrap_groups", bootstrap_groups)
+    record("Steps Analysis", "bootstrap_loop_raw", lambda: bootstrap_loop_raw(df, "City", "Steps"))
+
+    # The warm-up's replay of a query log holding every metric page for the first few organisations.
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ[QUERY_LOG_ENV] = os.path.join(tmp, "queries.json")
+        query_log.clear()
+        for page, suffix in QUERY_PAGES.items():
+            for org in df["OrganizationName"].unique()[:5]:
+                query_log().record(view_query(page, [("equals", "OrganizationName", org)], {f"time_interval_{suffix}": "Weekly"}))
+
+        def prewarm():
+            st.cache_data.clear()
+            return warmup.prewarm_queries(df)
+
+        record("All", "prewarm_top_queries", prewarm)
+        os.environ.pop(QUERY_LOG_ENV)
+        query_log.clear()
+
+    # One daily store per data load, read by every engine below.
+    record("All", "daily_store_build", lambda: Leaderboard(DAILY_METRICS).ingest(df))
+    board = daily = Leaderboard(DAILY_METRICS).ingest(df)
+    participants, start, end = df["ParticipantID"].unique(), df["RecordDate"].min(), df["RecordDate"].max()
+    for page, metric in [("Steps Analysis", "Steps"), ("Sleep Analysis", "DurationAsleep"), ("Heart Rate Analysis", "HRZonePercent")]:
+        record(page, "top10_leaderboard", lambda: board.top(metric, 10, "total", participants, start, end))
+
+    for method in ["robust", "ewma"]:
+        record("Main Dashboard", f"anomalies_build_{method}", lambda: AnomalyDetector(daily, method=method).rescore())
+    detector = AnomalyDetector(daily).rescore()
+    record("Main Dashboard", "anomalies_query", lambda: detector.counts_over_time(participants, start, end))
+    record("Main Dashboard", "adherence_build", lambda: AdherenceIndex(df))
+    adherence = AdherenceIndex(df)
+    record("Main Dashboard", "adherence_query", lambda: adherence.compliance_by("CohortName", participants, start, end))
+    record("Main Dashboard", "moments_build", lambda: MomentCube(df))
+    moments = MomentCube(df)
+    record("Main Dashboard", "correlation_cube", lambda: correlation_matrix(moments.query({}, start, end)))
+    record("Main Dashboard", "correlation_raw", lambda: df[moments.metrics].corr())
+
+    record("Sleep Analysis", "sleep_engine_build", lambda: SleepEngine(df, daily))
+    sleep = SleepEngine(df, daily)
+    record("Sleep Analysis", "sleep_engine_query", lambda: sleep.most_irregular(10, participants, start, end))
+    record("Sleep Analysis", "sleep_rolling_raw", lambda: sleep_rolling_raw(df))
+
+    record("All", "forecast_build", lambda: ForecastModel(daily))
+    forecasts = ForecastModel(daily)
+    record("Steps Analysis", "forecast_band", lambda: forecasts.band("Steps", participants))
+    record("Steps Analysis", "forecast_loop_raw", lambda: forecast_loop_raw(df))
+
+    record("Heart Rate Analysis", "intraday_build", lambda: IntradayPyramid(df))
+    intraday, participant = IntradayPyramid(df), df["ParticipantID"].iloc[0]
+    record("Heart Rate Analysis", "intraday_view", lambda: intraday.view(participant, "Heart Rate", start, end))
+    record("Heart Rate Analysis", "intraday_parse_raw", lambda: intraday_parse_raw(df, participant))
+
+    for fmt in ["csv", "parquet"]:
+        record("All", f"export_{fmt}", lambda: write_export(io.BytesIO(), fmt, iter_chunks(df)))
+
+    sheets = data_sources.read_source(survey_dir, sheet_name=None)
+    responses, scores = sheets["Survey Responses"], sheets["Survey Scores"]
+    record("Survey Analysis", "outcome_join_build", lambda: OutcomeActivityIndex(daily).ingest_metrics(df).ingest_submissions(scores))
+    outcomes = OutcomeActivityIndex(daily).ingest_metrics(df).ingest_submissions(scores)
+    record("Survey Analysis", "outcome_changes_join", lambda: outcomes.changes("GAD-7"))
+    record("Survey Analysis", "outcome_changes_merge", lambda: outcome_activity_merge(df, scores))
+    record("Physician Caseload", "caseload_build", lambda: CaseloadTable(daily).ingest_metrics(df).ingest_submissions(scores))
+    caseload, physician = CaseloadTable(daily).ingest_metrics(df).ingest_submissions(scores), df["PhysicianName"].iloc[0]
+    record("Physician Caseload", "caseload_view", lambda: caseload.view(physician))
+    record("Physician Caseload", "caseload_groupby_raw", lambda: caseload_groupby_raw(df, scores, physician))
+    record("Survey Analysis", "aggregate", lambda: survey_aggregates(responses))
+    record("Survey Analysis", "item_matrix_build", lambda: ItemMatrix(responses))
+    items = ItemMatrix(responses)
+    record("Survey Analysis", "item_views", lambda: (items.distribution("GAD-7"), items.item_total("GAD-7"), items.item_change("GAD-7")))
+    record("Survey Analysis", "item_pivot_raw", lambda: item_pivot_raw(responses))
+    survey = build_survey_cube(responses)
+    record("Survey Analysis", "aggregate_sketch", lambda: survey.totals({"SurveyName": "GAD-7"}))
+
+    # Time every section of every page, not just the first one a lazy page would open.
+    os.environ[LAZY_SECTIONS_ENV] = "0"
+    modules = page_modules()
+    for page, module in modules.items():
+        def render(module=module):
+            st.cache_data.clear()
+            module.show_page() if page == "Survey Analysis" else module.show_page(df)
+        record(page, "show_page", render)
+    os.environ.pop(LAZY_SECTIONS_ENV)
+    return results
+
+
+def bench_photos(repeat, latency=0.02):
+    """ Cold (fetch + thumbnail) versus warm (disk cache) profile photo loads from a local server. """
+    from modules.photos import PhotoCache
+
+    with tempfile.TemporaryDirectory() as tmp:
+        names = write_photos(os.path.join(tmp, "photos"))
+        cold, warm = [], []
+        with serve_directory(os.path.join(tmp, "photos"), latency=latency) as server:
+            urls = [server.url(name) for name in names]
+            for run in range(repeat):
+                cache = PhotoCache(os.path.join(tmp, f"cache_{run}"), max_bytes=16 * 1024 * 1024)
+                cold.extend(timed(lambda: [cache.thumbnail(url, 150) for url in urls], 1))
+                requests_before = server.request_count
+                warm.extend(timed(lambda: [cache.thumbnail(url, 150) for url in urls], 1))
+                if server.request_count != requests_before:
+                    raise RuntimeError("warm photo loads went to the network")
+    return [{"scale": 1, "mode": "pure", "page": "Photos", "stage": stage, "median_s": statistics.median(runs), "min_s": min(runs), "runs": runs}
+            for stage, runs in [("photos_cold", cold), ("photos_warm", warm)]]
+
+
+def bench_startup(repeat, latency=0.05):
+    """ Cold start from a local stand-in server: both workbooks one after the other versus the concurrent loader. """
+    with tempfile.TemporaryDirectory() as tmp:
+        metrics_path, survey_path = write_workbooks(tmp)
+        with serve_directory(tmp, latency=latency) as server:
+            metrics_url, survey_url = server.url(os.path.basename(metrics_path)), server.url(os.path.basename(survey_path))
+
+            def sequential():
+                data_sources.prepare_metrics(pd.read_excel(metrics_url))
+                pd.read_excel(survey_url, sheet_name=None)
+
+            def concurrent():
+                loader = StartupLoader({"metrics": (metrics_url, 0, data_sources.prepare_metrics), "survey": (survey_url, None, None)})
+                loader.result("metrics"), loader.result("survey")
+                if loader.errors:
+                    raise RuntimeError(f"startup loader failed: {loader.errors}")
+
+            runs = {"startup_sequential": timed(sequential, repeat), "startup_concurrent": timed(concurrent, repeat)}
+    return [{"scale": 1, "mode": "pure", "page": "All", "stage": stage, "median_s": statistics.median(r), "min_s": min(r), "runs": r} for stage, r in runs.items()]
+
+
+def bench_imports(repeat):
+    """ Cold import time of the heavy dependencies and every app module, each in a fresh interpreter. """
+    results = []
+    for module in IMPORT_PROFILE:
+        code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+        runs = [float(subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.split()[-1]) for _ in range(repeat)]
+        results.append({"scale": 1, "mode": "pure", "page": "Startup", "stage": f"import {module}", "median_s": statistics.median(runs), "min_s": min(runs), "runs": runs})
+    return results
+
+
+def bench_apptest(scale, repeat, timeout):
+    """ Times full script reruns of app.py for every page under Streamlit's AppTest.
+
+    rerun_cold is a page's first visit with the background warm-up disabled; rerun_first_visit
+    is the same visit after the warm-up started by the first rerun has finished.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    def first_rerun(warmup_enabled):
+        st.cache_data.clear()
+        warmup._warmup.clear()
+        sys.modules.pop("modules.survey_analysis", None)
+        os.environ[warmup.WARMUP_ENV] = "1" if warmup_enabled else "0"
+        at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        at.run()
+        if warmup_enabled:
+            # The instance the rerun started (cached per loaded dataset).
+            warmup.start_warmup(startup_data().result("metrics")).wait()
+        return at
+
+    results = []
+    for page in PAGES:
+        cold, warm, first_visit = [], [], []
+        for _ in range(repeat):
+            at = first_rerun(warmup_enabled=False)
+            start = time.perf_counter()
+            at.radio[0].set_value(page).run()
+            cold.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            at.run()
+            warm.append(time.perf_counter() - start)
+            if at.exception:
+                raise RuntimeError(f"{page} raised under AppTest: {at.exception[0].value}")
+            at = first_rerun(warmup_enabled=True)
+            start = time.perf_counter()
+            at.radio[0].set_value(page).run()
+            first_visit.append(time.perf_counter() - start)
+        os.environ.pop(warmup.WARMUP_ENV)
+        for stage, runs in [("rerun_cold", cold), ("rerun_warm", warm), ("rerun_first_visit", first_visit)]:
+            results.append({"scale": scale, "mode": "apptest", "page": page, "stage": stage, "median_s": statistics.median(runs), "min_s": min(runs), "runs": runs})
+    return results
+
+
+def environment_info():
+    """ Versions and revision recorded alongside the timings. """
+    try:
+        revision = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        revision = ""
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_revision": revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pandas": pd.__version__,
+        "plotly": plotly.__version__,
+        "streamlit": st.__version__,
+    }
+
+
+def compare(results, baseline_path, threshold=REGRESSION_THRESHOLD):
+    """ Prints the median-time ratio against a previous run and returns the regressed entries. """
+    with open(baseline_path) as f:
+        baseline = {(r["scale"], r["mode"], r["page"], r["stage"]): r for r in json.load(f)["results"]}
+    regressions = []
+    print(f"\n{'scale':>6} {'mode':<8} {'page':<22} {'stage':<15} {'before':>10} {'after':>10} {'ratio':>7}")
+    for r in results:
+        before = baseline.get((r["scale"], r["mode"], r["page"], r["stage"]))
+        if before is None:
+            continue
+        ratio = r["median_s"] / before["median_s"] if before["median_s"] else float("inf")
+        flag = " <-- regression" if ratio > threshold else ""
+        print(f"{r['scale']:>6} {r['mode']:<8} {r['page']:<22} {r['stage']:<15} {before['median_s']:>10.4f} {r['median_s']:>10.4f} {ratio:>7.2f}{flag}")
+        if flag:
+            regressions.append(r)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the wellness dashboard against synthetic data.")
+    parser.add_argument("--scales", default="1,10,100,1000", help="Comma-separated dataset scales (multiples of the base participant count).")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage.")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "althealth_bench_data"), help="Where synthetic datasets are generated and reused.")
+    parser.add_argument("--apptest-max-scale", type=int, default=100, help="Largest scale also run under AppTest.")
+    parser.add_argument("--apptest-timeout", type=float, default=600, help="Per-rerun AppTest timeout in seconds.")
+    parser.add_argument("--skip-apptest", action="store_true", help="Only run the pure-function benchmarks.")
+    parser.add_argument("--output", default=None, help="JSON results file (default: benchmarks/results/<timestamp>.json).")
+    parser.add_argument("--compare", default=None, help="Previous results JSON to compare against.")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit non-zero when a stage is slower than the threshold.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    set_log_level("error")
+    scales = [int(s) for s in args.scales.split(",") if s]
+
+    results = bench_imports(args.repeat) + bench_photos(args.repeat) + bench_startup(args.repeat)
+    for scale in scales:
+        print(f"Scale {scale}x", flush=True)
+        metrics_dir, survey_dir = dataset_dirs(args.data_dir, scale)
+        use_sources(metrics_dir, survey_dir)
+        results.extend(bench_pure(scale, metrics_dir, survey_dir, args.repeat))
+        if not args.skip_apptest and scale <= args.apptest_max_scale:
+            results.extend(bench_apptest(scale, args.repeat, args.apptest_timeout))
+
+    output = args.output or os.path.join(REPO_ROOT, "benchmarks", "results", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"environment": environment_info(), "repeat": args.repeat, "results": results}, f, indent=2)
+    print(f"Wrote {len(results)} timings to {output}")
+
+    for r in results:
+        print(f"{r['scale']:>6}x {r['mode']:<8} {r['page']:<22} {r['stage']:<15} {r['median_s']:.4f}s")
+
+    if args.compare:
+        regressions = compare(results, args.compare)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
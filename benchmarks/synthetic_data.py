@@ -0,0 +1,200 @@
+"""Deterministic synthetic metrics and survey data at configurable scale.
+
+Scale 1 matches the shape of the published workbooks (20 participants, 60 days of
+wearable data, three surveys at START/MID/END). Scale N multiplies the participant
+count by N, so the 1000x dataset holds 1.2M metric rows and ~1.7M survey rows.
+"""
+import os
+import numpy as np
+import pandas as pd
+
+BASE_PARTICIPANTS = 20
+BASE_DAYS = 60
+START_DATE = "2024-01-01"
+PHOTO_BASE_URL = "https://althealth.s3.us-east-1.amazonaws.com/photos"
+
+ORGANIZATIONS = ["Northwind Health", "Contoso Care", "Fabrikam Clinics", "Tailspin Wellness"]
+COHORTS = ["Cohort A", "Cohort B", "Cohort C"]
+PROGRAMS = ["Diabetes Prevention", "Cardiac Rehab", "Sleep Health", "Stress Management"]
+CITIES = ["Boston", "Chicago", "Denver", "Seattle", "Austin", "Atlanta"]
+ETHNICITIES = ["Asian", "Black", "Hispanic", "White", "Other"]
+GENDERS = ["Female", "Male"]
+AGE_GROUPS = ["18-29", "30-44", "45-59", "60+"]
+AGE_GROUP_BOUNDS = [(18, 29), (30, 44), (45, 59), (60, 80)]
+PHYSICIANS_PER_ORG = 3
+
+SURVEYS = {
+    "GAD-7": {"items": 7, "max_response": 3, "categories": [(4, "Minimal"), (9, "Mild"), (14, "Moderate"), (21, "Severe")]},
+    "SUS": {"items": 10, "max_response": 4, "categories": [(20, "Poor"), (30, "OK"), (35, "Good"), (40, "Excellent")]},
+    "SF-12": {"items": 12, "max_response": 4, "categories": [(16, "Poor"), (28, "Fair"), (40, "Good"), (48, "Very Good")]},
+}
+TIMEPOINTS = ["START", "MID", "END"]
+
+
+def _participants(scale, rng):
+    """ Builds one row of static attributes per participant. """
+    n = BASE_PARTICIPANTS * scale
+    ids = np.arange(1001, 1001 + n)
+    org_idx = rng.integers(0, len(ORGANIZATIONS), n)
+    physician_idx = org_idx * PHYSICIANS_PER_ORG + rng.integers(0, PHYSICIANS_PER_ORG, n)
+    age_group_idx = rng.integers(0, len(AGE_GROUPS), n)
+    low, high = np.array(AGE_GROUP_BOUNDS).T
+    return pd.DataFrame({
+        "ParticipantID": ids,
+        "Participant Name": [f"Participant {i}" for i in ids],
+        "ParticipantPhotoURL": [f"'{PHOTO_BASE_URL}/participant_{i}.jpg" for i in ids],
+        "ParticipantGender": np.array(GENDERS)[rng.integers(0, len(GENDERS), n)],
+        "Ethnicity": np.array(ETHNICITIES)[rng.integers(0, len(ETHNICITIES), n)],
+        "AgeGroup": np.array(AGE_GROUPS)[age_group_idx],
+        "Age": rng.integers(low[age_group_idx], high[age_group_idx] + 1),
+        "City": np.array(CITIES)[rng.integers(0, len(CITIES), n)],
+        "Country": "USA",
+        "WeightKg": rng.normal(78, 15, n).clip(40, 180).round(1),
+        "HeightCm": rng.normal(170, 10, n).clip(140, 210).round(1),
+        "OrganizationName": np.array(ORGANIZATIONS)[org_idx],
+        "CohortName": np.array(COHORTS)[rng.integers(0, len(COHORTS), n)],
+        "ProgramName": np.array(PROGRAMS)[rng.integers(0, len(PROGRAMS), n)],
+        "PhysicianName": [f"Dr. Physician {i + 1}" for i in physician_idx],
+        "PhysicianPhoto": [f"'{PHOTO_BASE_URL}/physician_{i + 1}.jpg" for i in physician_idx],
+    })
+
+
+def _format_samples(timestamps, values):
+    """ Formats per-row sample matrices the way the workbook stores HeartRateSamples. """
+    return ["[" + ", ".join(f"({t}, {v})" for t, v in zip(ts, vs)) + "]" for ts, vs in zip(timestamps, values)]
+
+
+def _format_hrv(seconds, values):
+    """ Formats per-row HRV matrices the way the workbook stores HRVValues. """
+    return ["{" + ", ".join(f"{s}: {v}" for s, v in zip(seconds, vs)) + "}" for vs in values]
+
+
+def generate_metrics(scale=1, days=BASE_DAYS, samples_per_day=24, seed=42):
+    """ Generates the daily wearable metrics sheet for `scale` x the base participant count. """
+    rng = np.random.default_rng(seed)
+    participants = _participants(scale, rng)
+    n_participants = len(participants)
+    n = n_participants * days
+
+    df = participants.loc[np.repeat(np.arange(n_participants), days)].reset_index(drop=True)
+    record_dates = pd.Timestamp(START_DATE) + pd.to_timedelta(np.tile(np.arange(days), n_participants), unit="D")
+    df["RecordDate"] = record_dates
+
+    baseline_steps = np.repeat(rng.normal(8000, 2500, n_participants).clip(1500, None), days)
+    df["Steps"] = (baseline_steps * rng.lognormal(0, 0.25, n)).astype(int)
+    df["Calories"] = (1600 + df["Steps"] * 0.045 + rng.normal(0, 120, n)).round().astype(int)
+
+    asleep = np.repeat(rng.normal(7 * 3600, 2400, n_participants), days) + rng.normal(0, 2700, n)
+    asleep = asleep.clip(3 * 3600, 11 * 3600).astype(int)
+    stage_split = rng.dirichlet([2, 5, 2], n)
+    df["DurationAsleep"] = asleep
+    df["DeepSleep"] = (asleep * stage_split[:, 0]).astype(int)
+    df["LightSleep"] = (asleep * stage_split[:, 1]).astype(int)
+    df["REMSleep"] = asleep - df["DeepSleep"] - df["LightSleep"]
+    df["AwakeTime"] = rng.integers(300, 3600, n)
+    df["SleepEfficiency"] = (100 * asleep / (asleep + df["AwakeTime"])).round(1)
+
+    resting = np.repeat(rng.normal(64, 7, n_participants), days) + rng.normal(0, 2.5, n)
+    df["RestingHeartRate"] = resting.round().astype(int)
+    df["HeartRateAvg"] = (resting + rng.normal(12, 4, n)).round(1)
+    df["minHR"] = (resting - rng.uniform(3, 10, n)).round().astype(int)
+    df["maxHR"] = (resting + rng.uniform(60, 110, n)).round().astype(int)
+    zones = rng.dirichlet([6, 3, 1], n) * rng.uniform(5, 35, (n, 1))
+    df["HRZones_Fatburn"] = zones[:, 0].round(2)
+    df["HRZones_Cardio"] = zones[:, 1].round(2)
+    df["HRZones_Peak"] = zones[:, 2].round(2)
+    df["HRV-avgHRV"] = (110 - resting + rng.normal(0, 8, n)).clip(10, None).round(1)
+
+    seconds = np.arange(samples_per_day) * (86400 // samples_per_day)
+    day_starts = record_dates.values.astype("datetime64[s]").astype(np.int64)
+    hr_values = (df["HeartRateAvg"].to_numpy()[:, None] + rng.normal(0, 9, (n, samples_per_day))).round().astype(int)
+    df["HeartRateSamples"] = _format_samples(day_starts[:, None] + seconds, hr_values)
+    hrv_values = (df["HRV-avgHRV"].to_numpy()[:, None] + rng.normal(0, 6, (n, samples_per_day))).clip(5, None).round(1)
+    df["HRVValues"] = _format_hrv(seconds, hrv_values)
+    df["RecordDate"] = df["RecordDate"].dt.strftime("%Y-%m-%d")
+    return df
+
+
+def _outcome_category(survey_name, scores):
+    """ Maps total scores onto the survey's outcome bands. """
+    bounds, labels = zip(*SURVEYS[survey_name]["categories"])
+    return np.array(labels)[np.searchsorted(bounds, scores, side="left").clip(0, len(labels) - 1)]
+
+
+def generate_survey(scale=1, seed=42):
+    """ Generates the 'Survey Responses' (one row per item) and 'Survey Scores' sheets. """
+    rng = np.random.default_rng(seed)
+    participants = _participants(scale, rng)
+    n_participants = len(participants)
+    response_frames, score_frames = [], []
+
+    for survey_name, spec in SURVEYS.items():
+        n_items = spec["items"]
+        for t, timepoint in enumerate(TIMEPOINTS):
+            responses = rng.integers(0, spec["max_response"] + 1, (n_participants, n_items))
+            total = responses.sum(axis=1)
+            category = _outcome_category(survey_name, total)
+            submitted = pd.Timestamp(START_DATE) + pd.to_timedelta(t * (BASE_DAYS // 2) + rng.integers(0, 3, n_participants), unit="D")
+
+            scores = participants[["ParticipantID", "Participant Name"]].copy()
+            scores["SurveyName"] = survey_name
+            scores["SurveyTimepoint"] = timepoint
+            scores["SubmissionDate"] = submitted
+            scores["Total Score"] = total
+            scores["Outcome Category"] = category
+            score_frames.append(scores)
+
+            items = participants.loc[np.repeat(np.arange(n_participants), n_items)].reset_index(drop=True)
+            items["SurveyName"] = survey_name
+            items["SurveyTimepoint"] = timepoint
+            items["SubmissionDate"] = np.repeat(submitted, n_items)
+            items["QuestionNumber"] = np.tile(np.arange(1, n_items + 1), n_participants)
+            items["QuestionText"] = [f"{survey_name} Q{q}" for q in items["QuestionNumber"]]
+            items["Response"] = responses.ravel()
+            items["Total Score"] = np.repeat(total, n_items)
+            items["Outcome Category"] = np.repeat(category, n_items)
+            response_frames.append(items)
+
+    return pd.concat(response_frames, ignore_index=True), pd.concat(score_frames, ignore_index=True)
+
+
+def write_photos(directory, count=20, size=600, seed=42):
+    """ Writes `count` full-size JPEG stand-ins for profile photos; returns their file names. """
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    names = []
+    for i in range(count):
+        pixels = rng.integers(0, 256, (size // 8, size // 8, 3), dtype=np.uint8)
+        name = f"participant_{1001 + i}.jpg"
+        Image.fromarray(pixels).resize((size, size)).save(os.path.join(directory, name), quality=90)
+        names.append(name)
+    return names
+
+
+def write_dataset(directory, scale=1, seed=42, samples_per_day=24):
+    """ Writes metrics and survey stand-ins as Parquet sheet directories; returns (metrics_dir, survey_dir). """
+    metrics_dir = os.path.join(directory, "metrics")
+    survey_dir = os.path.join(directory, "survey")
+    os.makedirs(metrics_dir, exist_ok=True)
+    os.makedirs(survey_dir, exist_ok=True)
+
+    generate_metrics(scale, samples_per_day=samples_per_day, seed=seed).to_parquet(os.path.join(metrics_dir, "Metrics.parquet"), index=False)
+    responses, scores = generate_survey(scale, seed=seed)
+    responses.to_parquet(os.path.join(survey_dir, "Survey Responses.parquet"), index=False)
+    scores.to_parquet(os.path.join(survey_dir, "Survey Scores.parquet"), index=False)
+    return metrics_dir, survey_dir
+
+
+def write_workbooks(directory, scale=1, seed=42, samples_per_day=24):
+    """ Writes metrics and survey stand-ins as .xlsx workbooks shaped like the S3 files; returns (metrics_path, survey_path). """
+    os.makedirs(directory, exist_ok=True)
+    metrics_path = os.path.join(directory, "metrics.xlsx")
+    survey_path = os.path.join(directory, "survey.xlsx")
+    generate_metrics(scale, samples_per_day=samples_per_day, seed=seed).to_excel(metrics_path, sheet_name="Metrics", index=False)
+    responses, scores = generate_survey(scale, seed=seed)
+    with pd.ExcelWriter(survey_path) as writer:
+        responses.to_excel(writer, sheet_name="Survey Responses", index=False)
+        scores.to_excel(writer, sheet_name="Survey Scores", index=False)
+    return metrics_path, survey_path
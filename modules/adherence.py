@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# A participant wore their device on a day when that day has a record with any wear metric
+# present. Each participant's wear days are packed into one bitset row (bit d = day d after the
+# first recorded day, 64 per word), built once at load. For any date window, worn days are a
+# popcount of the row under a window mask, and the longest streak / gap come from repeatedly
+# and-ing the row (or its complement) with itself shifted by one day until it empties.
+WEAR_METRICS = ["Steps", "DurationAsleep", "HeartRateAvg"]
+GROUP_COLUMNS = ["OrganizationName", "CohortName", "ProgramName"]
+COMPLIANCE_TARGET = 0.8  # share of window days worn for a participant to count as compliant
+
+
+def _shifted(words):
+    """ Rows of little-endian multi-word bitsets shifted up by one bit (day d -> d + 1). """
+    carry = np.zeros_like(words)
+    carry[:, 1:] = words[:, :-1] >> np.uint64(63)
+    return (words << np.uint64(1)) | carry
+
+
+def longest_runs(words):
+    """ Length of the longest run of set bits in each row. """
+    runs = np.zeros(len(words), dtype=np.int64)
+    active = np.flatnonzero(words.any(axis=1))
+    current = words[active]
+    while len(active):
+        runs[active] += 1
+        current = current & _shifted(current)
+        alive = current.any(axis=1)
+        active, current = active[alive], current[alive]
+    return runs
+
+
+class AdherenceIndex:
+    """ Per-participant day-presence bitsets with window queries for compliance, streaks and gaps. """
+
+    def __init__(self, df, metrics=WEAR_METRICS, group_columns=GROUP_COLUMNS):
+        df = df[df["RecordDate"].notna()]
+        worn = df[metrics].notna().any(axis=1).to_numpy()
+        codes, self.participant_ids = pd.factorize(df["ParticipantID"], sort=True)
+        first_rows = np.unique(codes, return_index=True)[1]
+        self.participants = df.iloc[first_rows][["ParticipantID", "Participant Name", *group_columns]].reset_index(drop=True)
+
+        days = df["RecordDate"].to_numpy().astype("datetime64[D]")
+        self.first_day = days.min() if len(days) else np.datetime64("1970-01-01", "D")
+        self.n_days = int((days.max() - self.first_day).astype(np.int64)) + 1 if len(days) else 0
+        day = (days - self.first_day).astype(np.int64)
+        present = np.zeros((len(self.participant_ids), ((self.n_days + 63) // 64) * 64), dtype=bool)
+        present[codes[worn], day[worn]] = True
+        self.bits = np.packbits(present, axis=1, bitorder="little").view(np.uint64)
+
+    def _window(self, start, end):
+        """ [first, last) day bits covered by the inclusive date window, clipped to the recorded days. """
+        first = 0 if start is None else int((np.datetime64(pd.Timestamp(start), "D") - self.first_day).astype(np.int64))
+        last = self.n_days if end is None else int((np.datetime64(pd.Timestamp(end), "D") - self.first_day).astype(np.int64)) + 1
+        return min(max(first, 0), self.n_days), min(max(last, 0), self.n_days)
+
+    def _mask(self, first, last):
+        """ One bitset row with the window's day bits set. """
+        window = np.zeros(self.bits.shape[1] * 64, dtype=bool)
+        window[first:last] = True
+        return np.packbits(window, bitorder="little").view(np.uint64)
+
+    def summary(self, participants=None, start=None, end=None):
+        """ One row per participant (IDs; default all): days worn, compliance and longest streak/gap in the window. """
+        rows = np.arange(len(self.participant_ids)) if participants is None else self.participant_ids.get_indexer(participants)
+        rows = np.sort(rows[rows >= 0])
+        first, last = self._window(start, end)
+        mask = self._mask(first, last)
+        worn = self.bits[rows] & mask
+        days_worn = np.bitwise_count(worn).sum(axis=1).astype(np.int64)
+        window_days = last - first
+        result = self.participants.iloc[rows].reset_index(drop=True)
+        result["DaysWorn"] = days_worn
+        result["WindowDays"] = window_days
+        result["Compliance"] = 100 * days_worn / window_days if window_days else np.nan
+        result["LongestStreak"] = longest_runs(worn)
+        result["LongestGap"] = longest_runs(~worn & mask)
+        return result
+
+    def compliance_by(self, column, participants=None, start=None, end=None, summary=None):
+        """ Average compliance and share of compliant participants per value of `column`. """
+        summary = self.summary(participants, start, end) if summary is None else summary
+        compliant = summary["Compliance"] >= 100 * COMPLIANCE_TARGET
+        grouped = summary.assign(Compliant=100 * compliant).groupby(column)
+        return grouped.agg(Participants=("ParticipantID", "size"), Compliance=("Compliance", "mean"), CompliantShare=("Compliant", "mean"), LongestGap=("LongestGap", "median")).reset_index()
+
+
+@st.cache_resource(show_spinner=False)
+def metrics_adherence(load, _df):
+    """ Adherence index over the metrics frame of `load` (see startup.load_key), shared by all sessions. """
+    return AdherenceIndex(_df)
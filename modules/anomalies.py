@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from modules.leaderboard import metrics_daily
+
+# Every participant's daily value is compared with their own baseline over the preceding days:
+# a rolling median with an IQR-based robust z-score, or an exponentially weighted mean/variance
+# (EWMA). Both run over the whole day x participant matrix of the shared daily store (see
+# modules/leaderboard.py), which every method reads, and rescore() only recomputes the days from
+# the earliest one new rows touched. Flagged values land in a date-sorted anomaly table.
+ANOMALY_METRICS = ["Steps", "DurationAsleep", "HeartRateAvg", "RestingHeartRate", "HRV-avgHRV"]
+METHODS = {"Rolling median (robust z)": "robust", "EWMA": "ewma"}
+THRESHOLDS = {"robust": 3.5, "ewma": 3.0}
+BASELINE_DAYS = 28
+MIN_BASELINE_DAYS = 7
+EWMA_SPAN = 14
+IQR_TO_SIGMA = 1.349
+CHUNK_ELEMENTS = 8_000_000  # bound on the sliding-window copy sorted at once
+TABLE_COLUMNS = ["RecordDate", "ParticipantID", "Participant Name", "Metric", "Value", "Baseline", "ZScore", "AnomalyType"]
+
+
+def _sorted_quantile(ordered, valid, q):
+    """ Linear-interpolated quantile of rows sorted along the last axis with NaNs at the end. """
+    position = (np.maximum(valid, 1) - 1) * q
+    low = np.floor(position).astype(np.intp)
+    high = np.minimum(low + 1, np.maximum(valid - 1, 0))
+    low_value = np.take_along_axis(ordered, low[..., None], axis=-1)[..., 0]
+    high_value = np.take_along_axis(ordered, high[..., None], axis=-1)[..., 0]
+    return low_value + (high_value - low_value) * (position - low)
+
+
+class AnomalyDetector:
+    """ Per-participant anomaly detection on daily metrics against rolling personal baselines. """
+
+    def __init__(self, daily, metrics=ANOMALY_METRICS, method="robust", window=BASELINE_DAYS, min_periods=MIN_BASELINE_DAYS, threshold=None):
+        self.daily = daily  # a Leaderboard over (at least) `metrics`, shared with the other engines
+        self.metrics = list(metrics)
+        self.method = method
+        self.window = window
+        self.min_periods = min_periods
+        self.threshold = threshold or THRESHOLDS[method]
+        self.table = pd.DataFrame({"RecordDate": pd.to_datetime([]), **{column: [] for column in TABLE_COLUMNS[1:]}})
+
+    def rescore(self, since=None):
+        """ Rescores every day from `since` (a date; default the first) onwards; call it after adding rows dated `since` or later to the store. """
+        if self.daily.first_day is None:
+            return self
+        first_day = 0 if since is None else max(int((pd.Timestamp(since).to_datetime64().astype("datetime64[D]") - self.daily.first_day).astype(np.int64)), 0)
+        first_date = pd.Timestamp(self.daily.first_day + np.timedelta64(first_day, "D"))
+        kept = self.table[self.table["RecordDate"] < first_date]
+        detected = self._detect(first_day)
+        self.table = detected if kept.empty else pd.concat([kept, detected], ignore_index=True)
+        return self
+
+    def _robust_scores(self, values, first_day):
+        """ (baseline, z) for days >= first_day: median and IQR of the previous `window` days. """
+        padded = np.vstack([np.full((self.window, values.shape[1]), np.nan), values])
+        windows = np.lib.stride_tricks.sliding_window_view(padded, self.window, axis=0)[first_day:len(values)]
+        baseline = np.full(windows.shape[:2], np.nan)
+        z = np.full(windows.shape[:2], np.nan)
+        step = max(1, CHUNK_ELEMENTS // max(1, windows.shape[1] * self.window))
+        for start in range(0, len(windows), step):
+            ordered = np.sort(windows[start:start + step], axis=-1)
+            valid = np.count_nonzero(~np.isnan(ordered), axis=-1)
+            median = _sorted_quantile(ordered, valid, 0.5)
+            scale = (_sorted_quantile(ordered, valid, 0.75) - _sorted_quantile(ordered, valid, 0.25)) / IQR_TO_SIGMA
+            enough = (valid >= self.min_periods) & (scale > 0)
+            current = values[first_day + start:first_day + start + len(ordered)]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                baseline[start:start + step] = np.where(enough, median, np.nan)
+                z[start:start + step] = np.where(enough, (current - median) / scale, np.nan)
+        return baseline, z
+
+    def _ewma_scores(self, values, first_day):
+        """ (baseline, z) for days >= first_day from an EWMA mean/variance of the previous days. """
+        alpha = 2 / (EWMA_SPAN + 1)
+        mean = np.full(values.shape[1], np.nan)
+        var = np.zeros(values.shape[1])
+        seen = np.zeros(values.shape[1], dtype=np.int64)
+        baseline = np.full((len(values) - first_day, values.shape[1]), np.nan)
+        z = np.full_like(baseline, np.nan)
+        for day, current in enumerate(values):
+            if day >= first_day:
+                enough = (seen >= self.min_periods) & (var > 0)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    baseline[day - first_day] = np.where(enough, mean, np.nan)
+                    z[day - first_day] = np.where(enough, (current - mean) / np.sqrt(var), np.nan)
+            observed = ~np.isnan(current)
+            first = observed & (seen == 0)
+            mean[first] = current[first]
+            update = observed & ~first
+            diff = current[update] - mean[update]
+            mean[update] += alpha * diff
+            var[update] = (1 - alpha) * (var[update] + alpha * diff * diff)
+            seen += observed
+        return baseline, z
+
+    def _detect(self, first_day):
+        """ Anomaly rows for days >= first_day, sorted by date. """
+        frames = []
+        for metric in self.metrics:
+            values = self.daily.daily_values(metric)
+            score = self._robust_scores if self.method == "robust" else self._ewma_scores
+            baseline, z = score(values, first_day)
+            day, participant = np.nonzero(np.abs(np.nan_to_num(z)) > self.threshold)
+            z_flagged = z[day, participant]
+            frames.append(pd.DataFrame({
+                "RecordDate": pd.to_datetime(self.daily.first_day + (first_day + day).astype("timedelta64[D]")),
+                "ParticipantID": self.daily.participant_ids.to_numpy()[participant],
+                "Participant Name": self.daily.names[participant].astype(str),
+                "Metric": metric,
+                "Value": values[first_day + day, participant],
+                "Baseline": baseline[day, participant],
+                "ZScore": z_flagged,
+                "AnomalyType": np.where(z_flagged > 0, f"{metric} Spike", f"{metric} Drop"),
+            }))
+        return pd.concat(frames, ignore_index=True).sort_values("RecordDate", kind="stable", ignore_index=True)
+
+    def query(self, participants=None, start=None, end=None, metrics=None):
+        """ Anomalies in the inclusive date window for the given participant IDs and metrics. """
+        dates = self.table["RecordDate"].to_numpy()
+        low = 0 if start is None else np.searchsorted(dates, pd.Timestamp(start).to_datetime64(), side="left")
+        high = len(dates) if end is None else np.searchsorted(dates, pd.Timestamp(end).to_datetime64(), side="right")
+        result = self.table.iloc[low:high]
+        if participants is not None:
+            result = result[result["ParticipantID"].isin(participants)]
+        if metrics is not None:
+            result = result[result["Metric"].isin(metrics)]
+        return result
+
+    def counts_over_time(self, participants=None, start=None, end=None, metrics=None):
+        """ Number of anomalies per day and type, for the 'Anomalies Over Time' chart. """
+        return self.query(participants, start, end, metrics).groupby(["RecordDate", "AnomalyType"]).size().reset_index(name="Anomalies")
+
+
+@st.cache_resource(show_spinner=False)
+def metrics_anomalies(load, method, _df):
+    """ Anomaly detector over the shared daily store of the metrics frame of `load`, shared by all sessions. """
+    return AnomalyDetector(metrics_daily(load, _df), method=method).rescore()
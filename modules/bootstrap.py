@@ -0,0 +1,114 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from modules.figures import data_signature, query_signature
+
+# Group comparisons get confidence intervals and difference tests from a batched bootstrap. The
+# selection is first reduced to resampling units (one (sum, count) pair per group and participant,
+# or per group and participant-day), so a group's mean is sum / count exactly as the bars show it.
+# Every replicate of every group is then drawn in one numpy pass: each unit slot draws a random unit
+# of its own group, and np.add.reduceat totals the slots per group for all replicates at once. A
+# chunk holds replicates x units slots, so replicates are split into chunks of at most
+# CHUNK_ELEMENTS slots (at least one replicate each), with their own spawned random streams (so
+# results do not depend on the core count), and large selections run the chunks on a thread pool.
+# Results are cached per view: the page's query (see modules/figures.py) with the grouping, so a
+# rerun of the same view neither rebuilds nor hashes the units.
+REPLICATES = 1000
+CONFIDENCE = 0.95
+SEED = 20240101
+CHUNK_ELEMENTS = 2_000_000  # unit slots x replicates drawn per chunk (~16 MB per float64 array)
+PARALLEL_WORK = 2_000_000  # unit slots x replicates above which chunks run in parallel
+MIN_UNITS = 2  # groups with fewer units get no interval or test
+
+
+def _available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def bootstrap_totals(groups, sums, counts, replicates=REPLICATES, seed=SEED):
+    """ (sums, counts) replicates x group matrices of units resampled with replacement within each group (codes 0..G-1). """
+    order = np.argsort(groups, kind="stable")
+    groups, sums, counts = groups[order], np.asarray(sums, dtype=np.float64)[order], np.asarray(counts, dtype=np.float64)[order]
+    sizes = np.bincount(groups)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    slot_start, slot_size = starts[groups], sizes[groups]
+
+    def chunk(rng, n):
+        picks = slot_start + (rng.random((n, len(groups))) * slot_size).astype(np.int64)
+        return np.add.reduceat(sums[picks], starts, axis=1), np.add.reduceat(counts[picks], starts, axis=1)
+
+    chunk_replicates = max(1, CHUNK_ELEMENTS // len(groups))
+    n_chunks = -(-replicates // chunk_replicates)
+    jobs = [(rng, min(chunk_replicates, replicates - i * chunk_replicates)) for i, rng in enumerate(np.random.default_rng(seed).spawn(n_chunks))]
+    workers = _available_cpus() if len(groups) * replicates > PARALLEL_WORK else 1
+    if workers > 1 and n_chunks > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, n_chunks), thread_name_prefix="althealth-bootstrap") as pool:
+            results = list(pool.map(lambda job: chunk(*job), jobs))
+    else:
+        results = [chunk(*job) for job in jobs]
+    return np.vstack([s for s, _ in results]), np.vstack([c for _, c in results])
+
+
+def _unit_totals(df, columns, metric, unit):
+    """ One row per resampling unit: the group columns plus the unit's metric sum and count. """
+    units = df.groupby([*columns, *unit], observed=True)[metric].agg(["sum", "count"]).reset_index()
+    return units[units["count"] > 0].reset_index(drop=True)
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _group_intervals(signature, columns, metric, scale, unit, unit_name, replicates, confidence, _df):
+    units = _unit_totals(_df, columns, metric, unit)
+    if units.empty:
+        return pd.DataFrame(columns=[*columns, metric, "Lower", "Upper", "Error+", "Error-", unit_name, "p vs Rest"])
+    codes, labels = pd.factorize(pd.MultiIndex.from_frame(units[columns]), sort=True)
+    result = labels.to_frame(index=False, name=columns)
+    sums, counts = units["sum"].to_numpy(dtype=np.float64), units["count"].to_numpy(dtype=np.float64)
+    boot_sums, boot_counts = bootstrap_totals(codes, sums, counts, replicates)
+    # "Rest" is the other groups that share every column but the last (the whole selection for one column).
+    outer = pd.factorize(pd.MultiIndex.from_frame(result[columns[:-1]]))[0] if len(columns) > 1 else np.zeros(len(result), dtype=np.int64)
+    membership = np.eye(outer.max() + 1)[outer]  # group x outer group
+    outer_sums, outer_counts = (boot_sums @ membership)[:, outer], (boot_counts @ membership)[:, outer]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = boot_sums / boot_counts
+        rest = (outer_sums - boot_sums) / (outer_counts - boot_counts)
+    point = np.bincount(codes, weights=sums) / np.bincount(codes, weights=counts)
+    alpha = (1 - confidence) / 2
+    n_units = np.bincount(codes)
+    lower, upper = np.where(n_units >= MIN_UNITS, np.percentile(means, [100 * alpha, 100 * (1 - alpha)], axis=0), np.nan)
+    difference = means - rest
+    p = np.minimum(1, 2 * np.minimum((difference <= 0).mean(axis=0), (difference >= 0).mean(axis=0)))
+    p[(n_units < MIN_UNITS) | np.isnan(rest).any(axis=0)] = np.nan
+    result[metric] = point / scale
+    result["Lower"], result["Upper"] = lower / scale, upper / scale
+    result["Error+"], result["Error-"] = (upper - point) / scale, (point - lower) / scale
+    result[unit_name] = n_units
+    result["p vs Rest"] = p
+    return result
+
+
+def group_intervals(df, columns, metric, query=None, scale=1, unit="ParticipantID", unit_name="Participants", replicates=REPLICATES, confidence=CONFIDENCE):
+    """ Mean of `metric` per group of `columns` with bootstrap CI (Lower/Upper, Error+/Error- for error bars) and p vs Rest.
+
+    Units (participants by default; a list of columns such as participant and day gives finer
+    units) are resampled within each group. Rest is the rest of the selection for one column, and
+    the sibling groups (e.g. the other period of the same participant) when `columns` has several.
+    `query` is the figure-cache query of `df`; without one the content of `df` is hashed instead.
+    """
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    unit = [unit] if isinstance(unit, str) else list(unit)
+    signature = query_signature(*query) if query is not None else data_signature(df, [*columns, *unit, metric])
+    return _group_intervals(signature, columns, metric, scale, unit, unit_name, replicates, confidence, df)
+
+
+def interval_caption(intervals, column, unit_name="Participants", alpha=1 - CONFIDENCE):
+    """ One-line legend for error bars drawn from group_intervals(), naming the groups that differ from the rest. """
+    differing = intervals.loc[intervals["p vs Rest"] < alpha, column].astype(str).tolist()
+    found = f" Differs from the rest of the selection (p < {alpha:g}): {', '.join(differing)}." if differing else f" No group differs from the rest of the selection at p < {alpha:g}."
+    return f"Error bars: {CONFIDENCE:.0%} bootstrap CI ({REPLICATES} resamples of {unit_name.lower()}; none for groups with fewer than {MIN_UNITS}).{found}"
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from modules.leaderboard import metrics_daily
+from modules.startup import load_key, startup_data
+
+# Physicians work through their caseload, so each physician's view is materialised: one row per
+# assigned participant with the latest value and the trailing 7/28-day averages of the caseload
+# metrics (as of the last recorded day), the most recent survey outcome and how fresh the data is.
+# Window averages are read from the shared daily store (see modules/leaderboard.py); rows added to
+# it update the per-participant last-day arrays in time proportional to the new rows; the table is
+# then rebuilt from prefix sums in one pass over the participants, never over the history. Rows are
+# kept sorted by physician with a slice per physician, so opening a caseload is a dictionary lookup
+# and a slice.
+CASELOAD_METRICS = {"Steps": ("Steps", 1), "Sleep (hours)": ("DurationAsleep", 3600), "Resting HR": ("RestingHeartRate", 1)}
+CASELOAD_WINDOWS = [7, 28]
+PARTICIPANT_COLUMNS = ["Participant Name", "PhysicianName", "PhysicianPhoto", "OrganizationName", "CohortName", "ProgramName"]
+SURVEY_COLUMNS = {"SurveyName": "Latest Survey", "SurveyTimepoint": "Timepoint", "SubmissionDate": "Survey Date", "Total Score": "Total Score", "Outcome Category": "Outcome Category"}
+STALE_DAYS = 3  # days without a record before a participant is flagged
+
+
+def _epoch_days(dates):
+    return dates.to_numpy().astype("datetime64[D]").astype(np.int64)
+
+
+def _grown(array, size):
+    """ `array` padded with -1 (no day yet) to at least `size` entries. """
+    return array if len(array) >= size else np.concatenate([array, np.full(size - len(array), -1, dtype=np.int64)])
+
+
+class CaseloadTable:
+    """ Per-physician caseload rows, refreshed by ingest_metrics() / ingest_submissions(). """
+
+    def __init__(self, daily, metrics=CASELOAD_METRICS, windows=CASELOAD_WINDOWS):
+        self.daily = daily  # a Leaderboard over (at least) the metrics' columns, shared with the other engines
+        self.metrics = dict(metrics)
+        self.windows = list(windows)
+        self.last_day = {column: np.empty(0, dtype=np.int64) for column, _ in self.metrics.values()}
+        self.last_record = np.empty(0, dtype=np.int64)
+        self.participants = pd.DataFrame(columns=PARTICIPANT_COLUMNS, index=pd.Index([], name="ParticipantID"))
+        self.surveys = pd.DataFrame(columns=list(SURVEY_COLUMNS.values()), index=pd.Index([], name="ParticipantID"))
+        self.table = pd.DataFrame()
+        self._slices = {}
+
+    def ingest_metrics(self, df):
+        """ Takes in wearable rows already added to the daily store (attributes follow each participant's latest row) and refreshes the table. """
+        df = df[df["RecordDate"].notna()]
+        if df.empty:
+            return self
+        n = self.daily.n_participants
+        codes = self.daily.participant_ids.get_indexer(df["ParticipantID"])
+        days = _epoch_days(df["RecordDate"])
+        self.last_record = _grown(self.last_record, n)
+        np.maximum.at(self.last_record, codes, days)
+        for column in self.last_day:
+            valid = df[column].notna().to_numpy()
+            self.last_day[column] = _grown(self.last_day[column], n)
+            np.maximum.at(self.last_day[column], codes[valid], days[valid])
+        latest = df.sort_values("RecordDate", kind="stable").drop_duplicates("ParticipantID", keep="last").set_index("ParticipantID")[PARTICIPANT_COLUMNS]
+        self.participants = pd.concat([self.participants[~self.participants.index.isin(latest.index)], latest])
+        return self._refresh()
+
+    def ingest_submissions(self, scores):
+        """ Keeps each participant's most recent survey submission and refreshes the table. """
+        rows = scores[[*SURVEY_COLUMNS, "ParticipantID"]].assign(SubmissionDate=pd.to_datetime(scores["SubmissionDate"], errors="coerce"))
+        rows = rows.rename(columns=SURVEY_COLUMNS).set_index("ParticipantID")
+        combined = pd.concat([self.surveys, rows]) if len(self.surveys) else rows
+        self.surveys = combined.sort_values("Survey Date", na_position="first", kind="stable").groupby(level=0).tail(1)
+        return self._refresh()
+
+    def _refresh(self):
+        """ Rebuilds the caseload rows from the prefix sums and last-day arrays (one pass over participants). """
+        n = self.daily.n_participants
+        if n == 0:
+            return self
+        codes = np.arange(n)
+        first_day = int(self.daily.first_day.astype(np.int64))
+        end = self.daily.n_days
+        rows = self.participants.reindex(self.daily.participant_ids).rename_axis("ParticipantID").reset_index()
+        for label, (column, scale) in self.metrics.items():
+            day = self.last_day[column][:n] - first_day
+            seen = day >= 0
+            latest = np.full(n, np.nan)
+            counts = self.daily.counts[column][day[seen], codes[seen]]
+            latest[seen] = self.daily.sums[column][day[seen], codes[seen]] / counts
+            rows[f"{label} (latest)"] = latest / scale
+            for window in self.windows:
+                total, count = self.daily.window_totals(column, codes, np.full(n, max(end - window, 0)), np.full(n, end))
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    rows[f"{label} ({window}d)"] = np.where(count > 0, total / count, np.nan) / scale
+        rows = rows.join(self.surveys, on="ParticipantID")
+        last = self.last_record[:n]
+        rows["Last Record"] = pd.to_datetime(last, unit="D")
+        rows["Days Since Record"] = first_day + end - 1 - last
+        rows = rows.sort_values(["PhysicianName", "Participant Name"], kind="stable").reset_index(drop=True)
+        bounds = np.flatnonzero(rows["PhysicianName"].ne(rows["PhysicianName"].shift()).to_numpy())
+        self._slices = {rows["PhysicianName"].iat[start]: slice(start, stop) for start, stop in zip(bounds, [*bounds[1:], len(rows)])}
+        self.table = rows
+        return self
+
+    def physicians(self):
+        """ Physician names with a caseload, sorted. """
+        return [name for name in self._slices if isinstance(name, str)]
+
+    def view(self, physician):
+        """ The physician's caseload rows (empty when unknown). """
+        return self.table.iloc[self._slices.get(physician, slice(0, 0))]
+
+    def stale(self, rows, days=STALE_DAYS):
+        """ Rows of `rows` without a record in the last `days` days. """
+        return rows[rows["Days Since Record"] >= days]
+
+
+@st.cache_resource(show_spinner=False)
+def physician_caseload(metrics_load, survey_load, _df, _scores):
+    """ Caseload table over the loaded metrics and survey scores, shared by all sessions. """
+    return CaseloadTable(metrics_daily(metrics_load, _df)).ingest_metrics(_df).ingest_submissions(_scores)
+
+
+def caseload():
+    """ The shared caseload table for the configured sources. """
+    loader = startup_data()
+    return physician_caseload(load_key("metrics"), load_key("survey"), loader.result("metrics"), loader.result("survey")["Survey Scores"])
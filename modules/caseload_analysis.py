@@ -0,0 +1,60 @@
+import streamlit as st
+from modules.perf import span
+from modules.figures import chart, extend_query
+from modules.photos import show_photo
+from modules.export import export_controls
+from modules.startup import startup_data, wait_for_data
+from modules.caseload import CASELOAD_METRICS, CASELOAD_WINDOWS, STALE_DAYS, caseload
+
+def show_page(filtered_df, query=None):
+    if filtered_df.empty:
+        st.warning("⚠️ No data available for the selected filters.")
+        return
+
+    # ---- Physician Selection ----
+    with span("caseload: physician selection"):
+        wait_for_data(startup_data(), ["survey"])  # the caseload carries each participant's latest survey
+        table = caseload()
+        # Only physicians with a participant in the current selection are offered.
+        selected = set(filtered_df["PhysicianName"].unique())
+        physicians = [name for name in table.physicians() if name in selected]
+        if not physicians:
+            st.info("No physician caseload for the selected filters.")
+            return
+        physician = st.sidebar.selectbox("Select Physician", physicians, key="physician_filter_caseload")
+        # The table covers the whole dataset; keep the physician's participants in the current selection.
+        rows = table.view(physician)
+        rows = rows[rows["ParticipantID"].isin(filtered_df["ParticipantID"].unique())]
+        if rows.empty:  # the selection only has rows from before its participants moved to other physicians
+            st.warning(f"⚠️ No participants of {physician} in the selected filters.")
+            return
+
+    # ---- Caseload Overview ----
+    with span("caseload: overview"):
+        st.subheader(f"🩺 Caseload: {physician}")
+        col1, col2 = st.columns([1, 3])
+        photos = rows["PhysicianPhoto"].dropna()
+        with col1:
+            if not photos.empty:
+                show_photo(photos.iloc[0].strip("'"), width=150, caption=f"Physician: {physician}")
+        with col2:
+            stale = table.stale(rows)
+            metric_cols = st.columns(3)
+            metric_cols[0].metric("Participants", len(rows))
+            metric_cols[1].metric(f"No data for {STALE_DAYS}+ days", len(stale))
+            metric_cols[2].metric("Last Record", f"{rows['Last Record'].max():%Y-%m-%d}")
+            st.caption(f"Averages cover the last {' / '.join(str(w) for w in CASELOAD_WINDOWS)} days up to the dataset's last recorded day.")
+
+    # ---- Caseload Table ----
+    with span("caseload: table"):
+        st.subheader("📋 Participants")
+        values = [f"{label} ({window})" for label in CASELOAD_METRICS for window in ["latest", *(f"{w}d" for w in CASELOAD_WINDOWS)]]
+        columns = ["Participant Name", "OrganizationName", "CohortName", *values, "Latest Survey", "Timepoint", "Survey Date", "Total Score", "Outcome Category", "Last Record", "Days Since Record"]
+        st.dataframe(rows[columns].round(dict.fromkeys(values, 1)), hide_index=True)
+        export_controls("caseload", rows[columns], file_stem=f"caseload_{physician}")
+
+    # ---- 7-Day Averages ----
+    with span("caseload: chart"):
+        label = st.radio("Metric", list(CASELOAD_METRICS), horizontal=True, key="caseload_metric")
+        column = f"{label} ({CASELOAD_WINDOWS[0]}d)"
+        chart("bar", rows, extend_query(query, physician), x="Participant Name", y=column, color="Outcome Category", title=f"{label}: {CASELOAD_WINDOWS[0]}-Day Average per Participant")
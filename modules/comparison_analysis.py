@@ -1,100 +1,131 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import ast
+from modules.perf import span
+from modules.figures import chart, extend_query
+from modules.photos import show_photo
+from modules.export import export_controls, iter_chunks
+from modules.bootstrap import CONFIDENCE, group_intervals
 
-@st.cache_data
 def filter_data_by_date(df, start_date, end_date):
-    return df[(df['RecordDate'] >= start_date) & (df['RecordDate'] <= end_date)]
+    """ Rows of `df` recorded between the two dates (`df` itself when the range covers every row; never modified). """
+    mask = (df['RecordDate'] >= start_date) & (df['RecordDate'] <= end_date)
+    return df if mask.all() else df[mask]
 
-def show_page(filtered_df):
+def show_page(filtered_df, query=None):
     if filtered_df.empty:
         st.warning("⚠️ No data available for the selected filters.")
         return
 
     # ---- Hierarchical Filters ----
-    st.sidebar.header("🔍 Filter Selection")
+    with span("Hierarchical Filters"):
+        st.sidebar.header("🔍 Filter Selection")
     
-    # Organization filter
-    org_filter = st.sidebar.selectbox("Select Organization", ["All"] + list(filtered_df["OrganizationName"].dropna().unique()), key="org_filter_cmp")
-    if org_filter != "All":
-        filtered_df = filtered_df[filtered_df["OrganizationName"] == org_filter]
+        # Organization filter
+        org_filter = st.sidebar.selectbox("Select Organization", ["All"] + list(filtered_df["OrganizationName"].unique()), key="org_filter_cmp")
+        if org_filter != "All":
+            filtered_df = filtered_df[filtered_df["OrganizationName"] == org_filter]
     
-    # Physician filter
-    physician_list = filtered_df["PhysicianName"].dropna().unique()
-    physician_filter = st.sidebar.selectbox("Select Physician", ["All"] + list(physician_list), key="physician_filter_cmp")
-    if physician_filter != "All":
-        filtered_df = filtered_df[filtered_df["PhysicianName"] == physician_filter]
+        # Physician filter
+        physician_list = filtered_df["PhysicianName"].unique()
+        physician_filter = st.sidebar.selectbox("Select Physician", ["All"] + list(physician_list), key="physician_filter_cmp")
+        if physician_filter != "All":
+            filtered_df = filtered_df[filtered_df["PhysicianName"] == physician_filter]
     
-    # Select up to 5 participants for comparison under selected physician
-    participants_selected = st.sidebar.multiselect("Select Participants", list(filtered_df["Participant Name"].dropna().unique()), key="participant_filter_cmp")
-    if participants_selected:
-        filtered_df = filtered_df[filtered_df["Participant Name"].isin(participants_selected)]
+        # Select up to 5 participants for comparison under selected physician
+        participants_selected = st.sidebar.multiselect("Select Participants", list(filtered_df["Participant Name"].unique()), key="participant_filter_cmp")
+        if participants_selected:
+            filtered_df = filtered_df[filtered_df["Participant Name"].isin(participants_selected)]
     
     # ---- Display Selected Profiles ----
-    st.subheader("👤 Selected Profiles")
-    col1, col2 = st.columns(2)
+    with span("Display Selected Profiles"):
+        st.subheader("👤 Selected Profiles")
+        col1, col2 = st.columns(2)
 
-    if physician_filter != "All":
-        physician_photo_url = filtered_df["PhysicianPhoto"].dropna().iloc[0].strip("'")
-        with col1:
-            st.image(physician_photo_url, width=150, caption=f"Physician: {physician_filter}")
+        if physician_filter != "All":
+            photos = filtered_df["PhysicianPhoto"].dropna()
+            if not photos.empty:
+                physician_photo_url = photos.iloc[0].strip("'")
+                with col1:
+                    show_photo(physician_photo_url, width=150, caption=f"Physician: {physician_filter}")
 
-    if participants_selected:
-        with col2:
-            for participant in participants_selected:
-                participant_photo_url = filtered_df[filtered_df["Participant Name"] == participant]["ParticipantPhotoURL"].dropna().iloc[0].strip("'")
-                st.image(participant_photo_url, width=100, caption=participant)
+        if participants_selected:
+            with col2:
+                for participant in participants_selected:
+                    photos = filtered_df[filtered_df["Participant Name"] == participant]["ParticipantPhotoURL"].dropna()
+                    if not photos.empty:
+                        show_photo(photos.iloc[0].strip("'"), width=100, caption=participant)
     
     # ---- Date Range Selection ----
-    st.sidebar.header("📅 Select Date Ranges for Comparison")
-    col1, col2 = st.sidebar.columns(2)
+    with span("Date Range Selection"):
+        st.sidebar.header("📅 Select Date Ranges for Comparison")
+        col1, col2 = st.sidebar.columns(2)
     
-    start_date_1 = col1.date_input("Start Date - Period 1", pd.to_datetime(filtered_df["RecordDate"].min()))
-    end_date_1 = col1.date_input("End Date - Period 1", pd.to_datetime(filtered_df["RecordDate"].max()))
+        start_date_1 = col1.date_input("Start Date - Period 1", pd.to_datetime(filtered_df["RecordDate"].min()))
+        end_date_1 = col1.date_input("End Date - Period 1", pd.to_datetime(filtered_df["RecordDate"].max()))
     
-    start_date_2 = col2.date_input("Start Date - Period 2", pd.to_datetime(filtered_df["RecordDate"].min()))
-    end_date_2 = col2.date_input("End Date - Period 2", pd.to_datetime(filtered_df["RecordDate"].max()))
+        start_date_2 = col2.date_input("Start Date - Period 2", pd.to_datetime(filtered_df["RecordDate"].min()))
+        end_date_2 = col2.date_input("End Date - Period 2", pd.to_datetime(filtered_df["RecordDate"].max()))
     
-    # Filter datasets by selected date ranges
-    df_period_1 = filter_data_by_date(filtered_df, str(start_date_1), str(end_date_1))
-    df_period_2 = filter_data_by_date(filtered_df, str(start_date_2), str(end_date_2))
+        # Filter datasets by selected date ranges
+        df_period_1 = filter_data_by_date(filtered_df, str(start_date_1), str(end_date_1))
+        df_period_2 = filter_data_by_date(filtered_df, str(start_date_2), str(end_date_2))
+        query = extend_query(query, org_filter, physician_filter, participants_selected, start_date_1, end_date_1, start_date_2, end_date_2)
 
-    # ---- Key Metrics Comparison ----
-    st.subheader("📊 Key Metrics Comparison")
     metrics = ["HeartRateAvg", "RestingHeartRate", "Steps", "DurationAsleep", "Calories"]
+    periods = [("Period 1", df_period_1), ("Period 2", df_period_2)]
+
+    # ---- Export (rows of both periods plus per-participant averages, built on click) ----
+    def period_rows():
+        return (chunk.assign(Period=name) for name, period in periods for chunk in iter_chunks(period))
+
+    def period_averages():
+        return pd.concat([period.groupby("Participant Name")[metrics].mean().reset_index().assign(Period=name) for name, period in periods], ignore_index=True)
+
+    export_controls("comparison", period_rows, {"Period Averages": period_averages}, file_stem="comparison_analysis", n_rows=len(df_period_1) + len(df_period_2))
+
+    # ---- Key Metrics Comparison ----
+    with span("Key Metrics Comparison"):
+        st.subheader("📊 Key Metrics Comparison")
     
-    for metric in metrics:
-        if metric in df_period_1.columns and metric in df_period_2.columns:
-            st.subheader(f"📌 {metric} Comparison")
-            col1, col2 = st.columns(2)
-            with col1:
-                for participant in participants_selected:
-                    participant_value_1 = df_period_1[df_period_1["Participant Name"] == participant][metric].mean()
-                    st.metric(f"{participant} - Period 1", round(participant_value_1, 2))
-            with col2:
-                for participant in participants_selected:
-                    participant_value_2 = df_period_2[df_period_2["Participant Name"] == participant][metric].mean()
-                    st.metric(f"{participant} - Period 2", round(participant_value_2, 2))
+        for metric in metrics:
+            if metric in df_period_1.columns and metric in df_period_2.columns:
+                st.subheader(f"📌 {metric} Comparison")
+                col1, col2 = st.columns(2)
+                with col1:
+                    for participant in participants_selected:
+                        participant_value_1 = df_period_1[df_period_1["Participant Name"] == participant][metric].mean()
+                        st.metric(f"{participant} - Period 1", round(participant_value_1, 2))
+                with col2:
+                    for participant in participants_selected:
+                        participant_value_2 = df_period_2[df_period_2["Participant Name"] == participant][metric].mean()
+                        st.metric(f"{participant} - Period 2", round(participant_value_2, 2))
     
     # ---- Trend Line Comparison ----
-    st.subheader("📈 Trends Over Time")
-    for metric in metrics:
-        if metric in df_period_1.columns and metric in df_period_2.columns:
-            df_period_1["Period"] = "Period 1"
-            df_period_2["Period"] = "Period 2"
-            df_combined = pd.concat([df_period_1, df_period_2])
-            fig_trend = px.line(df_combined, x="RecordDate", y=metric, color="Participant Name", title=f"{metric} Over Time")
-            st.plotly_chart(fig_trend)
+    with span("Trend Line Comparison"):
+        st.subheader("📈 Trends Over Time")
+        # One combined frame of just the plotted columns, shared by every metric's chart.
+        plotted = ["RecordDate", "Participant Name", *(metric for metric in metrics if metric in filtered_df.columns)]
+        df_combined = pd.concat([df_period_1[plotted], df_period_2[plotted]])
+        for metric in metrics:
+            if metric in df_period_1.columns and metric in df_period_2.columns:
+                chart("line", df_combined, query, x="RecordDate", y=metric, color="Participant Name", title=f"{metric} Over Time")
     
     # ---- Side-by-Side Bar Charts ----
-    st.subheader("📊 Side-by-Side Participant Comparison")
-    for metric in metrics:
-        if metric in df_period_1.columns and metric in df_period_2.columns:
-            avg_values_1 = df_period_1.groupby("Participant Name")[metric].mean().reset_index()
-            avg_values_2 = df_period_2.groupby("Participant Name")[metric].mean().reset_index()
-            avg_values_1["Period"] = "Period 1"
-            avg_values_2["Period"] = "Period 2"
-            df_avg_combined = pd.concat([avg_values_1, avg_values_2])
-            fig_bar = px.bar(df_avg_combined, x="Participant Name", y=metric, color="Period", barmode="group", title=f"{metric} Comparison")
-            st.plotly_chart(fig_bar)
+    with span("Side-by-Side Bar Charts"):
+        st.subheader("📊 Side-by-Side Participant Comparison")
+        # Intervals only for the participants picked for comparison; the whole selection gets plain means.
+        period_days = pd.concat([period[plotted].assign(Period=name) for name, period in periods]) if participants_selected else None
+        for metric in metrics:
+            if metric in df_period_1.columns and metric in df_period_2.columns:
+                if not participants_selected:
+                    df_avg_combined = pd.concat([period.groupby("Participant Name")[metric].mean().reset_index().assign(Period=name) for name, period in periods])
+                    chart("bar", df_avg_combined, query, x="Participant Name", y=metric, color="Period", barmode="group", title=f"{metric} Comparison")
+                    continue
+                # Participant-day totals are resampled within each participant and period; p tests Period 1 against Period 2.
+                with span(f"bootstrap: {metric} by period"):
+                    df_avg_combined = group_intervals(period_days, ["Participant Name", "Period"], metric, query, unit="RecordDate", unit_name="Days")
+                chart("bar", df_avg_combined, query, x="Participant Name", y=metric, color="Period", barmode="group", error_y="Error+", error_y_minus="Error-", hover_data=["Days", "p vs Rest"], title=f"{metric} Comparison")
+                alpha = 1 - CONFIDENCE
+                differing = df_avg_combined.loc[df_avg_combined["p vs Rest"] < alpha, "Participant Name"].unique()
+                found = f"Periods differ (p < {alpha:g}) for: {', '.join(differing)}." if len(differing) else f"No participant's periods differ at p < {alpha:g}."
+                st.caption(f"Error bars: {CONFIDENCE:.0%} bootstrap CI over days. {found}")
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from modules.sketches import METRICS_DIMENSIONS, cell_index, select_cells
+
+# Pearson correlations and least-squares lines only need sufficient statistics: the row count,
+# the per-metric sums and the sums of cross-products (squares on the diagonal). Those add up, so a
+# MomentCube keeps running totals of the moment vector per cube cell over the days, and answers
+# any filter selection and date window with one subtraction of two running totals per matching
+# cell, in O(cells x metrics^2) without touching raw rows. Totals are stored only for the
+# (cell, day) pairs that have rows, so the cube is never larger than the frame's moment rows.
+# Moments are taken over rows where every metric is present (complete cases).
+CORRELATION_METRICS = ["Steps", "DurationAsleep", "SleepEfficiency", "HeartRateAvg", "RestingHeartRate", "HRV-avgHRV", "Calories"]
+
+
+def row_moments(df, metrics=CORRELATION_METRICS, keys=None, n_keys=1):
+    """ Moment vector per key (n_keys x stats) of the complete-case rows: [n, sums, upper-triangle cross-products]. """
+    values = df[metrics].to_numpy(dtype=np.float64)
+    complete = ~np.isnan(values).any(axis=1)
+    values = values[complete]
+    upper_i, upper_j = np.triu_indices(len(metrics))
+    if keys is None:
+        # A single key: the cross-products are one matrix product.
+        return np.concatenate([[len(values)], values.sum(axis=0), (values.T @ values)[upper_i, upper_j]])[None, :]
+    keys = keys[complete]
+    columns = [np.bincount(keys, minlength=n_keys).astype(np.float64)]
+    columns += [np.bincount(keys, weights=values[:, i], minlength=n_keys) for i in range(len(metrics))]
+    columns += [np.bincount(keys, weights=values[:, i] * values[:, j], minlength=n_keys) for i, j in zip(upper_i, upper_j)]
+    return np.stack(columns, axis=1)
+
+
+def _covariance(moments, k):
+    """ (n, means, covariance matrix) from one moment vector. """
+    n = moments[0]
+    sums = moments[1:1 + k]
+    cross = np.zeros((k, k))
+    upper_i, upper_j = np.triu_indices(k)
+    cross[upper_i, upper_j] = moments[1 + k:]
+    cross[upper_j, upper_i] = moments[1 + k:]
+    if n < 2:
+        return n, np.full(k, np.nan), np.full((k, k), np.nan)
+    means = sums / n
+    return n, means, (cross - n * np.outer(means, means)) / (n - 1)
+
+
+def correlation_matrix(moments, metrics=CORRELATION_METRICS):
+    """ Pearson correlation matrix (metrics x metrics frame) from a moment vector. """
+    _, _, cov = _covariance(moments, len(metrics))
+    scale = np.sqrt(np.diag(cov))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = np.clip(cov / np.outer(scale, scale), -1, 1)
+    return pd.DataFrame(corr, index=metrics, columns=metrics)
+
+
+def regression_line(moments, x, y, metrics=CORRELATION_METRICS):
+    """ Least-squares fit of y on x: {"slope", "intercept", "r", "n"}. """
+    n, means, cov = _covariance(moments, len(metrics))
+    i, j = metrics.index(x), metrics.index(y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = cov[i, j] / cov[i, i]
+        r = cov[i, j] / np.sqrt(cov[i, i] * cov[j, j])
+    return {"slope": float(slope), "intercept": float(means[j] - slope * means[i]), "r": float(r), "n": int(n)}
+
+
+class MomentCube:
+    """ Mergeable correlation moments per filter cell, accumulated over the days of a frame.
+
+    Slider ranges on `range_columns` can't be expressed as cells; a query whose ranges cut into the
+    data is answered from `fallback_df` instead. Like the sidebar's range filters, the cube leaves
+    out rows with a missing range value.
+    """
+
+    def __init__(self, df, dimensions=METRICS_DIMENSIONS, metrics=CORRELATION_METRICS, range_columns=("WeightKg", "HeightCm"), time_column="RecordDate"):
+        self.metrics = list(metrics)
+        df = df[df[[time_column, *range_columns]].notna().all(axis=1)]
+        cell_of_row, self.n_cells, self.cell_codes, self.categories = cell_index(df, dimensions)
+        days = df[time_column].to_numpy().astype("datetime64[D]")
+        self.first_day = days.min() if len(days) else np.datetime64("1970-01-01", "D")
+        self.n_days = int((days.max() - self.first_day).astype(np.int64)) + 1 if len(days) else 0
+        day = (days - self.first_day).astype(np.int64)
+        # Sorted (cell, day) keys that have rows; prefix[i] = moments of every key before keys[i].
+        self.keys, key_of_row = np.unique(cell_of_row * self.n_days + day, return_inverse=True)
+        daily = row_moments(df, self.metrics, key_of_row, len(self.keys))
+        self.prefix = np.zeros((len(self.keys) + 1, daily.shape[1]))
+        np.cumsum(daily, axis=0, out=self.prefix[1:])
+        self.range_bounds = {c: (df[c].min(), df[c].max()) for c in range_columns}
+
+    def _days(self, start, end):
+        first = 0 if start is None else int((np.datetime64(pd.Timestamp(start), "D") - self.first_day).astype(np.int64))
+        last = self.n_days if end is None else int((np.datetime64(pd.Timestamp(end), "D") - self.first_day).astype(np.int64)) + 1
+        return min(max(first, 0), self.n_days), min(max(last, 0), self.n_days)
+
+    def covers(self, ranges):
+        """ Whether every (low, high) slider range keeps all of the data. """
+        return all(low <= self.range_bounds[c][0] and high >= self.range_bounds[c][1] for c, (low, high) in (ranges or {}).items())
+
+    def query(self, selection, start=None, end=None, ranges=None, fallback_df=None):
+        """ Summed moment vector for a filter selection and inclusive date window. """
+        if not self.covers(ranges):
+            return row_moments(fallback_df, self.metrics)[0]
+        first, last = self._days(start, end)
+        cells = np.flatnonzero(select_cells(self.n_cells, self.cell_codes, self.categories, selection)) * self.n_days
+        # Each cell's keys are contiguous, so its window is the key range [cell + first, cell + last).
+        low, high = np.searchsorted(self.keys, cells + first), np.searchsorted(self.keys, cells + last)
+        return (self.prefix[high] - self.prefix[low]).sum(axis=0)
+
+
+@st.cache_resource(show_spinner=False)
+def metrics_moments(load, _df):
+    """ Correlation moment cube over the metrics frame of `load` (see startup.load_key), shared by all sessions. """
+    return MomentCube(_df)
@@ -0,0 +1,56 @@
+import io
+import os
+import pandas as pd
+
+from modules.validation import validate_metrics
+from modules.derived import add_derived_columns
+
+# Remote workbooks used by the dashboard. Both can be overridden with environment
+# variables so the app can run against a local copy or a synthetic stand-in.
+S3_DATA_URL = "https://althealth.s3.us-east-1.amazonaws.com/Synthetic_Dataset_Metrics_Final_Fixed.xlsx"
+S3_SURVEY_URL = "https://althealth.s3.us-east-1.amazonaws.com/survey_responses_singlesheet_PowerBI_Friendly.xlsx"
+
+METRICS_SOURCE_ENV = "ALTHEALTH_METRICS_SOURCE"
+SURVEY_SOURCE_ENV = "ALTHEALTH_SURVEY_SOURCE"
+
+
+def metrics_source():
+    """ Returns the location of the metrics workbook (URL, local file or Parquet directory). """
+    return os.environ.get(METRICS_SOURCE_ENV, S3_DATA_URL)
+
+
+def survey_source():
+    """ Returns the location of the survey workbook (URL, local file or Parquet directory). """
+    return os.environ.get(SURVEY_SOURCE_ENV, S3_SURVEY_URL)
+
+
+def read_source(source, sheet_name=0):
+    """ Reads an Excel workbook, or a directory holding one `<sheet name>.parquet` file per sheet. """
+    if isinstance(source, str) and os.path.isdir(source):
+        sheets = {os.path.splitext(name)[0]: os.path.join(source, name) for name in sorted(os.listdir(source)) if name.endswith(".parquet")}
+        if sheet_name is None:
+            return {name: pd.read_parquet(path) for name, path in sheets.items()}
+        if isinstance(sheet_name, int):
+            return pd.read_parquet(list(sheets.values())[sheet_name])
+        return pd.read_parquet(sheets[sheet_name])
+    return pd.read_excel(source, sheet_name=sheet_name)
+
+
+def prepare_metrics_checked(df):
+    """ Validates the rows (see validation.validate_metrics) and adds the derived columns (see derived.DERIVED_COLUMNS).
+
+    Returns (clean frame, quarantined rows, data-quality summary).
+    """
+    df, quarantine, quality = validate_metrics(df)
+    return add_derived_columns(df), quarantine, quality
+
+
+def prepare_metrics(df):
+    """ The validated metrics frame with its derived columns (quarantined rows dropped). """
+    return prepare_metrics_checked(df)[0]
+
+
+def parse_source(payload, sheet_name=0, postprocess=None):
+    """ Parses downloaded workbook bytes (or a local path) and applies `postprocess`; runs in worker processes. """
+    data = read_source(io.BytesIO(payload) if isinstance(payload, bytes) else payload, sheet_name)
+    return postprocess(data) if postprocess else data
@@ -0,0 +1,28 @@
+import numpy as np
+
+# Derived metric columns are computed once, when the metrics frame is loaded, and stored on the
+# shared frame next to the loaded columns. Pages and cached aggregates read them like any other
+# column: none of them copies a frame to add a column or writes to a frame it was handed. With
+# pandas 3's copy-on-write (hence pandas>=3 in requirements.txt), the column selections they take
+# are views of the shared data. Each entry maps a column to its source columns and a function of
+# those columns; entries whose sources are missing are skipped.
+DERIVED_COLUMNS = {
+    "Week": (["RecordDate"], lambda date: date.dt.to_period("W").astype(str)),
+    "Month": (["RecordDate"], lambda date: date.dt.to_period("M").astype(str)),
+    "DurationAsleepHours": (["DurationAsleep"], lambda asleep: asleep / 3600),
+    "DeepSleepRatio": (["DeepSleep", "DurationAsleep"], lambda stage, asleep: stage / asleep.where(asleep > 0)),
+    "LightSleepRatio": (["LightSleep", "DurationAsleep"], lambda stage, asleep: stage / asleep.where(asleep > 0)),
+    "REMSleepRatio": (["REMSleep", "DurationAsleep"], lambda stage, asleep: stage / asleep.where(asleep > 0)),
+    "AwakeRatio": (["AwakeTime", "DurationAsleep"], lambda awake, asleep: awake / (awake + asleep).where(awake + asleep > 0)),
+    "BMI": (["WeightKg", "HeightCm"], lambda weight, height: weight / np.square(height.where(height > 0) / 100)),
+    # Percent of the day spent in the fat burn, cardio and peak zones (each zone column is a percentage).
+    "HRZonePercent": (["HRZones_Fatburn", "HRZones_Cardio", "HRZones_Peak"], lambda fatburn, cardio, peak: fatburn + cardio + peak),
+}
+
+
+def add_derived_columns(df, columns=DERIVED_COLUMNS):
+    """ Adds every derived column whose sources are present to `df` (a frame the loader owns) and returns it. """
+    for name, (sources, derive) in columns.items():
+        if all(source in df.columns for source in sources):
+            df[name] = derive(*(df[source] for source in sources))
+    return df
@@ -0,0 +1,196 @@
+import argparse
+import io
+import math
+import os
+import sys
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Exports never serialise a whole frame in one go: rows are written CHUNK_ROWS at a time (CSV
+# appends, one Parquet row group per chunk, openpyxl's write-only sheets for xlsx), so memory is
+# bounded by a chunk plus the encoder's buffers. Aggregate tables ride along as extra xlsx sheets,
+# or as extra members of a zip archive for CSV and Parquet. The same writers back the download
+# buttons on every page and the command line:
+#     python -m modules.export metrics out.parquet --filter OrganizationName="Contoso Care" --from 2024-01-01
+EXPORT_FORMATS = {"CSV": "csv", "Parquet": "parquet", "Excel": "xlsx"}
+MIME_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "zip": "application/zip",
+}
+CHUNK_ROWS = 50_000
+XLSX_MAX_ROWS = 1_048_575  # per sheet, excluding the header row
+SPOOL_BYTES = 32 * 1024 * 1024  # in-app exports spill to a temporary file beyond this size
+
+
+def iter_chunks(df, chunk_rows=CHUNK_ROWS):
+    """ Consecutive row slices of `df` (at least one, so empty exports still get a header/schema). """
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def iter_selection(df, selection=None, start=None, end=None, date_column="RecordDate", chunk_rows=CHUNK_ROWS):
+    """ Rows of `df` matching {column: value} and the inclusive date window, one chunk at a time. """
+    matched = False
+    for chunk in iter_chunks(df, chunk_rows):
+        mask = np.ones(len(chunk), dtype=bool)
+        for column, value in (selection or {}).items():
+            mask &= (chunk[column] == value).to_numpy()
+        if start is not None:
+            mask &= (chunk[date_column] >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            mask &= (chunk[date_column] <= pd.Timestamp(end)).to_numpy()
+        if mask.any():
+            matched = True
+            yield chunk[mask]
+    if not matched:
+        yield df.iloc[:0]
+
+
+def _write_csv(stream, chunks):
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    header = True
+    for chunk in chunks:
+        chunk.to_csv(text, header=header, index=False)
+        header = False
+    text.flush()
+    text.detach()
+
+
+def _write_parquet(stream, chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in chunks:
+            if writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                writer = pq.ParquetWriter(pa.PythonFile(stream, mode="w"), table.schema)
+            else:
+                table = pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _xlsx_cell(value):
+    """ openpyxl-compatible cell value (no NaN/NaT, plain datetimes). """
+    if value is None or (isinstance(value, float) and math.isnan(value)) or value is pd.NaT:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _write_xlsx_sheet(workbook, title, chunks):
+    """ Appends rows to write-only sheets, continuing on '<title> (2)', ... past the Excel row limit. """
+    sheet, rows, part = None, 0, 1
+    for chunk in chunks:
+        columns = list(chunk.columns)
+        for row in chunk.itertuples(index=False, name=None):
+            if sheet is None or rows == XLSX_MAX_ROWS:
+                sheet = workbook.create_sheet(title if part == 1 else f"{title} ({part})")
+                sheet.append(columns)
+                rows, part = 0, part + 1
+            sheet.append([_xlsx_cell(value) for value in row])
+            rows += 1
+    if sheet is None:
+        workbook.create_sheet(title)
+
+
+def _write_xlsx(stream, chunks, aggregates):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    _write_xlsx_sheet(workbook, "Rows", chunks)
+    for name, table in aggregates.items():
+        _write_xlsx_sheet(workbook, name[:31], iter_chunks(table))
+    workbook.save(stream)
+
+
+WRITERS = {"csv": _write_csv, "parquet": _write_parquet}
+
+
+def export_extension(fmt, aggregates=None):
+    """ File extension of an export: the format itself, or zip for CSV/Parquet with aggregates. """
+    return "zip" if aggregates and fmt != "xlsx" else fmt
+
+
+def write_export(stream, fmt, chunks, aggregates=None):
+    """ Writes row chunks (and {name: DataFrame} aggregates) to a binary stream in `fmt`. """
+    aggregates = aggregates or {}
+    if fmt == "xlsx":
+        return _write_xlsx(stream, chunks, aggregates)
+    if not aggregates:
+        return WRITERS[fmt](stream, chunks)
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, member_chunks in [("rows", chunks), *((name, iter_chunks(table)) for name, table in aggregates.items())]:
+            with archive.open(f"{name}.{fmt}", "w", force_zip64=True) as member:
+                WRITERS[fmt](member, member_chunks)
+
+
+def export_controls(page_key, rows, aggregates=None, file_stem=None, n_rows=None):
+    """ Sidebar export of the page's current rows (and aggregates, {name: fn() -> DataFrame}), built on click.
+
+    `rows` is a DataFrame, or a function returning an iterable of row chunks together with `n_rows`.
+    """
+    with st.sidebar.expander("📥 Export Data"):
+        label = st.selectbox("Format", list(EXPORT_FORMATS), key=f"export_format_{page_key}")
+        include = bool(aggregates) and st.checkbox("Include aggregates", value=True, key=f"export_aggregates_{page_key}")
+        fmt = EXPORT_FORMATS[label]
+        extension = export_extension(fmt, aggregates if include else None)
+
+        def build():
+            tables = {name: make() for name, make in aggregates.items()} if include else None
+            spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+            write_export(spool, fmt, rows() if callable(rows) else iter_chunks(rows), tables)
+            spool.seek(0)
+            return spool
+
+        st.caption(f"{len(rows) if n_rows is None else n_rows:,} rows")
+        st.download_button("Download", build, file_name=f"{file_stem or page_key}.{extension}", mime=MIME_TYPES[extension], key=f"export_download_{page_key}", on_click="ignore")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export a filtered selection of the metrics or survey data.")
+    parser.add_argument("dataset", choices=["metrics", "survey"], help="Which configured source to export.")
+    parser.add_argument("output", help="Output file; the format follows its extension unless --format is given.")
+    parser.add_argument("--format", choices=sorted(MIME_TYPES.keys() - {"zip"}), default=None)
+    parser.add_argument("--source", default=None, help="Workbook or Parquet directory (default: the configured source).")
+    parser.add_argument("--sheet", default=None, help="Sheet to export (default: the first; 'Survey Responses' for survey).")
+    parser.add_argument("--filter", action="append", default=[], metavar="COLUMN=VALUE", help="Keep rows where COLUMN equals VALUE (repeatable).")
+    parser.add_argument("--from", dest="start", default=None, help="First RecordDate to keep (metrics only).")
+    parser.add_argument("--to", dest="end", default=None, help="Last RecordDate to keep (metrics only).")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from modules.data_sources import metrics_source, prepare_metrics, read_source, survey_source
+
+    args = parse_args(argv)
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip(".").lower()
+    if fmt not in WRITERS and fmt != "xlsx":
+        sys.exit(f"Unknown export format {fmt!r}; use --format csv, parquet or xlsx.")
+    if args.dataset == "metrics":
+        df = prepare_metrics(read_source(args.source or metrics_source(), args.sheet or 0))
+    else:
+        df = read_source(args.source or survey_source(), args.sheet or "Survey Responses")
+    # Filter values arrive as text; compare them in each column's own type.
+    selection = {column: pd.Series([value]).astype(df[column].dtype).iloc[0] for column, value in (item.split("=", 1) for item in args.filter)}
+    with open(args.output, "wb") as stream:
+        write_export(stream, fmt, iter_selection(df, selection, args.start, args.end, chunk_rows=args.chunk_rows))
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
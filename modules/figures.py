@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+import streamlit as st
+
+from modules.perf import span, plotly_chart
+
+# Scatter and line figures with more points than this are drawn with WebGL traces (scattergl)
+# instead of SVG. Override with ALTHEALTH_WEBGL_THRESHOLD.
+# Serialised figures are cached per query: the parts that determine the figure's data (the source
+# and loaded frame, the sidebar and page filters, the widgets of the section), which the pages
+# already hold, so a cache hit costs a hash of a few values rather than of the plotted rows.
+WEBGL_POINT_THRESHOLD = int(os.environ.get("ALTHEALTH_WEBGL_THRESHOLD", 1000))
+FIGURE_CACHE_ENTRIES = 512
+
+# plotly.express builder per chart kind; plotly.express itself is imported on the first figure
+# built, so pages paint their metrics before paying for it.
+BUILDERS = {
+    "bar": "bar",
+    "line": "line",
+    "scatter": "scatter",
+    "histogram": "histogram",
+    "pie": "pie",
+    "heatmap": "imshow",
+}
+RENDER_MODE_KINDS = {"line", "scatter"}
+COLUMN_ARGS = ("x", "y", "color", "names", "values", "base", "text", "hover_data", "facet_col", "facet_row")
+
+
+def _used_columns(data, px_kwargs):
+    """ Columns of `data` referenced by the figure arguments. """
+    used = []
+    for arg in COLUMN_ARGS:
+        value = px_kwargs.get(arg)
+        for column in value if isinstance(value, (list, tuple)) else [value]:
+            if isinstance(column, str) and column in data.columns and column not in used:
+                used.append(column)
+    return used
+
+
+def query_signature(*parts):
+    """ Stable hex signature for the parts that determine an aggregate (page, selections, interval, ...). """
+    return hashlib.sha1(json.dumps(parts, default=str, sort_keys=True).encode()).hexdigest()
+
+
+def extend_query(query, *parts):
+    """ `query` narrowed by more parts (page filters, section widgets); None stays None. """
+    return None if query is None else (*query, *parts)
+
+
+def data_signature(data, columns=None):
+    """ Content signature of the (aggregate) frame a figure is drawn from. """
+    subset = data[columns] if columns else data
+    hashed = pd.util.hash_pandas_object(subset, index=False).to_numpy()
+    return hashlib.sha1(hashed.tobytes() + "|".join(map(str, subset.columns)).encode()).hexdigest()
+
+
+def render_mode(n_points):
+    """ WebGL for large scatter/line figures, SVG otherwise. """
+    return "webgl" if n_points > WEBGL_POINT_THRESHOLD else "svg"
+
+
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def _figure_spec(kind, signature, options, _data):
+    """ Builds the figure with plotly.express and returns its serialised JSON (cached per signature and options). """
+    import plotly.express as px
+
+    px_kwargs, layout, traces = json.loads(options)
+    fig = getattr(px, BUILDERS[kind])(_data, **px_kwargs)
+    if layout:
+        fig.update_layout(**layout)
+    if traces:
+        fig.update_traces(**traces)
+    return pio.to_json(fig, validate=False)
+
+
+def figure(kind, data, query=None, layout=None, traces=None, **px_kwargs):
+    """ Returns a Plotly figure for `data`, reusing the serialised figure built for the same query.
+
+    `query` is a tuple of the parts that determine `data` (see extend_query); it is hashed with the
+    figure options. Without one (e.g. benchmarks), the content of the columns the figure uses is hashed instead.
+    """
+    if kind in RENDER_MODE_KINDS and "render_mode" not in px_kwargs:
+        px_kwargs["render_mode"] = render_mode(len(data))
+    signature = query_signature(*query) if query is not None else data_signature(data, _used_columns(data, px_kwargs))
+    options = json.dumps([px_kwargs, layout, traces], default=str, sort_keys=True)
+    with span(f"figure: {px_kwargs.get('title') or kind}"):
+        spec = _figure_spec(kind, signature, options, data)
+    # The spec was produced by plotly itself, so skip re-validating it on the way back in.
+    return go.Figure(json.loads(spec), _validate=False)
+
+
+def chart(kind, data, query=None, layout=None, traces=None, chart_kwargs=None, **px_kwargs):
+    """ Draws a cached figure with st.plotly_chart (see figure()). """
+    return plotly_chart(figure(kind, data, query, layout, traces, **px_kwargs), **(chart_kwargs or {}))
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from modules.startup import load_key
+
+# Every widget change reruns the script, and the sidebar cascade used to re-filter the full frame
+# level by level, copying an intermediate frame at each one. The cascade now works on row
+# positions instead. Each session keeps the positions every level selected on the previous rerun.
+# While each level's predicate is unchanged or narrower than before (a value picked where "All"
+# was, a range pulled in), its new rows are the old ones with only the changed predicates applied.
+# The first widened or cleared level, and every level after it, is evaluated again from its
+# parent level. Equality columns are compared as integer codes from a shared FilterIndex, and the
+# filtered frame is materialised once, at the end.
+CASCADE_COLUMNS = ["OrganizationName", "CohortName", "ProgramName", "ParticipantGender", "Ethnicity", "AgeGroup", "City"]
+RANGE_COLUMNS = ["WeightKg", "HeightCm", "RecordDate"]
+SESSION_KEY = "_filter_cascade"
+
+
+class FilterIndex:
+    """ Integer codes of the equality columns and raw arrays of the range columns, shared by all sessions. """
+
+    def __init__(self, df, cascade_columns=CASCADE_COLUMNS, range_columns=RANGE_COLUMNS):
+        self.df = df
+        self.codes, self.labels = {}, {}
+        for column in cascade_columns:
+            self.codes[column], self.labels[column] = pd.factorize(df[column])
+        self.values = {column: df[column].to_numpy() for column in range_columns}
+
+    def mask(self, predicate, positions):
+        """ Boolean mask of `predicate` over the rows at `positions` (None for every row). """
+        kind, column, *args = predicate
+        if kind == "equals":
+            codes = self.codes[column] if positions is None else self.codes[column][positions]
+            return codes == self.labels[column].get_loc(args[0]) if args[0] in self.labels[column] else np.zeros(len(codes), dtype=bool)
+        values = self.values[column] if positions is None else self.values[column][positions]
+        low, high = args
+        mask = np.ones(len(values), dtype=bool)
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+        return mask
+
+
+def _no_filter(predicate):
+    return predicate[2:] == (None,) or predicate[2:] == (None, None)
+
+
+def narrows(new, old):
+    """ True when `new` selects a subset of what `old` selects on the same column. """
+    if new[:2] != old[:2]:
+        return False
+    if new[0] == "equals":
+        return old[2] is None or new[2] == old[2]
+    (new_low, new_high), (old_low, old_high) = new[2:], old[2:]
+    if (new_low, new_high) == (old_low, old_high) or (old_low, old_high) == (None, None):
+        return True
+    return (old_low is None or (new_low is not None and new_low >= old_low)) and (old_high is None or (new_high is not None and new_high <= old_high))
+
+
+class FilterCascade:
+    """ One session's sidebar cascade: applies levels in order, reusing the previous rerun's row sets. """
+
+    def __init__(self, index):
+        self.index = index
+        self.levels = []  # [(predicate, positions or None for every row)] of the last completed pass
+        self.begin()
+
+    def begin(self):
+        """ Starts a rerun's pass over the levels. """
+        self.pending = []
+        self.positions = None
+        self.changed = []  # narrowed predicates of this pass, while every level so far only narrowed
+        self.narrowing = True
+
+    def _select(self, positions, predicates):
+        for predicate in predicates:
+            if not _no_filter(predicate):
+                mask = self.index.mask(predicate, positions)
+                if not mask.all():
+                    positions = np.flatnonzero(mask) if positions is None else positions[mask]
+        return positions
+
+    def apply(self, predicate):
+        """ Applies the next level's predicate: ("equals", column, value or None) or ("between", column, low, high). """
+        level = len(self.pending)
+        previous = self.levels[level] if level < len(self.levels) else None
+        if self.narrowing and previous is not None and narrows(predicate, previous[0]):
+            if predicate != previous[0]:
+                self.changed.append(predicate)
+            positions = self._select(previous[1], self.changed)
+        else:
+            self.narrowing = False
+            positions = self._select(self.positions, [predicate])
+        self.pending.append((predicate, positions))
+        self.positions = positions
+
+    def equals(self, column, value):
+        """ Keeps rows where `column` is `value` ("All" keeps every row). """
+        self.apply(("equals", column, None if value == "All" else value))
+
+    def between(self, column, low=None, high=None):
+        """ Keeps rows with low <= `column` <= high (both None keeps every row, including missing values). """
+        self.apply(("between", column, low, high))
+
+    def options(self, column):
+        """ Distinct non-null values of `column` in the current rows, in order of first appearance. """
+        codes = self.index.codes[column] if self.positions is None else self.index.codes[column][self.positions]
+        present = pd.unique(codes)
+        return list(self.index.labels[column][present[present >= 0]])
+
+    def frame(self):
+        """ The rows selected by every level so far (the shared frame itself when nothing is filtered).
+
+        Ends the pass: its levels become the baseline for the next rerun. A rerun interrupted before
+        this point leaves the previous baseline in place.
+        """
+        self.levels = self.pending
+        return self.index.df if self.positions is None else self.index.df.take(self.positions)
+
+
+@st.cache_resource(show_spinner=False)
+def metrics_filter_index(load, _df):
+    """ Filter index over the metrics frame of `load` (see startup.load_key), shared by all sessions. """
+    return FilterIndex(_df)
+
+
+def session_cascade(df):
+    """ This session's filter cascade over `df`, ready for a new pass over the levels. """
+    index = metrics_filter_index(load_key("metrics"), df)
+    cascade = st.session_state.get(SESSION_KEY)
+    if cascade is None or cascade.index is not index:
+        cascade = st.session_state[SESSION_KEY] = FilterCascade(index)
+    cascade.begin()
+    return cascade
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from modules.leaderboard import metrics_daily
+from modules.startup import load_key, startup_data
+
+# Per-participant projections of the daily metrics: a linear trend plus day-of-week offsets, fitted
+# by least squares over each participant's last FIT_DAYS recorded days. Every participant shares
+# one design matrix over the aligned date axis and differs only in which days are observed, so all
+# normal equations are built with one einsum over the day x participant matrix (from the shared
+# daily store, see modules/leaderboard.py) and solved as a single batched np.linalg.solve. The
+# projections cover HORIZON_DAYS days past the last recorded day, with prediction variances. A
+# selection's band is the mean of its participants' projections, with the variance of that mean
+# assuming independent errors.
+FORECAST_METRICS = ["Steps", "DurationAsleep", "RestingHeartRate", "HeartRateAvg"]
+FIT_DAYS = 56
+HORIZON_DAYS = 14
+MIN_DAYS = 14  # observed days a participant needs in the fit window
+BAND_Z = 1.96  # 95% band
+RIDGE = 1e-6
+
+
+def _design(days, origin):
+    """ Rows of [1, trend, Tue..Sun indicators] for integer day numbers (trend in weeks from `origin`). """
+    days = np.asarray(days)
+    weekday = (days + 3) % 7  # day 0 of the epoch was a Thursday; Monday is 0
+    return np.column_stack([np.ones(len(days)), (days - origin) / 7, *(weekday == d for d in range(1, 7))]).astype(np.float64)
+
+
+class ForecastModel:
+    """ Batched trend + weekly-seasonality fits of every participant, with projections past the last day. """
+
+    def __init__(self, daily, metrics=FORECAST_METRICS, fit_days=FIT_DAYS, horizon=HORIZON_DAYS, min_days=MIN_DAYS):
+        self.metrics = list(metrics)
+        self.daily = daily  # a Leaderboard over (at least) `metrics`, shared with the other engines
+        self.participant_ids = self.daily.participant_ids
+        n_days = self.daily.n_days
+        first = max(n_days - fit_days, 0)
+        epoch_day = 0 if self.daily.first_day is None else int(self.daily.first_day.astype(np.int64))
+        fit = _design(epoch_day + np.arange(first, n_days), epoch_day + n_days - 1)
+        future = _design(epoch_day + np.arange(n_days, n_days + horizon), epoch_day + n_days - 1)
+        self.dates = pd.to_datetime(np.arange(n_days, n_days + horizon) + epoch_day, unit="D")
+        self.mean, self.variance = {}, {}
+        for metric in self.metrics:
+            self.mean[metric], self.variance[metric] = self._fit(metric, fit, future, first, min_days)
+
+    def _fit(self, metric, fit, future, first, min_days):
+        """ (mean, variance) horizon x participant projections of `metric`; NaN for participants with too few days. """
+        values = self.daily.daily_values(metric, first)
+        observed = ~np.isnan(values)
+        values = np.where(observed, values, 0.0)
+        observed = observed.astype(np.float64)
+        k = fit.shape[1]
+        gram = np.einsum("tp,ti,tj->pij", observed, fit, fit) + RIDGE * np.eye(k)
+        moments = np.einsum("tp,ti->pi", observed * values, fit)
+        coefficients = np.linalg.solve(gram, moments[..., None])[..., 0]
+        residuals = observed * (values - fit @ coefficients.T)
+        n_observed = observed.sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sigma2 = (residuals * residuals).sum(axis=0) / (n_observed - k)
+        leverage = np.einsum("hi,pij,hj->hp", future, np.linalg.inv(gram), future)
+        mean = future @ coefficients.T
+        variance = sigma2 * (1 + leverage)
+        fitted = n_observed >= max(min_days, k + 1)
+        return np.where(fitted, mean, np.nan), np.where(fitted, variance, np.nan)
+
+    def band(self, metric, participants=None, scale=1, z=BAND_Z):
+        """ RecordDate/Forecast/Lower/Upper frame: mean projection of `participants` (IDs; default all) with its band. """
+        codes = np.arange(self.daily.n_participants) if participants is None else self.participant_ids.get_indexer(participants)
+        codes = codes[codes >= 0]
+        mean, variance = self.mean[metric][:, codes], self.variance[metric][:, codes]
+        fitted = ~np.isnan(mean[0]) if len(mean) else np.zeros(len(codes), dtype=bool)
+        m = fitted.sum()
+        forecast = mean[:, fitted].mean(axis=1) if m else np.full(len(self.dates), np.nan)
+        spread = z * np.sqrt(variance[:, fitted].sum(axis=1)) / m if m else np.full(len(self.dates), np.nan)
+        return pd.DataFrame({"RecordDate": self.dates, "Forecast": forecast / scale, "Lower": (forecast - spread) / scale, "Upper": (forecast + spread) / scale, "Participants": m})
+
+
+@st.cache_resource(show_spinner=False)
+def metrics_forecasts(load, _df):
+    """ Forecast fits over the shared daily store of the metrics frame of `load`, shared by all sessions. """
+    return ForecastModel(metrics_daily(load, _df))
+
+
+def forecast_model():
+    """ The shared forecast fits for the configured metrics source. """
+    return metrics_forecasts(load_key("metrics"), startup_data().result("metrics"))
+
+
+def add_projection(fig, band, name):
+    """ Draws `band` on a trend figure: a dashed projection line inside a shaded band. """
+    fig.add_scatter(x=band["RecordDate"], y=band["Upper"], mode="lines", line_width=0, showlegend=False, name=f"{name} (upper)")
+    fig.add_scatter(x=band["RecordDate"], y=band["Lower"], mode="lines", line_width=0, fill="tonexty", fillcolor="rgba(99, 110, 250, 0.2)", showlegend=False, name=f"{name} (lower)")
+    fig.add_scatter(x=band["RecordDate"], y=band["Forecast"], mode="lines", line_dash="dash", name=name)
+    return fig
+
+
+def selection_band(filtered_df, metric, scale=1):
+    """ Projection band for the participants of `filtered_df`, or None when it stops before the last recorded day. """
+    model = forecast_model()
+    if filtered_df.empty or filtered_df["RecordDate"].max() < model.dates[0] - pd.Timedelta(days=1):
+        return None
+    band = model.band(metric, filtered_df["ParticipantID"].unique(), scale)
+    return band if band["Participants"].iloc[0] else None
+
+
+def projection_caption(band):
+    """ One-line legend for a drawn projection band. """
+    return f"Dashed: {len(band)}-day projection from each participant's trend and weekly pattern; shaded: {BAND_Z:g}σ band for the average of {band['Participants'].iloc[0]} participants."
@@ -1,7 +1,12 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import ast  # To safely parse HeartRateSamples & HRVValues from string format
+from modules.perf import span, plotly_chart
+from modules.figures import chart, extend_query, figure
+from modules.correlations import regression_line, row_moments
+from modules.photos import show_photo
+from modules.leaderboard import RANKINGS, top_participants
+from modules.export import export_controls
+from modules.intraday import SIGNALS, intraday_pyramid
+from modules.forecasts import add_projection, projection_caption, selection_band
 
 @st.cache_data
 def aggregate_heart_rate(filtered_df, time_interval):
@@ -12,118 +17,138 @@ def aggregate_heart_rate(filtered_df, time_interval):
         return filtered_df.groupby("Month")["HeartRateAvg"].mean().reset_index(), "Month"
     return filtered_df.groupby("RecordDate")["HeartRateAvg"].mean().reset_index(), "RecordDate"
 
-def parse_heart_rate_samples(sample_str):
-    """ Parses heart rate samples from stored string format to a DataFrame. """
-    try:
-        heart_rate_list = ast.literal_eval(sample_str)
-        df = pd.DataFrame(heart_rate_list, columns=["Timestamp", "HeartRate"])
-        df["Timestamp"] = pd.to_datetime(df["Timestamp"], unit='s')
-        return df
-    except:
-        return pd.DataFrame(columns=["Timestamp", "HeartRate"])
-
-def parse_hrv_values(hrv_dict_str, record_date):
-    """ Parses HRV values stored as {seconds_since_midnight: HRV_value} into a DataFrame. """
-    try:
-        hrv_dict = ast.literal_eval(hrv_dict_str)
-        hrv_df = pd.DataFrame(list(hrv_dict.items()), columns=["SecondsSinceMidnight", "HRV"])
-        hrv_df["Timestamp"] = pd.to_datetime(record_date) + pd.to_timedelta(hrv_df["SecondsSinceMidnight"], unit="s")
-        return hrv_df
-    except:
-        return pd.DataFrame(columns=["Timestamp", "HRV"])
-
-def show_page(filtered_df):
-    """ Displays the Heart Rate Analysis Page with hierarchical filtering and meaningful visualizations. """
+def trend_figure(filtered_df, time_interval, query=None):
+    """ Average heart rate line chart at the given interval (also replayed by the query-log prewarm). """
+    with span("aggregate_heart_rate (cache_data)"):
+        grouped_df, x_col = aggregate_heart_rate(filtered_df, time_interval)
+    return figure("line", grouped_df, extend_query(query, time_interval), x=x_col, y="HeartRateAvg", title=f"Average Heart Rate ({time_interval})")
+
+def show_page(filtered_df, query=None):
+    """ Displays the Heart Rate Analysis Page with hierarchical filtering and meaningful visualizations (`query`: the figure-cache query of the sidebar selection). """
     if filtered_df.empty:
         st.warning("⚠️ No data available for the selected filters.")
         return
 
     # ---- Hierarchical Filters ----
-    st.sidebar.header("🔍 Filter Selection")
+    with span("Hierarchical Filters"):
+        st.sidebar.header("🔍 Filter Selection")
 
-    org_filter = st.sidebar.selectbox("Select Organization", ["All"] + list(filtered_df["OrganizationName"].dropna().unique()), key="org_filter_hr")
-    if org_filter != "All":
-        filtered_df = filtered_df[filtered_df["OrganizationName"] == org_filter]
+        org_filter = st.sidebar.selectbox("Select Organization", ["All"] + list(filtered_df["OrganizationName"].unique()), key="org_filter_hr")
+        if org_filter != "All":
+            filtered_df = filtered_df[filtered_df["OrganizationName"] == org_filter]
 
-    physician_list = filtered_df["PhysicianName"].dropna().unique()
-    physician_filter = st.sidebar.selectbox("Select Physician", ["All"] + list(physician_list), key="physician_filter_hr")
-    if physician_filter != "All":
-        filtered_df = filtered_df[filtered_df["PhysicianName"] == physician_filter]
+        physician_list = filtered_df["PhysicianName"].unique()
+        physician_filter = st.sidebar.selectbox("Select Physician", ["All"] + list(physician_list), key="physician_filter_hr")
+        if physician_filter != "All":
+            filtered_df = filtered_df[filtered_df["PhysicianName"] == physician_filter]
 
-    participant_list = filtered_df["Participant Name"].dropna().unique()
-    participant_filter = st.sidebar.selectbox("Select Participant", ["All"] + list(participant_list), key="participant_filter_hr")
-    if participant_filter != "All":
-        filtered_df = filtered_df[filtered_df["Participant Name"] == participant_filter]
+        participant_list = filtered_df["Participant Name"].unique()
+        participant_filter = st.sidebar.selectbox("Select Participant", ["All"] + list(participant_list), key="participant_filter_hr")
+        if participant_filter != "All":
+            filtered_df = filtered_df[filtered_df["Participant Name"] == participant_filter]
+        query = extend_query(query, org_filter, physician_filter, participant_filter)
 
     # ---- Display Selected Profiles ----
-    st.subheader("👤 Selected Profiles")
-    col1, col2 = st.columns(2)
-
-    if physician_filter != "All":
-        physician_photo_url = filtered_df["PhysicianPhoto"].dropna().iloc[0].strip("'")
-        with col1:
-            st.image(physician_photo_url, width=150, caption=f"Physician: {physician_filter}")
-
-    if participant_filter != "All":
-        participant_photo_url = filtered_df["ParticipantPhotoURL"].dropna().iloc[0].strip("'")
-        with col2:
-            st.image(participant_photo_url, width=150, caption=f"Participant: {participant_filter}")
+    with span("Display Selected Profiles"):
+        st.subheader("👤 Selected Profiles")
+        col1, col2 = st.columns(2)
+
+        if physician_filter != "All":
+            photos = filtered_df["PhysicianPhoto"].dropna()
+            if not photos.empty:
+                physician_photo_url = photos.iloc[0].strip("'")
+                with col1:
+                    show_photo(physician_photo_url, width=150, caption=f"Physician: {physician_filter}")
+
+        if participant_filter != "All":
+            photos = filtered_df["ParticipantPhotoURL"].dropna()
+            if not photos.empty:
+                participant_photo_url = photos.iloc[0].strip("'")
+                with col2:
+                    show_photo(participant_photo_url, width=150, caption=f"Participant: {participant_filter}")
+
+    # ---- Export (rows plus the trend aggregates, built on click) ----
+    export_controls("heart_rate", filtered_df, {f"Heart Rate ({interval})": (lambda interval=interval: aggregate_heart_rate(filtered_df, interval)[0]) for interval in ["Daily", "Weekly", "Monthly"]}, file_stem="heart_rate_analysis")
 
     # ---- User selection for aggregation level ----
-    time_interval = st.radio("Select Time Interval", ["Daily", "Weekly", "Monthly"], horizontal=True)
-
-    # Ensure the filtered dataset is used for calculations
-    grouped_df, x_col = aggregate_heart_rate(filtered_df, time_interval)
+    with span("User selection for aggregation level"):
+        time_interval = st.radio("Select Time Interval", ["Daily", "Weekly", "Monthly"], horizontal=True, key="time_interval_hr")
 
     # ---- Key Metrics ----
-    st.subheader("📊 Key Heart Rate Metrics")
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.metric("Average HR", round(filtered_df["HeartRateAvg"].mean(), 2))
-        st.metric("Max HR", round(filtered_df["maxHR"].mean(), 2))
-    with col2:
-        st.metric("Resting HR", round(filtered_df["RestingHeartRate"].mean(), 2))
-        st.metric("Min HR", round(filtered_df["minHR"].mean(), 2))
-    with col3:
-        st.metric("Fat Burn Zone %", round(filtered_df["HRZones_Fatburn"].mean(), 2))
-        st.metric("Cardio Zone %", round(filtered_df["HRZones_Cardio"].mean(), 2))
+    with span("Key Metrics"):
+        st.subheader("📊 Key Heart Rate Metrics")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Average HR", round(filtered_df["HeartRateAvg"].mean(), 2))
+            st.metric("Max HR", round(filtered_df["maxHR"].mean(), 2))
+        with col2:
+            st.metric("Resting HR", round(filtered_df["RestingHeartRate"].mean(), 2))
+            st.metric("Min HR", round(filtered_df["minHR"].mean(), 2))
+        with col3:
+            st.metric("Fat Burn Zone %", round(filtered_df["HRZones_Fatburn"].mean(), 2))
+            st.metric("Cardio Zone %", round(filtered_df["HRZones_Cardio"].mean(), 2))
 
     # ---- Heart Rate Trends ----
-    st.subheader("💓 Heart Rate Trends")
-    fig_hr = px.line(grouped_df, x=x_col, y="HeartRateAvg", title=f"Average Heart Rate ({time_interval})")
-    st.plotly_chart(fig_hr)
-
-    # ---- HRV Time-Series Visualization ----
-    if participant_filter != "All":
-        st.subheader("📈 HRV Sample Trends")
-        hrv_values_str = filtered_df["HRVValues"].dropna().iloc[0]
-        record_date = filtered_df["RecordDate"].dropna().iloc[0]
-        hrv_values_df = parse_hrv_values(hrv_values_str, record_date)
-
-        if not hrv_values_df.empty:
-            fig_hrv_samples = px.line(hrv_values_df, x="Timestamp", y="HRV", title="HRV Trends Throughout the Day")
-            st.plotly_chart(fig_hrv_samples)
-        else:
-            st.warning("No valid HRV samples available for this participant.")
+    with span("Heart Rate Trends"):
+        st.subheader("💓 Heart Rate Trends")
+        fig = trend_figure(filtered_df, time_interval, query)
+        bands = {name: selection_band(filtered_df, metric) for name, metric in [("Projected Average HR", "HeartRateAvg"), ("Projected Resting HR", "RestingHeartRate")]} if time_interval == "Daily" else {}
+        for name, band in bands.items():
+            if band is not None:
+                add_projection(fig, band, name)
+        plotly_chart(fig)
+        if bands.get("Projected Average HR") is not None:
+            st.caption(projection_caption(bands["Projected Average HR"]))
+
+    # ---- Intraday Drill-Down (finest pyramid level that fits the visible range) ----
+    with span("Intraday Drill-Down"):
+        if participant_filter != "All":
+            st.subheader("🔬 Intraday Heart Rate & HRV")
+            signal = st.radio("Signal", list(SIGNALS), horizontal=True, key="intraday_signal_hr")
+            first_day, last_day = filtered_df["RecordDate"].min().date(), filtered_df["RecordDate"].max().date()
+            if first_day < last_day:
+                first_day, last_day = st.slider("Visible Range", min_value=first_day, max_value=last_day, value=(first_day, last_day), key="intraday_range_hr")
+            level, samples = intraday_pyramid().view(filtered_df["ParticipantID"].iloc[0], signal, first_day, last_day)
+
+            if not samples.empty:
+                fig = figure("line", samples, extend_query(query, signal, first_day, last_day), x="Timestamp", y="Mean", title=f"Intraday {signal} ({first_day} to {last_day})")
+                if level != "raw":
+                    fig.add_scatter(x=samples["Timestamp"], y=samples["Max"], mode="lines", line_width=0, showlegend=False, name="Max")
+                    fig.add_scatter(x=samples["Timestamp"], y=samples["Min"], mode="lines", line_width=0, fill="tonexty", showlegend=False, name="Min")
+                plotly_chart(fig)
+                st.caption(f"{len(samples)} points at {level} resolution" + ("" if level == "raw" else " (line: mean, band: min to max)"))
+            else:
+                st.warning(f"No valid {signal} samples available for this participant.")
 
     # ---- HR Distribution Histogram ----
-    st.subheader("📊 Heart Rate Distribution")
-    fig_hr_hist = px.histogram(filtered_df, x="HeartRateAvg", title="Heart Rate Distribution (Histogram)", nbins=20)
-    st.plotly_chart(fig_hr_hist)
+    with span("HR Distribution Histogram"):
+        st.subheader("📊 Heart Rate Distribution")
+        chart("histogram", filtered_df, query, x="HeartRateAvg", title="Heart Rate Distribution (Histogram)", nbins=20)
 
     # ---- Multi-Participant HR Comparison ----
-    st.subheader("📌 Heart Rate Comparison Across Participants")
-    fig_hr_comp = px.line(filtered_df, x="RecordDate", y="HeartRateAvg", color="Participant Name", title="Heart Rate Trends Across Participants")
-    st.plotly_chart(fig_hr_comp)
+    with span("Multi-Participant HR Comparison"):
+        st.subheader("📌 Heart Rate Comparison Across Participants")
+        chart("line", filtered_df, query, x="RecordDate", y="HeartRateAvg", color="Participant Name", title="Heart Rate Trends Across Participants")
 
     # ---- HRV vs. Resting HR Scatter Plot ----
-    st.subheader("📉 HRV vs. Resting Heart Rate")
-    fig_hrv_scatter = px.scatter(filtered_df, x="RestingHeartRate", y="HRV-avgHRV", title="HRV vs. Resting HR")
-    st.plotly_chart(fig_hrv_scatter)
+    with span("HRV vs. Resting HR Scatter Plot"):
+        st.subheader("📉 HRV vs. Resting Heart Rate")
+        fig = figure("scatter", filtered_df, query, x="RestingHeartRate", y="HRV-avgHRV", title="HRV vs. Resting HR")
+        fit = regression_line(row_moments(filtered_df)[0], "RestingHeartRate", "HRV-avgHRV")
+        low, high = filtered_df["RestingHeartRate"].min(), filtered_df["RestingHeartRate"].max()
+        fig.add_scatter(x=[low, high], y=[fit["intercept"] + fit["slope"] * low, fit["intercept"] + fit["slope"] * high], mode="lines", name=f"Fit (r = {fit['r']:.2f})")
+        plotly_chart(fig)
 
     # ---- HR Zones Stacked Bar Chart ----
-    st.subheader("⚡ HR Zone Distribution Across Participants")
-    hr_zones_df = filtered_df[["Participant Name", "HRZones_Fatburn", "HRZones_Cardio", "HRZones_Peak"]]
-    hr_zones_melted = hr_zones_df.melt(id_vars=["Participant Name"], var_name="HR Zone", value_name="Percentage")
-    fig_hr_zones = px.bar(hr_zones_melted, x="Participant Name", y="Percentage", color="HR Zone", barmode="stack", title="HR Zone Distribution")
-    st.plotly_chart(fig_hr_zones)
+    with span("HR Zones Stacked Bar Chart"):
+        st.subheader("⚡ HR Zone Distribution Across Participants")
+        hr_zones_df = filtered_df[["Participant Name", "HRZones_Fatburn", "HRZones_Cardio", "HRZones_Peak"]]
+        hr_zones_melted = hr_zones_df.melt(id_vars=["Participant Name"], var_name="HR Zone", value_name="Percentage")
+        chart("bar", hr_zones_melted, query, x="Participant Name", y="Percentage", color="HR Zone", barmode="stack", title="HR Zone Distribution")
+
+    # ---- HR Zone Share Leaderboard ----
+    with span("HR Zone Share Leaderboard"):
+        st.subheader("🏆 Top 10 Participants by Share of the Day in HR Zones")
+        ranking = st.radio("Rank by", list(RANKINGS), horizontal=True, key="ranking_hr_zones")
+        top_zone_share = top_participants(filtered_df, "HRZonePercent", ranking)
+        chart("bar", top_zone_share, extend_query(query, ranking), x="Participant Name", y="HRZonePercent", color="Participant Name", title=f"% of the Day in Fat Burn + Cardio + Peak Zones ({ranking})")
@@ -0,0 +1,155 @@
+import ast
+import re
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from modules.startup import load_key, startup_data
+from modules.validation import SAMPLE_FORMATS
+
+# Intraday samples are stored as text per participant-day (HeartRateSamples as "[(unix_ts, bpm), ...]",
+# HRVValues as "{seconds_since_midnight: ms, ...}"). They are parsed in bulk once per process into
+# per-signal arrays sorted by participant and time, then rolled up into a resolution pyramid:
+# raw -> 1-minute -> 15-minute -> hourly buckets of min/mean/max. A view of any time range reads
+# the finest level that fits in MAX_POINTS points, so a drill-down over weeks costs the same as one
+# over a day. Every level keeps per-participant offsets, so a view is two binary searches and a slice.
+SIGNALS = {"Heart Rate": "HeartRateSamples", "HRV": "HRVValues"}
+LEVELS = {"raw": 0, "1 minute": 60, "15 minutes": 900, "1 hour": 3600, "1 day": 86400}
+MAX_POINTS = 2000
+_STRIP = str.maketrans({"[": None, "]": None, "(": None, ")": None, "{": None, "}": None, " ": None, ":": ","})
+
+
+def _bulk_samples(strings, separator):
+    """ (row, first number, second number) per sample of well-formed sample strings, parsed in one pass. """
+    counts = strings.str.count(re.escape(separator)).to_numpy()
+    fields = ",".join(strings.to_numpy(dtype=object)).translate(_STRIP).split(",")
+    pairs = np.array([f for f in fields if f], dtype=np.float64).reshape(-1, 2)
+    return np.repeat(np.arange(len(strings)), counts), pairs[:, 0], pairs[:, 1]
+
+
+def _literal_samples(strings):
+    """ Slow path: (row, first, second) per sample via literal_eval, skipping unparseable rows. """
+    rows, firsts, seconds = [], [], []
+    for row, text in enumerate(strings):
+        try:
+            parsed = ast.literal_eval(text)
+            pairs = [(float(a), float(b)) for a, b in (parsed.items() if isinstance(parsed, dict) else parsed)]
+        except (ValueError, SyntaxError, TypeError):
+            continue
+        rows += [row] * len(pairs)
+        firsts += [a for a, _ in pairs]
+        seconds += [b for _, b in pairs]
+    return np.array(rows, dtype=np.int64), np.array(firsts), np.array(seconds)
+
+
+def parse_samples(df, column):
+    """ (participant IDs, unix seconds, values) of every intraday sample in `column`, sorted by participant and time. """
+    rows = df[df[column].notna() & df["ParticipantID"].notna()]
+    strings = rows[column].astype(str)
+    separator = "(" if column == "HeartRateSamples" else ":"
+    # Well-formed strings go through the bulk parser; anything else is left to literal_eval.
+    regular = strings.str.fullmatch(SAMPLE_FORMATS[column]).to_numpy(dtype=bool)
+    bulk, literal = np.flatnonzero(regular), np.flatnonzero(~regular)
+    parts = [_bulk_samples(strings.iloc[bulk], separator), _literal_samples(strings.iloc[literal])]
+    row = np.concatenate([bulk[parts[0][0]], literal[parts[1][0]]])
+    first, value = np.concatenate([parts[0][1], parts[1][1]]), np.concatenate([parts[0][2], parts[1][2]])
+    valid = ~np.isnan(first) & ~np.isnan(value)
+    row, first, value = row[valid], first[valid], value[valid]
+    if column == "HeartRateSamples":
+        seconds = first.astype(np.int64)
+    else:
+        # HRV keys are seconds since midnight of the record's day.
+        midnight = rows["RecordDate"].to_numpy().astype("datetime64[s]").astype(np.int64)
+        seconds = midnight[row] + first.astype(np.int64)
+        valid = ~np.isnat(rows["RecordDate"].to_numpy()[row])
+        row, seconds, value = row[valid], seconds[valid], value[valid]
+    ids = rows["ParticipantID"].to_numpy()[row]
+    order = np.lexsort((seconds, ids))
+    return ids[order], seconds[order], value[order]
+
+
+class _Level:
+    """ One pyramid level: per-point time, min, mean and max, grouped by participant code. """
+
+    def __init__(self, codes, times, low, mean, high, n_participants):
+        self.times, self.low, self.mean, self.high = times, low, mean, high
+        self.offsets = np.searchsorted(codes, np.arange(n_participants + 1))
+        self.codes = codes
+
+    def rollup(self, bucket, weights):
+        """ The next coarser level: min/max and count-weighted mean per (participant, bucket). """
+        start = self.times - self.times % bucket
+        boundary = np.ones(len(start), dtype=bool)
+        boundary[1:] = (start[1:] != start[:-1]) | (self.codes[1:] != self.codes[:-1])
+        heads = np.flatnonzero(boundary)
+        counts = np.add.reduceat(weights, heads) if len(heads) else weights[:0]
+        sums = np.add.reduceat(self.mean * weights, heads) if len(heads) else self.mean[:0]
+        low = np.minimum.reduceat(self.low, heads) if len(heads) else self.low[:0]
+        high = np.maximum.reduceat(self.high, heads) if len(heads) else self.high[:0]
+        level = _Level(self.codes[heads], start[heads], low, sums / np.maximum(counts, 1), high, len(self.offsets) - 1)
+        return level, counts
+
+    def window(self, code, first, last):
+        """ Slice of the participant's points with first <= time < last. """
+        begin, end = self.offsets[code], self.offsets[code + 1]
+        times = self.times[begin:end]
+        return slice(begin + np.searchsorted(times, first, side="left"), begin + np.searchsorted(times, last, side="left"))
+
+
+class IntradayPyramid:
+    """ Per-participant multi-resolution rollups of the intraday HR and HRV samples. """
+
+    def __init__(self, df, signals=SIGNALS, levels=LEVELS):
+        self.participant_ids = pd.Index(pd.unique(df["ParticipantID"].dropna()))
+        self.levels = {}
+        for signal, column in signals.items():
+            if column not in df.columns:
+                continue
+            ids, times, values = parse_samples(df, column)
+            codes = self.participant_ids.get_indexer(ids)
+            order = np.argsort(codes, kind="stable")  # already time-ordered within each participant
+            codes, times, values = codes[order], times[order], values[order]
+            level = _Level(codes, times, values, values, values, len(self.participant_ids))
+            weights = np.ones(len(values))
+            pyramid = {}
+            for name, bucket in levels.items():
+                if bucket:
+                    level, weights = level.rollup(bucket, weights)
+                pyramid[name] = level
+            self.levels[signal] = pyramid
+
+    def view(self, participant, signal, start=None, end=None, max_points=MAX_POINTS):
+        """ (level name, Timestamp/Min/Mean/Max frame) for one participant and the inclusive date range.
+
+        Picks the finest level with at most `max_points` points in the range (the coarsest otherwise).
+        """
+        pyramid = self.levels[signal]
+        code = self.participant_ids.get_indexer([participant])[0]
+        first = -np.inf if start is None else pd.Timestamp(start).normalize().value // 10**9
+        last = np.inf if end is None else (pd.Timestamp(end).normalize() + pd.Timedelta(days=1)).value // 10**9
+        if code < 0:
+            name, points = next(iter(pyramid)), slice(0, 0)
+        else:
+            for name, level in pyramid.items():
+                points = level.window(code, first, last)
+                if points.stop - points.start <= max_points:
+                    break
+        level = pyramid[name]
+        return name, pd.DataFrame({
+            "Timestamp": pd.to_datetime(level.times[points], unit="s"),
+            "Min": level.low[points],
+            "Mean": level.mean[points],
+            "Max": level.high[points],
+        })
+
+
+@st.cache_resource(show_spinner=False)
+def metrics_intraday(load, _df):
+    """ Intraday HR/HRV pyramid over the metrics frame of `load` (see startup.load_key), shared by all sessions. """
+    return IntradayPyramid(_df)
+
+
+def intraday_pyramid():
+    """ The shared intraday pyramid for the configured metrics source. """
+    return metrics_intraday(load_key("metrics"), startup_data().result("metrics"))
@@ -0,0 +1,236 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from modules.startup import load_key, startup_data
+
+# Leaderboards keep one row per calendar day and one column per participant of daily sums and
+# counts for every ranked metric, plus prefix sums over the days that are brought up to date
+# lazily after an ingest. Any date window's per-participant total is then one subtraction of two
+# prefix rows, and a top-N query is an argpartition over that participant-sized array. Prefix
+# arrays are only allocated for the metrics that are queried through them.
+# One Leaderboard over DAILY_METRICS per loaded dataset (metrics_daily) is the daily store every
+# engine reads (rankings, anomalies, sleep, forecasts, caseloads, the outcome join); each engine
+# selects the metrics it needs from it instead of building its own copy.
+# A page selection reaches the board only as its participants and date span. When the selection
+# drops some of their values inside that span (a row-level filter, a gap in the window), the board's
+# totals would be wrong, so top_participants checks that the board holds exactly the selection's
+# values and otherwise ranks from the selected rows.
+LEADERBOARD_METRICS = ["Steps", "DurationAsleep", "HeartRateAvg", "HRZonePercent"]
+DAILY_METRICS = [
+    "Steps", "DurationAsleep", "HeartRateAvg", "HRZonePercent", "RestingHeartRate", "HRV-avgHRV",
+    "DeepSleep", "LightSleep", "REMSleep", "AwakeTime", "SleepEfficiency",
+]
+DERIVED_METRICS = {"HRZonePercent": ["HRZones_Fatburn", "HRZones_Cardio", "HRZones_Peak"]}
+RANKINGS = {"Total": "total", "Daily Average": "average", "Improvement": "improvement"}
+
+
+def _metric_values(df, metric):
+    """ `metric` per row of `df`; a derived metric missing from `df` is summed from its source columns. """
+    # Loaded frames carry the derived columns already (see modules/derived.py).
+    columns = [metric] if metric in df.columns else DERIVED_METRICS.get(metric, [metric])
+    return df[columns].sum(axis=1, min_count=len(columns))
+
+
+def _grown(array, shape):
+    """ Copy of `array` zero-padded at the end to at least `shape`, growing by doubling. """
+    target = tuple(max(need, 2 * have if need > have else have) for need, have in zip(shape, array.shape))
+    if target == array.shape:
+        return array
+    grown = np.zeros(target, dtype=array.dtype)
+    grown[tuple(slice(0, n) for n in array.shape)] = array
+    return grown
+
+
+class Leaderboard:
+    """ Per-participant daily running totals, updated incrementally by ingest(). """
+
+    def __init__(self, metrics=LEADERBOARD_METRICS):
+        self.metrics = list(metrics)
+        self.participant_ids = pd.Index([], dtype="int64")
+        self.names = np.empty(0, dtype=object)
+        self.first_day = None
+        self.n_days = 0
+        self.sums = {m: np.zeros((0, 0)) for m in self.metrics}
+        self.counts = {m: np.zeros((0, 0), dtype=np.int32) for m in self.metrics}
+        self.prefix_sums = {}  # metric -> prefix rows, allocated on the metric's first window query
+        self.prefix_counts = {}
+        self._clean_days = {}  # metric -> prefix rows 0.._clean_days[metric] are up to date
+
+    @property
+    def n_participants(self):
+        return len(self.participant_ids)
+
+    def _participant_codes(self, ids, names):
+        """ Column index per row, registering participants seen for the first time. """
+        codes = self.participant_ids.get_indexer(ids)
+        new = codes < 0
+        if new.any():
+            new_ids, first = np.unique(ids[new], return_index=True)
+            self.participant_ids = self.participant_ids.append(pd.Index(new_ids))
+            self.names = np.concatenate([self.names, names[new][first]])
+            codes = self.participant_ids.get_indexer(ids)
+        return codes
+
+    def _day_codes(self, days):
+        """ Row index per calendar day, extending the day axis (both ways) as needed. """
+        low, high = days.min(), days.max()
+        shift = 0
+        if self.first_day is None:
+            self.first_day = low
+        elif low < self.first_day:
+            shift = int((self.first_day - low).astype(np.int64))
+            self.first_day = low
+            self._clean_days = dict.fromkeys(self._clean_days, 0)
+        self.n_days = max(self.n_days + shift, int((high - self.first_day).astype(np.int64)) + 1)
+        shape = (self.n_days, self.n_participants)
+        for store in (self.sums, self.counts):
+            for metric, array in store.items():
+                if shift:
+                    array = np.concatenate([np.zeros((shift, array.shape[1]), dtype=array.dtype), array])
+                store[metric] = _grown(array, shape)
+        return (days - self.first_day).astype(np.int64)
+
+    def ingest(self, df):
+        """ Adds the rows of `df` (any order, any days) to the running totals. """
+        df = df[df["RecordDate"].notna()]
+        if df.empty:
+            return self
+        ids = df["ParticipantID"].to_numpy()
+        participant = self._participant_codes(ids, df["Participant Name"].to_numpy())
+        day = self._day_codes(df["RecordDate"].to_numpy().astype("datetime64[D]"))
+        for metric in self.metrics:
+            values = _metric_values(df, metric).to_numpy(dtype=np.float64)
+            valid = ~np.isnan(values)
+            width = self.sums[metric].shape[1]
+            flat = day[valid] * width + participant[valid]
+            self.sums[metric].ravel()[:] += np.bincount(flat, weights=values[valid], minlength=self.sums[metric].size)
+            self.counts[metric].ravel()[:] += np.bincount(flat, minlength=self.counts[metric].size).astype(np.int32)
+        first = int(day.min())
+        self._clean_days = {metric: min(clean, first) for metric, clean in self._clean_days.items()}
+        return self
+
+    def _refresh(self, metric):
+        """ Brings `metric`'s prefix rows up to date from the earliest day touched since its last query. """
+        if metric not in self._clean_days:
+            self.prefix_sums[metric] = np.zeros((1, 0))
+            self.prefix_counts[metric] = np.zeros((1, 0), dtype=np.int64)
+            self._clean_days[metric] = 0
+        start = self._clean_days[metric]
+        if start >= self.n_days:
+            return
+        shape = (self.n_days + 1, self.sums[metric].shape[1])
+        self.prefix_sums[metric] = _grown(self.prefix_sums[metric], shape)
+        self.prefix_counts[metric] = _grown(self.prefix_counts[metric], shape)
+        for daily, prefix in ((self.sums[metric], self.prefix_sums[metric]), (self.counts[metric], self.prefix_counts[metric])):
+            np.cumsum(daily[start:self.n_days], axis=0, out=prefix[start + 1:self.n_days + 1])
+            prefix[start + 1:self.n_days + 1] += prefix[start]
+        self._clean_days[metric] = self.n_days
+
+    def _window(self, start, end):
+        """ [first, last) day rows covered by the inclusive date window. """
+        first = 0 if start is None else int((np.datetime64(pd.Timestamp(start), "D") - self.first_day).astype(np.int64))
+        last = self.n_days if end is None else int((np.datetime64(pd.Timestamp(end), "D") - self.first_day).astype(np.int64)) + 1
+        return min(max(first, 0), self.n_days), min(max(last, 0), self.n_days)
+
+    def _totals(self, metric, first, last):
+        n = self.n_participants
+        return self.prefix_sums[metric][last, :n] - self.prefix_sums[metric][first, :n], self.prefix_counts[metric][last, :n] - self.prefix_counts[metric][first, :n]
+
+    def window_totals(self, metric, codes, first, last):
+        """ (total, count) per participant code over its own [first, last) day rows (arrays of equal length). """
+        self._refresh(metric)
+        prefix_sums, prefix_counts = self.prefix_sums[metric], self.prefix_counts[metric]
+        return prefix_sums[last, codes] - prefix_sums[first, codes], prefix_counts[last, codes] - prefix_counts[first, codes]
+
+    def holds(self, metric, participants, start, end, n_values):
+        """ True when the board's values of `metric` for the participants (IDs) over the window number `n_values`. """
+        codes = self.participant_ids.get_indexer(participants)
+        if (codes < 0).any():
+            return False
+        self._refresh(metric)
+        first, last = self._window(start, end)
+        _, count = self.window_totals(metric, codes, first, last)
+        return int(count.sum()) == n_values
+
+    def values(self, metric, ranking="total", start=None, end=None):
+        """ One ranking value per participant for the window (NaN where undefined). """
+        self._refresh(metric)
+        first, last = self._window(start, end)
+        total, count = self._totals(metric, first, last)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if ranking == "total":
+                return total
+            if ranking == "average":
+                return np.where(count > 0, total / count, np.nan)
+            # improvement: daily average over the second half of the window minus the first half
+            middle = first + (last - first + 1) // 2
+            early_total, early_count = self._totals(metric, first, middle)
+            late_total, late_count = self._totals(metric, middle, last)
+            return np.where((early_count > 0) & (late_count > 0), late_total / late_count - early_total / early_count, np.nan)
+
+    def top(self, metric, n=10, ranking="total", participants=None, start=None, end=None):
+        """ (participant codes, values) of the top `n`, best first, among `participants` (IDs; default all). """
+        values = self.values(metric, ranking, start, end)
+        eligible = ~np.isnan(values)
+        if participants is not None:
+            chosen = np.zeros(self.n_participants, dtype=bool)
+            codes = self.participant_ids.get_indexer(participants)
+            chosen[codes[codes >= 0]] = True
+            eligible &= chosen
+        candidates = np.flatnonzero(eligible)
+        k = min(n, len(candidates))
+        if k == 0:
+            return candidates, values[candidates]
+        best = candidates[np.argpartition(-values[candidates], k - 1)[:k]]
+        best = best[np.argsort(-values[best], kind="stable")]
+        return best, values[best]
+
+
+    def daily_values(self, metric, first=0):
+        """ Day x participant matrix of `metric`'s daily values (mean of the day's rows) from day row `first`, NaN where missing. """
+        n = self.n_participants
+        counts = self.counts[metric][first:self.n_days, :n]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(counts > 0, self.sums[metric][first:self.n_days, :n] / counts, np.nan)
+
+
+@st.cache_resource(show_spinner=False)
+def metrics_daily(load, _df):
+    """ Daily store (a Leaderboard over DAILY_METRICS) of the metrics frame of `load` (see startup.load_key), shared by all sessions and engines. """
+    return Leaderboard(DAILY_METRICS).ingest(_df)
+
+
+def daily_store():
+    """ The shared daily store for the configured metrics source. """
+    return metrics_daily(load_key("metrics"), startup_data().result("metrics"))
+
+
+def _frame_values(filtered_df, metric, ranking):
+    """ One ranking value per participant name computed from the rows of `filtered_df` (NaN where undefined). """
+    values = _metric_values(filtered_df, metric)
+    names = filtered_df["Participant Name"]
+    if ranking == "total":
+        return values.groupby(names).sum()
+    if ranking == "average":
+        return values.groupby(names).mean()
+    # improvement over the same halves of the selection's date span as Leaderboard.values
+    days = filtered_df["RecordDate"].dt.normalize()
+    first, last = days.min(), days.max()
+    late = (days >= first + pd.Timedelta(days=((last - first).days + 2) // 2)).to_numpy()
+    return values[late].groupby(names[late]).mean() - values[~late].groupby(names[~late]).mean()
+
+
+def top_participants(filtered_df, metric, ranking="Total", n=10, value_name=None, scale=1):
+    """ Top-n participants of `filtered_df` as a [Participant Name, value] frame.
+
+    Served from the daily store when it holds exactly the selection's values over the selection's
+    participants and date span, and ranked from the rows of `filtered_df` otherwise.
+    """
+    board = daily_store()
+    participants, start, end = filtered_df["ParticipantID"].unique(), filtered_df["RecordDate"].min(), filtered_df["RecordDate"].max()
+    if board.holds(metric, participants, start, end, int(_metric_values(filtered_df, metric).notna().sum())):
+        codes, values = board.top(metric, n, RANKINGS[ranking], participants=participants, start=start, end=end)
+        return pd.DataFrame({"Participant Name": board.names[codes], value_name or metric: values / scale})
+    ranked = _frame_values(filtered_df, metric, RANKINGS[ranking]).dropna().sort_values(ascending=False, kind="stable").head(n)
+    return pd.DataFrame({"Participant Name": ranked.index.to_numpy(), value_name or metric: ranked.to_numpy() / scale})
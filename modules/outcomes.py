@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from modules.leaderboard import metrics_daily
+
+# Survey outcomes and wearable metrics only share ParticipantID, so relating them used to mean
+# merging two large frames on every rerun. The join is materialised once instead: one row per
+# survey submission (participant x survey x timepoint) carrying the participant's average daily
+# metrics over the WINDOW_DAYS days before the submission. The daily values are read from the
+# shared daily store (per-participant prefix sums over days, see modules/leaderboard.py), so each
+# row is a subtraction of two prefix rows, and new metric rows only recompute the submissions
+# whose window they fall into.
+ACTIVITY_METRICS = ["Steps", "DurationAsleep", "SleepEfficiency", "RestingHeartRate", "HRV-avgHRV"]
+ACTIVITY_LABELS = {"Steps": ("Steps", 1), "Sleep (hours)": ("DurationAsleep", 3600), "Sleep Efficiency (%)": ("SleepEfficiency", 1), "Resting Heart Rate": ("RestingHeartRate", 1), "HRV": ("HRV-avgHRV", 1)}
+WINDOW_DAYS = 14
+SUBMISSION_KEY = ["ParticipantID", "SurveyName", "SurveyTimepoint"]
+SUBMISSION_COLUMNS = [*SUBMISSION_KEY, "Participant Name", "SubmissionDate", "Total Score", "Outcome Category"]
+
+
+class OutcomeActivityIndex:
+    """ Survey submissions joined with each participant's wearable averages over the preceding days. """
+
+    def __init__(self, daily, metrics=ACTIVITY_METRICS, window=WINDOW_DAYS):
+        self.daily = daily  # a Leaderboard over (at least) `metrics`, shared with the other engines
+        self.metrics = list(metrics)
+        self.window = window
+        self.table = pd.DataFrame({column: [] for column in [*SUBMISSION_COLUMNS, *self.metrics, "ActivityDays"]}).astype({"SubmissionDate": "datetime64[ns]"})
+
+    def _activity(self, submissions):
+        """ {metric: window average} and ActivityDays for each submission row (NaN without data). """
+        n = len(submissions)
+        activity = {metric: np.full(n, np.nan) for metric in self.metrics}
+        activity["ActivityDays"] = np.zeros(n, dtype=np.int64)
+        codes = self.daily.participant_ids.get_indexer(submissions["ParticipantID"])
+        dates = submissions["SubmissionDate"].to_numpy().astype("datetime64[D]")
+        known = np.flatnonzero((codes >= 0) & ~np.isnat(dates))
+        if self.daily.first_day is None or not len(known):
+            return activity
+        day = (dates[known] - self.daily.first_day).astype(np.int64)
+        first, last = np.clip(day - self.window, 0, self.daily.n_days), np.clip(day, 0, self.daily.n_days)
+        for metric in self.metrics:
+            total, count = self.daily.window_totals(metric, codes[known], first, last)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                activity[metric][known] = np.where(count > 0, total / count, np.nan)
+            activity["ActivityDays"][known] = np.maximum(activity["ActivityDays"][known], count)
+        return activity
+
+    def ingest_metrics(self, df):
+        """ Refreshes the submissions whose window covers any day of wearable rows already added to the daily store. """
+        df = df[df["RecordDate"].notna()]
+        if df.empty:
+            return self
+        dates = self.table["SubmissionDate"]
+        stale = (self.table["ParticipantID"].isin(df["ParticipantID"].unique())
+                 & (dates > df["RecordDate"].min()) & (dates - pd.Timedelta(days=self.window) <= df["RecordDate"].max()))
+        if stale.any():
+            for column, values in self._activity(self.table[stale]).items():
+                self.table.loc[stale, column] = values
+        return self
+
+    def ingest_submissions(self, scores):
+        """ Adds (or replaces, by participant, survey and timepoint) submissions from a scores sheet. """
+        rows = scores[[c for c in SUBMISSION_COLUMNS if c in scores.columns]].drop_duplicates(SUBMISSION_KEY, keep="last").reset_index(drop=True)
+        rows["SubmissionDate"] = pd.to_datetime(rows["SubmissionDate"], errors="coerce")
+        for column, values in self._activity(rows).items():
+            rows[column] = values
+        if self.table.empty:
+            self.table = rows
+            return self
+        replaced = pd.MultiIndex.from_frame(self.table[SUBMISSION_KEY]).isin(pd.MultiIndex.from_frame(rows[SUBMISSION_KEY]))
+        self.table = pd.concat([self.table[~replaced], rows], ignore_index=True)
+        return self
+
+    def submissions(self, survey=None, participants=None):
+        """ Joined rows of one survey (default all) for `participants` (IDs; default all). """
+        rows = self.table
+        if survey is not None:
+            rows = rows[rows["SurveyName"] == survey]
+        if participants is not None:
+            rows = rows[rows["ParticipantID"].isin(participants)]
+        return rows
+
+    def changes(self, survey, participants=None, start="START", end="END"):
+        """ One row per participant with both timepoints: change in Total Score and in every metric's window average. """
+        rows = self.submissions(survey, participants)
+        before = rows[rows["SurveyTimepoint"] == start].set_index("ParticipantID")
+        after = rows[rows["SurveyTimepoint"] == end].set_index("ParticipantID")
+        both = before.index.intersection(after.index)
+        result = pd.DataFrame({"ParticipantID": both, "Participant Name": after.loc[both, "Participant Name"].to_numpy()})
+        for column in ["Total Score", *self.metrics]:
+            result[f"{column} Change"] = after.loc[both, column].to_numpy() - before.loc[both, column].to_numpy()
+        return result
+
+
+@st.cache_resource(show_spinner=False)
+def survey_activity(metrics_load, survey_load, _df, _scores):
+    """ Submission x activity join over the loaded metrics and survey scores, shared by all sessions. """
+    return OutcomeActivityIndex(metrics_daily(metrics_load, _df)).ingest_metrics(_df).ingest_submissions(_scores)
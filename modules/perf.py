@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+import plotly.io as pio
+import streamlit as st
+
+# Instrumentation is off unless ALTHEALTH_PERF=1 (panel + logs), ALTHEALTH_PERF_LOG=1 (logs only)
+# or the hidden `?perf=1` query parameter (panel for that session). When off, span() hands back
+# a shared no-op context manager and plotly_chart() is a straight pass-through.
+PERF_ENV = "ALTHEALTH_PERF"
+PERF_LOG_ENV = "ALTHEALTH_PERF_LOG"
+PERF_QUERY_PARAM = "perf"
+
+logger = logging.getLogger("althealth.perf")
+_local = threading.local()
+_NULL_SPAN = nullcontext()
+
+
+class RerunRecorder:
+    """ Collects the timing spans of a single script rerun. """
+
+    def __init__(self, show_panel, log):
+        self.start = time.perf_counter()
+        self.spans = []
+        self.depth = 0
+        self.show_panel = show_panel
+        self.log = log
+
+    @contextmanager
+    def span(self, name, **attrs):
+        record = {"name": name, "depth": self.depth, "start_ms": (time.perf_counter() - self.start) * 1000, **attrs}
+        self.spans.append(record)
+        self.depth += 1
+        try:
+            yield record
+        finally:
+            self.depth -= 1
+            record["duration_ms"] = (time.perf_counter() - self.start) * 1000 - record["start_ms"]
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+
+def _query_flag():
+    """ Reads the hidden ?perf=1 switch; False outside a Streamlit session. """
+    try:
+        return st.query_params.get(PERF_QUERY_PARAM) == "1"
+    except Exception:
+        return False
+
+
+def _session_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
+
+
+def begin_rerun():
+    """ Starts recording spans for this rerun if instrumentation is enabled. """
+    log = os.environ.get(PERF_ENV) == "1" or os.environ.get(PERF_LOG_ENV) == "1"
+    show_panel = os.environ.get(PERF_ENV) == "1" or _query_flag()
+    _local.recorder = RerunRecorder(show_panel, log) if (log or show_panel) else None
+    if log and not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+def span(name, **attrs):
+    """ Times the enclosed block as a named span of the current rerun (no-op when disabled). """
+    recorder = getattr(_local, "recorder", None)
+    return _NULL_SPAN if recorder is None else recorder.span(name, **attrs)
+
+
+def plotly_chart(fig, **kwargs):
+    """ st.plotly_chart with render timing and payload-size accounting when instrumentation is on. """
+    recorder = getattr(_local, "recorder", None)
+    if recorder is None:
+        return st.plotly_chart(fig, **kwargs)
+    title = fig.layout.title.text or "untitled"
+    with recorder.span(f"plotly_chart: {title}", payload_bytes=len(pio.to_json(fig, validate=False))):
+        return st.plotly_chart(fig, **kwargs)
+
+
+def end_rerun(**context):
+    """ Finishes the rerun: exports the spans as one structured log line and draws the panel. """
+    recorder = getattr(_local, "recorder", None)
+    if recorder is None:
+        return
+    _local.recorder = None
+    total_ms = recorder.elapsed_ms()
+    if recorder.log:
+        logger.info(json.dumps({"event": "rerun", "session_id": _session_id(), "total_ms": round(total_ms, 3), **context, "spans": recorder.spans}, default=str))
+    if recorder.show_panel:
+        render_panel(recorder.spans, total_ms)
+
+
+def render_panel(spans, total_ms):
+    """ Developer sidebar panel with a waterfall of this rerun's spans. """
+    import plotly.express as px
+
+    with st.sidebar.expander("⏱️ Performance (this rerun)"):
+        st.metric("Script time (ms)", round(total_ms, 1))
+        if not spans:
+            return
+        spans_df = pd.DataFrame(spans)
+        if "payload_bytes" not in spans_df.columns:
+            spans_df["payload_bytes"] = None
+        spans_df["label"] = [f"{i:02d} {'· ' * depth}{name}" for i, (depth, name) in enumerate(zip(spans_df["depth"], spans_df["name"]))]
+        fig_waterfall = px.bar(spans_df, x="duration_ms", y="label", base="start_ms", orientation="h", color="depth", hover_data=["payload_bytes"], title="Rerun Waterfall")
+        fig_waterfall.update_layout(yaxis=dict(autorange="reversed", title=None), xaxis_title="ms since rerun start", coloraxis_showscale=False, height=max(300, 22 * len(spans_df)))
+        st.plotly_chart(fig_waterfall)
+        st.metric("Chart payload (KB)", round(spans_df["payload_bytes"].fillna(0).sum() / 1024, 1))
+        st.dataframe(spans_df[["name", "start_ms", "duration_ms", "payload_bytes"]].round(2), hide_index=True)
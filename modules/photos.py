@@ -0,0 +1,138 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+import streamlit as st
+from PIL import Image
+from requests.adapters import HTTPAdapter
+
+# Physician/participant photos are fetched once per URL over a pooled HTTP session, shrunk to
+# thumbnails and kept in a size-bounded on-disk LRU cache, so re-rendering a profile never hits
+# the network again. Location and size limit are configurable through the environment. A URL that
+# fails is not fetched again until its backoff (doubling per consecutive failure, capped) expires.
+PHOTO_CACHE_DIR_ENV = "ALTHEALTH_PHOTO_CACHE_DIR"
+PHOTO_CACHE_MB_ENV = "ALTHEALTH_PHOTO_CACHE_MB"
+DEFAULT_CACHE_MB = 64
+FETCH_TIMEOUT = 10
+POOL_SIZE = 16
+RETINA_SCALE = 2  # store thumbnails at 2x the display width so they stay sharp on HiDPI screens
+RETRY_SECONDS = 30  # backoff after a URL's first failed fetch
+MAX_RETRY_SECONDS = 3600
+
+
+def make_session(pool_size=POOL_SIZE):
+    """ requests session with a connection pool sized for concurrent page renders. """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=2)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class PhotoCache:
+    """ Fetches photo URLs once and serves resized thumbnails from a disk LRU cache. """
+
+    def __init__(self, cache_dir, max_bytes, session=None, timeout=FETCH_TIMEOUT, retry_seconds=RETRY_SECONDS, max_retry_seconds=MAX_RETRY_SECONDS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.session = session or make_session()
+        self.timeout = timeout
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self.stats = {"hits": 0, "misses": 0, "errors": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # file name -> size in bytes, least recently used first
+        self._failed = {}  # URL -> (consecutive failures, monotonic time before which it is not fetched again)
+        os.makedirs(cache_dir, exist_ok=True)
+        for entry in sorted(os.scandir(cache_dir), key=lambda e: e.stat().st_mtime):
+            if entry.is_file() and entry.name.endswith(".png"):
+                self._entries[entry.name] = entry.stat().st_size
+
+    @property
+    def size_bytes(self):
+        return sum(self._entries.values())
+
+    @staticmethod
+    def key(url, width):
+        return hashlib.sha1(f"{url}|{width}".encode()).hexdigest() + ".png"
+
+    def thumbnail(self, url, width):
+        """ Returns PNG bytes of the photo at `url` scaled to `width` px, or None if it can't be fetched. """
+        name = self.key(url, width)
+        path = os.path.join(self.cache_dir, name)
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                self.stats["hits"] += 1
+                try:
+                    with open(path, "rb") as f:
+                        return f.read()
+                except OSError:
+                    del self._entries[name]
+            if url in self._failed and time.monotonic() < self._failed[url][1]:
+                return None
+            self.stats["misses"] += 1
+
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            data = self._resize(response.content, width * RETINA_SCALE)
+        except (requests.RequestException, OSError):
+            with self._lock:
+                self.stats["errors"] += 1
+                failures = self._failed.get(url, (0, 0))[0] + 1
+                backoff = min(self.retry_seconds * 2 ** (failures - 1), self.max_retry_seconds)
+                self._failed[url] = (failures, time.monotonic() + backoff)
+            return None
+
+        with self._lock:
+            self._failed.pop(url, None)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._entries[name] = len(data)
+            self._entries.move_to_end(name)
+            self._evict()
+        return data
+
+    @staticmethod
+    def _resize(content, max_width):
+        image = Image.open(io.BytesIO(content))
+        image.thumbnail((max_width, max_width * 4))
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        out = io.BytesIO()
+        image.save(out, format="PNG", optimize=True)
+        return out.getvalue()
+
+    def _evict(self):
+        """ Drops least recently used thumbnails until the cache fits its byte budget. """
+        total = sum(self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            total -= size
+            self.stats["evictions"] += 1
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+
+@st.cache_resource
+def get_photo_cache():
+    """ Process-wide photo cache shared by all sessions. """
+    cache_dir = os.environ.get(PHOTO_CACHE_DIR_ENV, os.path.join(tempfile.gettempdir(), "althealth_photos"))
+    max_bytes = int(float(os.environ.get(PHOTO_CACHE_MB_ENV, DEFAULT_CACHE_MB)) * 1024 * 1024)
+    return PhotoCache(cache_dir, max_bytes)
+
+
+def show_photo(url, width, caption=None):
+    """ st.image for a profile photo, served from the thumbnail cache (falls back to the remote URL). """
+    thumbnail = get_photo_cache().thumbnail(url, width)
+    st.image(thumbnail if thumbnail is not None else url, width=width, caption=caption)
@@ -0,0 +1,147 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+from modules.filters import FilterCascade, _no_filter, metrics_filter_index
+from modules.startup import load_key
+
+# Every rerun of a metric page logs the view it showed as a canonical query: the page, the sidebar
+# cascade's active predicates, the page's own physician/participant selections and its trend
+# interval, serialised as sorted JSON so equal views share one key. Counts are kept per process
+# and saved to a JSON file (ALTHEALTH_QUERY_LOG) at most every SAVE_INTERVAL seconds, so they
+# outlive the data refresh that empties the caches. After a dataset loads, the warm-up replays the
+# TOP_K most frequent queries through the same cascade and page functions a session would use, so
+# the cached aggregates and figures of the popular views are built before anyone asks for them.
+QUERY_LOG_ENV = "ALTHEALTH_QUERY_LOG"
+PREWARM_TOP_K_ENV = "ALTHEALTH_PREWARM_TOP_K"
+PREWARM_SECONDS_ENV = "ALTHEALTH_PREWARM_SECONDS"
+PREWARM_CPU_SECONDS_ENV = "ALTHEALTH_PREWARM_CPU_SECONDS"
+DEFAULT_TOP_K = 20
+DEFAULT_SECONDS = 60
+DEFAULT_CPU_SECONDS = 30
+SAVE_INTERVAL = 30
+MAX_QUERIES = 1000  # least frequent queries are dropped beyond this
+QUERY_PAGES = {"Steps Analysis": "steps", "Sleep Analysis": "sleep", "Heart Rate Analysis": "hr"}  # page -> widget key suffix
+PAGE_FILTERS = [("org_filter", "OrganizationName"), ("physician_filter", "PhysicianName"), ("participant_filter", "Participant Name")]
+DATE_COLUMNS = ["RecordDate"]
+
+
+def _encode(value):
+    return value.strftime("%Y-%m-%d") if isinstance(value, pd.Timestamp) else value
+
+
+def cascade_filters(predicates):
+    """ Canonical, JSON-ready form of the cascade's active predicates. """
+    return [[kind, column, *map(_encode, args)] for kind, column, *args in predicates if not _no_filter((kind, column, *args))]
+
+
+def selection_query(filters):
+    """ Figure-cache query of a sidebar selection: the metrics load and its canonical filters. """
+    return (load_key("metrics"), filters)
+
+
+def replay_query(query):
+    """ The figure-cache query a logged view's page builds: the selection narrowed by its page filters. """
+    page_filters = dict(query["page_filters"])
+    return (*selection_query(query["filters"]), *(page_filters.get(column, "All") for _, column in PAGE_FILTERS))
+
+
+def view_query(page, predicates, state):
+    """ Canonical key of a metric page view: cascade predicates plus the page's widget values in `state`. """
+    suffix = QUERY_PAGES[page]
+    filters = cascade_filters(predicates)
+    page_filters = [[column, state[f"{key}_{suffix}"]] for key, column in PAGE_FILTERS if state.get(f"{key}_{suffix}", "All") != "All"]
+    query = {"page": page, "filters": filters, "page_filters": page_filters, "interval": state.get(f"time_interval_{suffix}", "Daily")}
+    return json.dumps(query, sort_keys=True, default=str)
+
+
+def query_frame(df, query):
+    """ The rows `query`'s view hands its page functions: the cascade's frame narrowed by the page's own filters. """
+    cascade = FilterCascade(metrics_filter_index(load_key("metrics"), df))
+    for kind, column, *args in query["filters"]:
+        cascade.apply((kind, column, *(pd.Timestamp(arg) if column in DATE_COLUMNS and arg is not None else arg for arg in args)))
+    frame = cascade.frame()
+    for column, value in query["page_filters"]:
+        frame = frame[frame[column] == value]
+    return frame
+
+
+class QueryLog:
+    """ Frequencies of canonical view queries, persisted to a JSON file. """
+
+    def __init__(self, path, save_interval=SAVE_INTERVAL, max_queries=MAX_QUERIES):
+        self.path = path
+        self.save_interval = save_interval
+        self.max_queries = max_queries
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._saved = time.monotonic()
+        try:
+            with open(path) as f:
+                self.counts = {key: int(count) for key, count in json.load(f).items()}
+        except (OSError, ValueError, AttributeError):
+            pass  # no log yet, or an unreadable one: start counting afresh
+
+    def record(self, key):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            due = time.monotonic() - self._saved >= self.save_interval
+        if due:
+            self.save()
+
+    def top(self, k):
+        """ The `k` most frequent queries, decoded, most frequent first. """
+        with self._lock:
+            keys = sorted(self.counts, key=self.counts.get, reverse=True)[:k]
+        return [json.loads(key) for key in keys]
+
+    def save(self):
+        """ Writes the counts atomically (trimmed to the most frequent max_queries). """
+        with self._lock:
+            keep = sorted(self.counts, key=self.counts.get, reverse=True)[:self.max_queries]
+            self.counts = {key: self.counts[key] for key in keep}
+            payload = json.dumps(self.counts)
+            self._saved = time.monotonic()
+        directory = os.path.dirname(self.path) or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, suffix=".tmp") as f:
+                f.write(payload)
+            os.replace(f.name, self.path)
+        except OSError:
+            pass  # the log is an optimisation; an unwritable location only loses the counts
+
+
+@st.cache_resource(show_spinner=False)
+def query_log():
+    """ Process-wide query log at ALTHEALTH_QUERY_LOG (default: the temp directory). """
+    return QueryLog(os.environ.get(QUERY_LOG_ENV, os.path.join(tempfile.gettempdir(), "althealth_queries.json")))
+
+
+def record_view(page, cascade, state):
+    """ Logs the view a metric page rerun showed, given the session's completed cascade and widget state. """
+    query_log().record(view_query(page, [predicate for predicate, _ in cascade.levels], state))
+
+
+def prewarm_budget():
+    """ (top_k, wall seconds, CPU seconds) of the query replay, from the environment. """
+    return (int(os.environ.get(PREWARM_TOP_K_ENV, DEFAULT_TOP_K)),
+            float(os.environ.get(PREWARM_SECONDS_ENV, DEFAULT_SECONDS)),
+            float(os.environ.get(PREWARM_CPU_SECONDS_ENV, DEFAULT_CPU_SECONDS)))
+
+
+def replay_queries(queries, replay, seconds, cpu_seconds):
+    """ Calls replay(query) for each query in order until either budget is spent; returns how many ran. """
+    wall, cpu = time.perf_counter(), time.thread_time()
+    done = 0
+    for query in queries:
+        if time.perf_counter() - wall >= seconds or time.thread_time() - cpu >= cpu_seconds:
+            break
+        replay(query)
+        done += 1
+    return done
@@ -0,0 +1,40 @@
+import os
+
+import streamlit as st
+
+from modules.perf import span
+
+# Lazy mode renders each section inside its own expander and only computes it while the
+# expander is open. Each section runs as a fragment, so opening one, or changing a widget that
+# lives inside it (e.g. the time-interval radio), reruns that section alone. The sidebar toggle
+# defaults to ALTHEALTH_LAZY_SECTIONS (on unless set to "0").
+LAZY_SECTIONS_ENV = "ALTHEALTH_LAZY_SECTIONS"
+
+
+def lazy_mode(page_key):
+    """ Sidebar switch between on-demand sections and the classic top-to-bottom page. """
+    default = os.environ.get(LAZY_SECTIONS_ENV, "1") != "0"
+    return st.sidebar.toggle("⚡ Load sections on demand", value=default, key=f"lazy_sections_{page_key}")
+
+
+@st.fragment
+def _lazy_section(key, title, render, filtered_df, query, expanded):
+    """ One on-demand section: an expander whose body is only computed while it is open. """
+    section = st.expander(title, expanded=expanded, key=key, on_change="rerun")
+    if section.open:
+        with section, span(title):
+            render(filtered_df, query)
+
+
+def render_sections(page_key, sections, filtered_df, lazy, query=None):
+    """ Renders (title, render_fn(filtered_df, query)) sections eagerly, or lazily with only the first one open.
+
+    `query` is the figure-cache query of `filtered_df` (see modules/figures.py), or None.
+    """
+    for i, (title, render) in enumerate(sections):
+        if lazy:
+            _lazy_section(f"section_{page_key}_{i}", title, render, filtered_df, query, expanded=(i == 0))
+        else:
+            with span(title):
+                st.subheader(title)
+                render(filtered_df, query)
@@ -0,0 +1,313 @@
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Distinct counts (participants, programs, cohorts, ...) are not additive, so they can't be rolled
+# up from per-group sums. A DistinctCube keeps, for every cell (one combination of the filter
+# dimensions), a mergeable sketch of the entities seen in that cell: an exact bitset over the
+# entity's integer codes, or optionally a HyperLogLog (ALTHEALTH_DISTINCT_SKETCH=hll). Any filter
+# combination is answered by merging the sketches of the matching cells instead of rescanning and
+# hashing the raw rows.
+DISTINCT_SKETCH_ENV = "ALTHEALTH_DISTINCT_SKETCH"
+HLL_PRECISION = 12
+
+METRICS_DIMENSIONS = ["OrganizationName", "CohortName", "ProgramName", "ParticipantGender", "Ethnicity", "AgeGroup", "City"]
+METRICS_ENTITIES = {
+    "participants": "ParticipantID",
+    "programs": ("OrganizationName", "ProgramName"),
+    "cohorts": "CohortName",
+    "cities": "City",
+}
+SURVEY_DIMENSIONS = ["OrganizationName", "CohortName", "PhysicianName", "ProgramName", "Participant Name", "ParticipantGender", "Ethnicity", "AgeGroup", "City", "SurveyName", "SurveyTimepoint"]
+SURVEY_ENTITIES = {
+    "participants": "ParticipantID",
+    "surveys": "SurveyName",
+    "submissions": ("ParticipantID", "SurveyName", "SurveyTimepoint"),
+    "cohorts": "CohortName",
+    "programs": ("OrganizationName", "CohortName", "ProgramName"),
+    "physicians": ("OrganizationName", "PhysicianName"),
+}
+
+
+class BitsetSketch:
+    """ Exact set of integer codes in [0, size), packed 64 per word. Merges with |, intersects with &. """
+
+    def __init__(self, size, words=None):
+        self.size = size
+        self.words = np.zeros((size + 63) // 64, dtype=np.uint64) if words is None else words
+
+    @classmethod
+    def from_mask(cls, mask):
+        padded = np.zeros(((len(mask) + 63) // 64) * 64, dtype=bool)
+        padded[:len(mask)] = mask
+        return cls(len(mask), np.packbits(padded, bitorder="little").view(np.uint64))
+
+    @classmethod
+    def from_codes(cls, size, codes):
+        mask = np.zeros(size, dtype=bool)
+        mask[codes] = True
+        return cls.from_mask(mask)
+
+    def __or__(self, other):
+        return BitsetSketch(self.size, self.words | other.words)
+
+    def __and__(self, other):
+        return BitsetSketch(self.size, self.words & other.words)
+
+    def mask(self):
+        return np.unpackbits(self.words.view(np.uint8), bitorder="little", count=self.size).astype(bool)
+
+    def count(self):
+        return int(np.bitwise_count(self.words).sum())
+
+
+def _hll_estimate(registers):
+    """ HyperLogLog cardinality estimate for each row of registers (with the small-range correction). """
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.exp2(-registers.astype(np.float64)).sum(axis=-1)
+    zeros = np.count_nonzero(registers == 0, axis=-1)
+    small = (raw <= 2.5 * m) & (zeros > 0)
+    return np.where(small, m * np.log(m / np.maximum(zeros, 1)), raw)
+
+
+class HyperLogLog:
+    """ Approximate distinct counter with 2**p registers (~1.6% error at p=12). Merges with |. """
+
+    def __init__(self, p=HLL_PRECISION, registers=None):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8) if registers is None else registers
+
+    @staticmethod
+    def updates(values, p=HLL_PRECISION):
+        """ (register index, rank) of each value's 64-bit hash. """
+        hashes = pd.util.hash_array(np.asarray(values))
+        index = (hashes >> np.uint64(64 - p)).astype(np.intp)
+        rest = hashes & np.uint64((1 << (64 - p)) - 1)
+        bit_length = np.where(rest > 0, np.frexp(rest.astype(np.float64))[1], 0)
+        return index, ((64 - p) - bit_length + 1).astype(np.uint8)
+
+    @classmethod
+    def from_values(cls, values, p=HLL_PRECISION):
+        sketch = cls(p)
+        index, rank = cls.updates(values, p)
+        np.maximum.at(sketch.registers, index, rank)
+        return sketch
+
+    def __or__(self, other):
+        return HyperLogLog(self.p, np.maximum(self.registers, other.registers))
+
+    def count(self):
+        return int(round(float(_hll_estimate(self.registers))))
+
+
+def cell_index(df, dimensions):
+    """ (cell per row, number of cells, {dimension: code per cell}, {dimension: sorted categories}).
+
+    A cell is one observed combination of the dimension values. Its key is kept as sorted category
+    codes per dimension (-1 = missing), so selection and grouping stay in numpy.
+    """
+    cell_of_row = df.groupby(list(dimensions), dropna=False, sort=False).ngroup().to_numpy()
+    n_cells = int(cell_of_row.max()) + 1 if len(df) else 0
+    first_rows = np.unique(cell_of_row, return_index=True)[1]
+    cell_codes, categories = {}, {}
+    for column in dimensions:
+        cell_codes[column], categories[column] = pd.factorize(df[column].iloc[first_rows], sort=True)
+    return cell_of_row, n_cells, cell_codes, categories
+
+
+def select_cells(n_cells, cell_codes, categories, selection):
+    """ Boolean mask of the cells matching {dimension: value}. """
+    mask = np.ones(n_cells, dtype=bool)
+    for column, value in selection.items():
+        mask &= cell_codes[column] == categories[column].get_indexer([value])[0]
+    return mask
+
+
+def _entity_codes(df, columns):
+    """ Dense integer code per row for a column or column tuple; -1 where any part is missing. """
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    codes = df.groupby(columns, sort=False).ngroup()
+    return codes.fillna(-1).to_numpy(dtype=np.int64), int(codes.max()) + 1 if len(codes) and codes.max() >= 0 else 0
+
+
+class DistinctCube:
+    """ Per-cell distinct-count sketches over the filter dimensions of a frame.
+
+    `entities` maps a name to the column (or tuple of columns) whose distinct values are counted.
+    Filters that are not cube dimensions (slider ranges on `range_columns`, a date window on
+    `time_column`) are applied as a restriction on `participant_entity`; that is exact only while
+    every participant's dimension and range values are constant, which is checked at build time.
+    Queries return None when they can't be answered exactly and no fallback frame is given.
+    """
+
+    def __init__(self, df, dimensions, entities, kind="bitset", participant_entity=None, range_columns=(), time_column=None):
+        self.dimensions = list(dimensions)
+        self.entity_columns = dict(entities)
+        self.kind = kind
+        self.participant_entity = participant_entity
+
+        cell_of_row, self.n_cells, self.cell_codes, self.categories = cell_index(df, self.dimensions)
+
+        # Sparse per-cell bitsets: the sorted entity codes present in cell c are members[offsets[c]:offsets[c + 1]].
+        self.entities = {}
+        row_codes = {}
+        for name, columns in self.entity_columns.items():
+            codes, size = _entity_codes(df, columns)
+            row_codes[name] = codes
+            valid = codes >= 0
+            pairs = np.unique(cell_of_row[valid].astype(np.int64) * max(size, 1) + codes[valid])
+            pair_cells, members = pairs // max(size, 1), pairs % max(size, 1)
+            entity = {"size": size, "members": members, "member_cell": pair_cells, "offsets": np.searchsorted(pair_cells, np.arange(self.n_cells + 1))}
+            if kind == "hll":
+                entity["registers"] = np.zeros((self.n_cells, 1 << HLL_PRECISION), dtype=np.uint8)
+                index, rank = HyperLogLog.updates(members)
+                np.maximum.at(entity["registers"], (pair_cells, index), rank)
+            self.entities[name] = entity
+
+        self.exact = True
+        if participant_entity is not None:
+            participants = row_codes[participant_entity]
+            n = self.entities[participant_entity]["size"]
+            per_participant = pd.DataFrame({"participant": participants, "cell": cell_of_row, **{c: df[c].to_numpy() for c in range_columns}})
+            self.exact = bool((participants >= 0).all()) and (len(df) == 0 or int(per_participant.groupby("participant").nunique(dropna=False).max().max()) <= 1)
+            first = np.unique(participants, return_index=True)
+            first_rows = first[1][first[0] >= 0]
+            self.range_values = {c: df[c].to_numpy(dtype=np.float64)[first_rows] for c in range_columns}
+            self.time_bits = None
+            if time_column is not None:
+                # One packed participant bitset per distinct timestamp; missing timestamps are never in a window.
+                times = df[time_column].to_numpy()
+                has_time = ~pd.isna(times) & (participants >= 0)
+                self.times, time_codes = np.unique(times[has_time], return_inverse=True)
+                seen = np.zeros((len(self.times), ((n + 63) // 64) * 64), dtype=bool)
+                seen[time_codes, participants[has_time]] = True
+                self.time_bits = np.packbits(seen, axis=1, bitorder="little").view(np.uint64)
+
+    def select(self, selection):
+        """ Boolean mask of the cells matching {dimension: value}. """
+        return select_cells(self.n_cells, self.cell_codes, self.categories, selection)
+
+    def restriction(self, ranges=None, time_range=None):
+        """ Participants within every (low, high) range whose records fall inside `time_range` (inclusive). """
+        n = self.entities[self.participant_entity]["size"]
+        passed = np.ones(n, dtype=bool)
+        for column, (low, high) in (ranges or {}).items():
+            values = self.range_values[column]
+            passed &= (values >= low) & (values <= high)
+        sketch = BitsetSketch.from_mask(passed)
+        if time_range is not None and self.time_bits is not None:
+            start = np.searchsorted(self.times, pd.Timestamp(time_range[0]).to_datetime64(), side="left")
+            end = np.searchsorted(self.times, pd.Timestamp(time_range[1]).to_datetime64(), side="right")
+            window = np.bitwise_or.reduce(self.time_bits[start:end], axis=0) if end > start else np.zeros_like(sketch.words)
+            sketch = sketch & BitsetSketch(n, window)
+        return sketch
+
+    def _cells(self, selection, restriction):
+        """ Selected cells that still hold a participant after the restriction, or None if that can't be exact. """
+        mask = self.select(selection)
+        if restriction is None:
+            return mask
+        entity = self.entities[self.participant_entity]
+        if restriction.count() == entity["size"]:
+            return mask
+        if not self.exact or self.kind == "hll":
+            return None
+        hits = np.concatenate([[0], np.cumsum(restriction.mask()[entity["members"]])])
+        return mask & (hits[entity["offsets"][1:]] > hits[entity["offsets"][:-1]])
+
+    def _merge(self, name, cell_mask, restriction):
+        """ Distinct count of `name` over the cells in `cell_mask`. """
+        entity = self.entities[name]
+        if self.kind == "hll":
+            return int(round(float(_hll_estimate(entity["registers"][cell_mask].max(axis=0, initial=0)))))
+        sketch = BitsetSketch.from_codes(entity["size"], entity["members"][cell_mask[entity["member_cell"]]])
+        if restriction is not None and name == self.participant_entity:
+            sketch = sketch & restriction
+        return sketch.count()
+
+    def totals(self, selection, restriction=None, fallback_df=None):
+        """ {entity: distinct count} for a filter selection (and optional participant restriction). """
+        cells = self._cells(selection, restriction)
+        if cells is None:
+            return None if fallback_df is None else {name: raw_distinct(fallback_df, columns) for name, columns in self.entity_columns.items()}
+        return {name: self._merge(name, cells, restriction) for name in self.entities}
+
+    def count_by(self, group_columns, name, selection, restriction=None, fallback_df=None, value_name=None):
+        """ Distinct count of `name` per group, shaped like `df.groupby(group_columns)[col].nunique().reset_index()`. """
+        value_name = value_name or name
+        cells = self._cells(selection, restriction)
+        if cells is None:
+            if fallback_df is None:
+                return None
+            return raw_distinct_by(fallback_df, group_columns, self.entity_columns[name]).rename(columns={"count": value_name})
+        # Group the selected cells by their (sorted) key codes, dropping missing keys like groupby does.
+        selected = np.flatnonzero(cells)
+        keys = [self.cell_codes[column][selected] for column in group_columns]
+        present = np.logical_and.reduce([k >= 0 for k in keys])
+        selected, keys = selected[present], [k[present] for k in keys]
+        shape = [len(self.categories[column]) for column in group_columns]
+        groups, group_of = np.unique(np.ravel_multi_index(keys, shape), return_inverse=True)
+
+        entity = self.entities[name]
+        if self.kind == "hll":
+            order = np.argsort(group_of, kind="stable")
+            starts = np.searchsorted(group_of[order], np.arange(len(groups)))
+            counts = np.rint(_hll_estimate(np.maximum.reduceat(entity["registers"][selected[order]], starts, axis=0))) if len(groups) else np.zeros(0)
+        else:
+            # Union of each group's cell bitsets: distinct (group, member) pairs.
+            cell_group = np.full(self.n_cells, -1)
+            cell_group[selected] = group_of
+            member_group = cell_group[entity["member_cell"]]
+            keep = member_group >= 0
+            if restriction is not None and name == self.participant_entity:
+                keep &= restriction.mask()[entity["members"]]
+            size = max(entity["size"], 1)
+            pairs = np.unique(member_group[keep] * size + entity["members"][keep])
+            counts = np.bincount(pairs // size, minlength=len(groups))
+        key_codes = np.unravel_index(groups, shape)
+        columns = {column: self.categories[column].take(codes) for column, codes in zip(group_columns, key_codes)}
+        return pd.DataFrame({**columns, value_name: counts.astype(np.int64)})
+
+
+def raw_distinct(df, columns):
+    """ Reference distinct count straight from the rows. """
+    if isinstance(columns, str):
+        return df[columns].nunique()
+    return df.groupby(list(columns)).ngroups
+
+
+def raw_distinct_by(df, group_columns, columns):
+    """ Reference per-group distinct count straight from the rows (column `count`). """
+    if isinstance(columns, str):
+        return df.groupby(group_columns)[columns].nunique().reset_index(name="count")
+    used = list(dict.fromkeys([*group_columns, *columns]))
+    return df[used].dropna(subset=list(columns)).drop_duplicates().groupby(group_columns).size().reset_index(name="count")
+
+
+def sketch_kind():
+    return "hll" if os.environ.get(DISTINCT_SKETCH_ENV) == "hll" else "bitset"
+
+
+def build_metrics_cube(df, kind="bitset"):
+    """ Cube over the main sidebar dimensions; weight/height sliders and the date window are restrictions. """
+    return DistinctCube(df, METRICS_DIMENSIONS, METRICS_ENTITIES, kind=kind, participant_entity="participants", range_columns=("WeightKg", "HeightCm"), time_column="RecordDate")
+
+
+def build_survey_cube(df, kind="bitset"):
+    """ Cube over the survey page filters. """
+    return DistinctCube(df, SURVEY_DIMENSIONS, SURVEY_ENTITIES, kind=kind)
+
+
+@st.cache_resource(show_spinner=False)
+def metrics_cube(load, _df):
+    """ Distinct-count cube of the metrics frame of `load` (see startup.load_key), shared by all sessions. """
+    return build_metrics_cube(_df, sketch_kind())
+
+
+@st.cache_resource(show_spinner=False)
+def survey_cube(load, _df):
+    """ Distinct-count cube of the survey responses of `load` (see startup.load_key), shared by all sessions. """
+    return build_survey_cube(_df, sketch_kind())
@@ -1,119 +1,174 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+from modules.perf import span, plotly_chart
+from modules.figures import chart, extend_query, figure
+from modules.photos import show_photo
+from modules.sections import lazy_mode, render_sections
+from modules.leaderboard import RANKINGS, top_participants
+from modules.export import export_controls
+from modules.sleep_metrics import GROUP_COLUMNS, SLEEP_WINDOW_DAYS, sleep_engine
+from modules.forecasts import add_projection, projection_caption, selection_band
+from modules.bootstrap import group_intervals, interval_caption
 
 @st.cache_data
 def aggregate_sleep(filtered_df, time_interval):
-    """ Aggregates sleep duration (converted to hours) based on selected time interval. """
-    filtered_df["DurationAsleepHours"] = filtered_df["DurationAsleep"] / 3600  # Convert to hours
+    """ Aggregates sleep duration (in hours, a derived column of the loaded frame) based on selected time interval. """
     if time_interval == "Weekly" and "Week" in filtered_df.columns:
         return filtered_df.groupby("Week")["DurationAsleepHours"].mean().reset_index(), "Week"
     elif time_interval == "Monthly" and "Month" in filtered_df.columns:
         return filtered_df.groupby("Month")["DurationAsleepHours"].mean().reset_index(), "Month"
     return filtered_df.groupby("RecordDate")["DurationAsleepHours"].mean().reset_index(), "RecordDate"
 
-def show_page(filtered_df):
-    """ Displays the Sleep Analysis Page with hierarchical filtering and sleep duration in hours. """
-    if filtered_df.empty:
-        st.warning("⚠️ No data available for the selected filters.")
-        return
-    filtered_df = filtered_df.copy()
-    filtered_df["DurationAsleepHours"] = filtered_df["DurationAsleep"] / 3600  # Convert to hours
-
-    # ---- Hierarchical Filters ----
-    st.sidebar.header("🔍 Filter Selection")
-
-    # 1️⃣ Organization Filter (Unique Key)
-    org_filter = st.sidebar.selectbox("Select Organization", ["All"] + list(filtered_df["OrganizationName"].dropna().unique()), key="org_filter_sleep")
-    if org_filter != "All":
-        filtered_df = filtered_df[filtered_df["OrganizationName"] == org_filter]
-
-    # 2️⃣ Physician Filter (Dependent on Organization)
-    physician_list = filtered_df["PhysicianName"].dropna().unique()
-    physician_filter = st.sidebar.selectbox("Select Physician", ["All"] + list(physician_list), key="physician_filter_sleep")
-    if physician_filter != "All":
-        filtered_df = filtered_df[filtered_df["PhysicianName"] == physician_filter]
-
-    # 3️⃣ Participant Filter (Dependent on Physician)
-    participant_list = filtered_df["Participant Name"].dropna().unique()
-    participant_filter = st.sidebar.selectbox("Select Participant", ["All"] + list(participant_list), key="participant_filter_sleep")
-    if participant_filter != "All":
-        filtered_df = filtered_df[filtered_df["Participant Name"] == participant_filter]
-
-    # ---- Display Selected Profiles ----
-    st.subheader("👤 Selected Profiles")
-    col1, col2 = st.columns(2)
-
-    if physician_filter != "All":
-        physician_photo_url = filtered_df["PhysicianPhoto"].dropna().iloc[0].strip("'")
-        with col1:
-            st.image(physician_photo_url, width=150, caption=f"Physician: {physician_filter}")
-
-    if participant_filter != "All":
-        participant_photo_url = filtered_df["ParticipantPhotoURL"].dropna().iloc[0].strip("'")
-        with col2:
-            st.image(participant_photo_url, width=150, caption=f"Participant: {participant_filter}")
+def trend_figure(filtered_df, time_interval, query=None):
+    """ Average sleep hours line chart at the given interval (also replayed by the query-log prewarm). """
+    with span("aggregate_sleep (cache_data)"):
+        grouped_df, x_col = aggregate_sleep(filtered_df, time_interval)
+    return figure("line", grouped_df, extend_query(query, time_interval), x=x_col, y="DurationAsleepHours", title=f"Average Sleep Duration ({time_interval}) in Hours")
 
+# ---- Page Sections ----
+def sleep_trends(filtered_df, query):
+    """ Average sleep duration over time at the selected aggregation level. """
     # ---- User selection for aggregation level ----
-    time_interval = st.radio("Select Time Interval", ["Daily", "Weekly", "Monthly"], horizontal=True)
+    time_interval = st.radio("Select Time Interval", ["Daily", "Weekly", "Monthly"], horizontal=True, key="time_interval_sleep")
 
     # Ensure the filtered dataset is used for calculations
-    grouped_df, x_col = aggregate_sleep(filtered_df, time_interval)
-
-    # ---- Sleep Trends Visualization ----
-    st.subheader("😴 Sleep Duration Trends")
-    fig_sleep = px.line(grouped_df, x=x_col, y="DurationAsleepHours", title=f"Average Sleep Duration ({time_interval}) in Hours")
-    st.plotly_chart(fig_sleep)
-
-    # ---- Sleep Efficiency ----
-    st.subheader("⚡ Sleep Efficiency")
+    fig = trend_figure(filtered_df, time_interval, query)
+    band = selection_band(filtered_df, "DurationAsleep", scale=3600) if time_interval == "Daily" else None
+    if band is not None:
+        add_projection(fig, band, "Projected Sleep (hours)")
+    plotly_chart(fig)
+    if band is not None:
+        st.caption(projection_caption(band))
+
+def sleep_efficiency(filtered_df, query):
+    """ Mean sleep efficiency tile. """
     avg_sleep_efficiency = filtered_df["SleepEfficiency"].mean()
     st.metric("Average Sleep Efficiency (%)", round(avg_sleep_efficiency, 2))
 
-    # ---- Sleep Stages Breakdown ----
-    st.subheader("🌙 Sleep Stages Breakdown (Hours)")
+def sleep_stage_breakdown(filtered_df, query):
+    """ Average time spent in each sleep stage. """
     sleep_stages = filtered_df[["DeepSleep", "LightSleep", "REMSleep", "AwakeTime"]].mean() / 3600  # Convert to hours
     sleep_stages_df = pd.DataFrame({"Stage": sleep_stages.index, "Duration (Hours)": sleep_stages.values})
-    fig_sleep_stages = px.pie(sleep_stages_df, names="Stage", values="Duration (Hours)", title="Average Time Spent in Each Sleep Stage")
-    st.plotly_chart(fig_sleep_stages)
-
-    # ---- Sleep Duration Distribution ----
-    st.subheader("📊 Sleep Duration Distribution")
-    fig_sleep_dist = px.histogram(filtered_df, x="DurationAsleepHours", title="Distribution of Sleep Duration (Histogram in Hours)", nbins=20)
-    st.plotly_chart(fig_sleep_dist)
-
-    # ---- Sleep by Organization ----
-    st.subheader("🏢 Sleep Duration by Organization")
-    org_sleep = filtered_df.groupby("OrganizationName")["DurationAsleepHours"].mean().reset_index()
-    fig_org_sleep = px.bar(org_sleep, x="OrganizationName", y="DurationAsleepHours", color="OrganizationName", title="Average Sleep Duration per Organization (Hours)")
-    st.plotly_chart(fig_org_sleep)
-
-    # ---- Sleep by Age Group ----
-    st.subheader("👥 Sleep by Age Group")
-    age_sleep = filtered_df.groupby("AgeGroup")["DurationAsleepHours"].mean().reset_index()
-    fig_age_sleep = px.bar(age_sleep, x="AgeGroup", y="DurationAsleepHours", color="AgeGroup", title="Average Sleep Duration per Age Group (Hours)")
-    st.plotly_chart(fig_age_sleep)
-
-    # ---- Sleep by Gender ----
-    st.subheader("⚤ Sleep by Gender")
-    gender_sleep = filtered_df.groupby("ParticipantGender")["DurationAsleepHours"].mean().reset_index()
-    fig_gender_sleep = px.bar(gender_sleep, x="ParticipantGender", y="DurationAsleepHours", color="ParticipantGender", title="Average Sleep Duration per Gender (Hours)")
-    st.plotly_chart(fig_gender_sleep)
-
-    # ---- Sleep by Ethnicity ----
-    st.subheader("🌎 Sleep by Ethnicity")
-    ethnicity_sleep = filtered_df.groupby("Ethnicity")["DurationAsleepHours"].mean().reset_index()
-    fig_ethnicity_sleep = px.bar(ethnicity_sleep, x="Ethnicity", y="DurationAsleepHours", color="Ethnicity", title="Average Sleep Duration per Ethnicity (Hours)")
-    st.plotly_chart(fig_ethnicity_sleep)
-
-    # ---- City-Wise Sleep Comparison ----
-    st.subheader("🏙️ Sleep by City")
-    city_sleep = filtered_df.groupby("City")["DurationAsleepHours"].mean().reset_index()
-    fig_city_sleep = px.bar(city_sleep, x="City", y="DurationAsleepHours", color="City", title="Average Sleep Duration per City (Hours)")
-    st.plotly_chart(fig_city_sleep)
-
-    # ---- Top 10 Participants with Highest Sleep ----
-    st.subheader("🏆 Top 10 Participants with Highest Sleep Duration")
-    top_sleepers = filtered_df.groupby("Participant Name")["DurationAsleepHours"].sum().reset_index().nlargest(10, "DurationAsleepHours")
-    fig_top_sleepers = px.bar(top_sleepers, x="Participant Name", y="DurationAsleepHours", color="Participant Name", title="Top 10 Participants by Sleep Duration (Hours)")
-    st.plotly_chart(fig_top_sleepers)
+    chart("pie", sleep_stages_df, query, names="Stage", values="Duration (Hours)", title="Average Time Spent in Each Sleep Stage")
+
+def sleep_distribution(filtered_df, query):
+    """ Histogram of nightly sleep duration in hours. """
+    chart("histogram", filtered_df, query, x="DurationAsleepHours", title="Distribution of Sleep Duration (Histogram in Hours)", nbins=20)
+
+def sleep_by(column, title):
+    """ Builds a section comparing average sleep duration across the values of `column`. """
+    def render(filtered_df, query):
+        with span(f"bootstrap: Sleep by {column}"):
+            grouped = group_intervals(filtered_df, column, "DurationAsleepHours", extend_query(query, column))
+        chart("bar", grouped, extend_query(query, column), x=column, y="DurationAsleepHours", color=column, error_y="Error+", error_y_minus="Error-", hover_data=["Participants", "p vs Rest"], title=title)
+        st.caption(interval_caption(grouped, column))
+    return render
+
+def sleep_top_participants(filtered_df, query):
+    """ Participants ranked by total sleep, nightly average or improvement (served from the leaderboard). """
+    ranking = st.radio("Rank by", list(RANKINGS), horizontal=True, key="ranking_sleep")
+    with span("leaderboard: DurationAsleep"):
+        top_sleepers = top_participants(filtered_df, "DurationAsleep", ranking, value_name="DurationAsleepHours", scale=3600)
+    chart("bar", top_sleepers, extend_query(query, ranking), x="Participant Name", y="DurationAsleepHours", color="Participant Name", title="Top 10 Participants by Sleep Duration (Hours)" if ranking == "Total" else f"Top 10 Participants by Sleep Duration ({ranking}, Hours)")
+
+def _engine_selection(filtered_df):
+    """ (participants, start, end) of the current selection, for the sleep engine's queries. """
+    return filtered_df["ParticipantID"].unique(), filtered_df["RecordDate"].min(), filtered_df["RecordDate"].max()
+
+def sleep_regularity(filtered_df, query):
+    """ Regularity, duration variability and stage-ratio trends (served from the sleep engine). """
+    with span("sleep engine: trends"):
+        engine = sleep_engine()
+        summary = engine.summary(*_engine_selection(filtered_df))
+        trends = engine.trends(*_engine_selection(filtered_df))
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Sleep Regularity (0-100)", round(summary["Regularity"].mean(), 1))
+    col2.metric("Duration Variability (SD, hours)", round(summary["DurationSD"].mean(), 2))
+    col3.metric("Efficiency Trend (% / night)", round(summary["EfficiencySlope"].mean(), 3))
+    st.caption(f"Per participant over the trailing {SLEEP_WINDOW_DAYS} nights, averaged across the selection.")
+    chart("line", trends, query, x="RecordDate", y="Regularity", title=f"Sleep Regularity ({SLEEP_WINDOW_DAYS}-Night Window)")
+    chart("line", trends, query, x="RecordDate", y="DurationSD", title=f"Sleep Duration Variability ({SLEEP_WINDOW_DAYS}-Night Window, SD in Hours)")
+    chart("line", trends, query, x="RecordDate", y=["DeepShare", "LightShare", "REMShare"], title="Sleep Stage Shares of Time Asleep (%)", labels={"value": "Share (%)", "variable": "Stage"})
+
+def sleep_stages_by_group(filtered_df, query):
+    """ Average nightly hours per sleep stage for each group (served from the sleep engine). """
+    column = st.selectbox("Group by", GROUP_COLUMNS, key="sleep_stage_group")
+    with span("sleep engine: cohort stages"):
+        stages = sleep_engine().cohort_stages(column, *_engine_selection(filtered_df))
+    chart("bar", stages, extend_query(query, column), x=column, y="Hours", color="Stage", title="Average Nightly Hours per Sleep Stage")
+
+def sleep_irregular_participants(filtered_df, query):
+    """ Participants with the least regular sleep in the selection (served from the sleep engine). """
+    with span("sleep engine: most irregular"):
+        irregular = sleep_engine().most_irregular(10, *_engine_selection(filtered_df))
+    chart("bar", irregular, query, x="Participant Name", y="Regularity", color="Participant Name", title="10 Most Irregular Sleepers (Lowest Regularity)")
+    st.dataframe(irregular[["Participant Name", "CohortName", "Regularity", "DurationSD", "EfficiencySlope"]], hide_index=True)
+
+SECTIONS = [
+    ("😴 Sleep Duration Trends", sleep_trends),
+    ("⚡ Sleep Efficiency", sleep_efficiency),
+    ("🌙 Sleep Stages Breakdown (Hours)", sleep_stage_breakdown),
+    ("📐 Sleep Regularity & Stage Trends", sleep_regularity),
+    ("🧩 Sleep Stages by Group", sleep_stages_by_group),
+    ("🌀 Most Irregular Sleepers", sleep_irregular_participants),
+    ("📊 Sleep Duration Distribution", sleep_distribution),
+    ("🏢 Sleep Duration by Organization", sleep_by("OrganizationName", "Average Sleep Duration per Organization (Hours)")),
+    ("👥 Sleep by Age Group", sleep_by("AgeGroup", "Average Sleep Duration per Age Group (Hours)")),
+    ("⚤ Sleep by Gender", sleep_by("ParticipantGender", "Average Sleep Duration per Gender (Hours)")),
+    ("🌎 Sleep by Ethnicity", sleep_by("Ethnicity", "Average Sleep Duration per Ethnicity (Hours)")),
+    ("🏙️ Sleep by City", sleep_by("City", "Average Sleep Duration per City (Hours)")),
+    ("🏆 Top 10 Participants with Highest Sleep Duration", sleep_top_participants),
+]
+
+def show_page(filtered_df, query=None):
+    """ Displays the Sleep Analysis Page with hierarchical filtering and sleep duration in hours (`query`: the figure-cache query of the sidebar selection). """
+    if filtered_df.empty:
+        st.warning("⚠️ No data available for the selected filters.")
+        return
+
+    # ---- Hierarchical Filters ----
+    with span("Hierarchical Filters"):
+        st.sidebar.header("🔍 Filter Selection")
+
+        # 1️⃣ Organization Filter (Unique Key)
+        org_filter = st.sidebar.selectbox("Select Organization", ["All"] + list(filtered_df["OrganizationName"].unique()), key="org_filter_sleep")
+        if org_filter != "All":
+            filtered_df = filtered_df[filtered_df["OrganizationName"] == org_filter]
+
+        # 2️⃣ Physician Filter (Dependent on Organization)
+        physician_list = filtered_df["PhysicianName"].unique()
+        physician_filter = st.sidebar.selectbox("Select Physician", ["All"] + list(physician_list), key="physician_filter_sleep")
+        if physician_filter != "All":
+            filtered_df = filtered_df[filtered_df["PhysicianName"] == physician_filter]
+
+        # 3️⃣ Participant Filter (Dependent on Physician)
+        participant_list = filtered_df["Participant Name"].unique()
+        participant_filter = st.sidebar.selectbox("Select Participant", ["All"] + list(participant_list), key="participant_filter_sleep")
+        if participant_filter != "All":
+            filtered_df = filtered_df[filtered_df["Participant Name"] == participant_filter]
+        query = extend_query(query, org_filter, physician_filter, participant_filter)
+
+    # ---- Display Selected Profiles ----
+    with span("Display Selected Profiles"):
+        st.subheader("👤 Selected Profiles")
+        col1, col2 = st.columns(2)
+
+        if physician_filter != "All":
+            photos = filtered_df["PhysicianPhoto"].dropna()
+            if not photos.empty:
+                physician_photo_url = photos.iloc[0].strip("'")
+                with col1:
+                    show_photo(physician_photo_url, width=150, caption=f"Physician: {physician_filter}")
+
+        if participant_filter != "All":
+            photos = filtered_df["ParticipantPhotoURL"].dropna()
+            if not photos.empty:
+                participant_photo_url = photos.iloc[0].strip("'")
+                with col2:
+                    show_photo(participant_photo_url, width=150, caption=f"Participant: {participant_filter}")
+
+    # ---- Export (rows plus the trend aggregates, built on click) ----
+    export_controls("sleep", filtered_df, {f"Sleep Hours ({interval})": (lambda interval=interval: aggregate_sleep(filtered_df, interval)[0]) for interval in ["Daily", "Weekly", "Monthly"]}, file_stem="sleep_analysis")
+
+    # ---- Sleep Sections (computed on demand in lazy mode) ----
+    render_sections("sleep", SECTIONS, filtered_df, lazy_mode("sleep"), query)
@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from modules.leaderboard import metrics_daily
+from modules.startup import load_key, startup_data
+
+# Per-participant sleep metrics over a trailing window of SLEEP_WINDOW_DAYS nights, computed for
+# the whole population at once. Nightly values are the SLEEP_COLUMNS of the shared day x
+# participant store (see modules/leaderboard.py); every rolling statistic is a difference of two
+# cumulative-sum rows of that matrix (sums, squares and day-weighted sums for the efficiency
+# slope), so the batch is a handful of array passes rather than a groupby per participant. The
+# results are kept as float32 day x participant columns; cohort stage breakdowns and irregularity
+# rankings read window slices of them.
+# The data holds no bed/wake times, so regularity is scored from night-to-night changes in duration:
+# 100 when every night lasts as long as the one before, falling with the mean absolute change.
+SLEEP_COLUMNS = ["DurationAsleep", "DeepSleep", "LightSleep", "REMSleep", "AwakeTime", "SleepEfficiency"]
+STAGES = {"DeepSleep": "Deep", "LightSleep": "Light", "REMSleep": "REM", "AwakeTime": "Awake"}
+SHARE_STAGES = ["DeepSleep", "LightSleep", "REMSleep"]  # shares of time asleep
+GROUP_COLUMNS = ["OrganizationName", "CohortName", "ProgramName", "AgeGroup", "ParticipantGender"]
+SLEEP_WINDOW_DAYS = 14
+MIN_NIGHTS = 5  # nights a window needs before its statistics are reported
+ENGINE_COLUMNS = ["DurationSD", "Regularity", "DeepShare", "LightShare", "REMShare", "EfficiencySlope"]
+
+
+def _rolling_sum(values, window):
+    """ Trailing `window`-row sums along axis 0, NaNs counting as zero. """
+    cumulative = np.zeros((len(values) + 1, *values.shape[1:]))
+    np.cumsum(np.nan_to_num(values), axis=0, out=cumulative[1:])
+    sums = cumulative[1:].copy()
+    sums[window:] -= cumulative[1:len(values) + 1 - window]
+    return sums
+
+
+def _nan_mean(values, axis):
+    """ Mean over `axis` ignoring NaNs; NaN (without a warning) where every value is missing. """
+    count = np.count_nonzero(~np.isnan(values), axis=axis)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(count > 0, np.nansum(values, axis=axis) / count, np.nan)
+
+
+class SleepEngine:
+    """ Rolling per-participant-day sleep statistics for the full population, with window queries. """
+
+    def __init__(self, df, daily, window=SLEEP_WINDOW_DAYS, min_nights=MIN_NIGHTS, group_columns=GROUP_COLUMNS):
+        self.window = window
+        self.min_nights = min_nights
+        self.daily = daily  # a Leaderboard over (at least) SLEEP_COLUMNS holding the rows of `df`
+        ids = self.daily.participant_ids
+        self.participants = df.drop_duplicates("ParticipantID").set_index("ParticipantID").reindex(ids)[["Participant Name", *group_columns]].rename_axis("ParticipantID").reset_index()
+        self.columns = self._compute()
+
+    @property
+    def first_day(self):
+        return self.daily.first_day
+
+    @property
+    def n_days(self):
+        return self.daily.n_days
+
+    def _compute(self):
+        """ {column: float32 day x participant matrix} of the trailing-window statistics. """
+        w = self.window
+        hours = self.daily.daily_values("DurationAsleep") / 3600
+        present = ~np.isnan(hours)
+        nights = _rolling_sum(present.astype(np.float64), w)
+        enough = nights >= self.min_nights
+        columns = {}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = _rolling_sum(hours, w) / nights
+            variance = (_rolling_sum(hours * hours, w) - nights * mean * mean) / (nights - 1)
+            columns["DurationSD"] = np.where(enough, np.sqrt(np.maximum(variance, 0)), np.nan)
+
+            change = np.full_like(hours, np.nan)
+            change[1:] = np.abs(hours[1:] - hours[:-1])
+            changes = _rolling_sum(~np.isnan(change), w)
+            mean_change = _rolling_sum(change, w) / changes
+            columns["Regularity"] = np.where(enough & (changes > 0), np.clip(100 * (1 - mean_change / mean), 0, 100), np.nan)
+
+            asleep = self.daily.daily_values("DurationAsleep")
+            for stage in SHARE_STAGES:
+                share = 100 * self.daily.daily_values(stage) / asleep
+                shares = _rolling_sum(~np.isnan(share), w)
+                columns[f"{STAGES[stage]}Share"] = np.where(enough, _rolling_sum(share, w) / shares, np.nan)
+
+            # Least-squares slope of efficiency against the day index over the window (% per night).
+            efficiency = self.daily.daily_values("SleepEfficiency")
+            observed = ~np.isnan(efficiency)
+            day = np.arange(len(efficiency), dtype=np.float64)[:, None] * observed
+            n = _rolling_sum(observed, w)
+            sum_t, sum_y = _rolling_sum(day, w), _rolling_sum(efficiency, w)
+            sum_tt, sum_ty = _rolling_sum(day * day, w), _rolling_sum(day * np.nan_to_num(efficiency), w)
+            columns["EfficiencySlope"] = np.where(n >= self.min_nights, (n * sum_ty - sum_t * sum_y) / (n * sum_tt - sum_t * sum_t), np.nan)
+        return {name: columns[name].astype(np.float32) for name in ENGINE_COLUMNS}
+
+    def _days(self, start, end):
+        """ [first, last) day rows covered by the inclusive date window, clipped to the recorded days. """
+        if self.first_day is None:
+            return 0, 0
+        first = 0 if start is None else int((np.datetime64(pd.Timestamp(start), "D") - self.first_day).astype(np.int64))
+        last = self.n_days if end is None else int((np.datetime64(pd.Timestamp(end), "D") - self.first_day).astype(np.int64)) + 1
+        return min(max(first, 0), self.n_days), min(max(last, 0), self.n_days)
+
+    def _codes(self, participants):
+        """ Participant columns for IDs (default all), in participant order. """
+        if participants is None:
+            return np.arange(self.daily.n_participants)
+        codes = self.daily.participant_ids.get_indexer(participants)
+        return np.sort(codes[codes >= 0])
+
+    def table(self, participants=None, start=None, end=None):
+        """ The stored statistics as long per-participant-day rows (days with any value). """
+        first, last = self._days(start, end)
+        codes = self._codes(participants)
+        stacked = {name: values[first:last][:, codes] for name, values in self.columns.items()}
+        day, column = np.nonzero(~np.all([np.isnan(v) for v in stacked.values()], axis=0))
+        return pd.DataFrame({
+            "RecordDate": pd.to_datetime(self.first_day + (first + day).astype("timedelta64[D]")),
+            "ParticipantID": self.daily.participant_ids.to_numpy()[codes[column]],
+            **{name: values[day, column] for name, values in stacked.items()},
+        })
+
+    def trends(self, participants=None, start=None, end=None):
+        """ Mean of every statistic across the selected participants, per day of the window. """
+        first, last = self._days(start, end)
+        codes = self._codes(participants)
+        dates = pd.to_datetime(self.first_day + np.arange(first, last).astype("timedelta64[D]"))
+        return pd.DataFrame({"RecordDate": dates, **{name: _nan_mean(values[first:last][:, codes], axis=1) for name, values in self.columns.items()}})
+
+    def summary(self, participants=None, start=None, end=None):
+        """ One row per participant: window means of the statistics plus nightly stage hours. """
+        first, last = self._days(start, end)
+        codes = self._codes(participants)
+        result = self.participants.iloc[codes].reset_index(drop=True)
+        for name, values in self.columns.items():
+            result[name] = _nan_mean(values[first:last][:, codes], axis=0)
+        for stage, label in STAGES.items():
+            result[f"{label} (hours)"] = self.daily.values(stage, "average", start, end)[codes] / 3600
+        return result
+
+    def cohort_stages(self, column, participants=None, start=None, end=None, summary=None):
+        """ Average nightly hours per sleep stage for each value of `column` (long form for a stacked bar). """
+        summary = self.summary(participants, start, end) if summary is None else summary
+        hours = [f"{label} (hours)" for label in STAGES.values()]
+        grouped = summary.groupby(column)[hours].mean().reset_index()
+        return grouped.melt(id_vars=column, value_vars=hours, var_name="Stage", value_name="Hours").assign(Stage=lambda t: t["Stage"].str.replace(" (hours)", "", regex=False))
+
+    def most_irregular(self, n=10, participants=None, start=None, end=None, summary=None):
+        """ The `n` participants with the lowest regularity in the window, least regular first. """
+        summary = self.summary(participants, start, end) if summary is None else summary
+        return summary.dropna(subset=["Regularity"]).nsmallest(n, "Regularity")
+
+
+@st.cache_resource(show_spinner=False)
+def metrics_sleep(load, _df):
+    """ Sleep engine over the shared daily store of the metrics frame of `load`, shared by all sessions. """
+    return SleepEngine(_df, metrics_daily(load, _df))
+
+
+def sleep_engine():
+    """ The shared sleep engine for the configured metrics source. """
+    return metrics_sleep(load_key("metrics"), startup_data().result("metrics"))
@@ -0,0 +1,243 @@
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import streamlit as st
+
+from modules.data_sources import metrics_source, survey_source, parse_source, prepare_metrics_checked
+from modules.photos import make_session
+
+# Both workbooks are loaded once per process at startup: remote sources are downloaded
+# concurrently over one pooled HTTP session, Excel payloads are parsed in parallel worker
+# processes when more than one CPU is available (openpyxl holds the GIL), and Parquet
+# directories are read on the download threads.
+# Cold start therefore costs roughly the slower of the two loads instead of their sum.
+# Each source has its own cached loader, so a source that failed is loaded again on its own
+# while the other keeps its result, and a page waits only for the sources it reads.
+# Every loader gets a new load number, and load_key(name) = (source, load number) is the cache key
+# of everything built from a loaded source (engines, figure queries, the warm-up), so a reload is
+# never answered from what was built for the previous load.
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+DOWNLOAD_TIMEOUT = 60
+POLL_INTERVAL = 0.1
+# name -> (sheet_name, postprocess[, outputs]) of each configured source; see StartupLoader.
+SOURCE_OPTIONS = {
+    "metrics": (0, prepare_metrics_checked, ("metrics", "metrics quarantine", "metrics quality")),
+    "survey": (None, None),
+}
+_LOAD_NUMBERS = itertools.count(1)
+
+
+def _available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _worker_context():
+    """ Multiprocessing context for the parse workers.
+
+    The Streamlit server is multi-threaded, so plain fork is unsafe. forkserver (Unix) forks each
+    worker from a clean server that has pandas preloaded and never re-imports the app's __main__;
+    spawn is the portable fallback.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["modules.data_sources"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def is_remote(source):
+    return source.startswith(("http://", "https://"))
+
+
+class StartupLoader:
+    """ Loads named sources in the background and tracks per-source progress.
+
+    `sources` maps a name to (source, sheet_name, postprocess[, outputs]); see data_sources.parse_source.
+    When `outputs` names are given, postprocess returns a tuple and each item is published under
+    its own name (e.g. the metrics frame, its quarantined rows and its quality summary).
+    """
+
+    def __init__(self, sources, session=None, timeout=DOWNLOAD_TIMEOUT):
+        self.sources = sources
+        self.load_number = next(_LOAD_NUMBERS)
+        self.session = session or make_session(pool_size=len(sources))
+        self.timeout = timeout
+        self.progress = {name: {"state": "queued", "bytes": 0, "total": None, "seconds": None} for name in sources}
+        self.errors = {}
+        self._results = {}
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._start = time.perf_counter()
+        threading.Thread(target=self._run, name="althealth-startup-loader", daemon=True).start()
+
+    def _update(self, name, **fields):
+        with self._lock:
+            self.progress[name].update(fields)
+
+    def _run(self):
+        excel_sources = [name for name, (source, *_) in self.sources.items() if is_remote(source) or not os.path.isdir(source)]
+        processes = None
+        if excel_sources and _available_cpus() > 1:
+            processes = ProcessPoolExecutor(max_workers=len(excel_sources), mp_context=_worker_context())
+            # Start the workers now so their interpreter start-up overlaps the downloads.
+            for _ in excel_sources:
+                processes.submit(int)
+        try:
+            with ThreadPoolExecutor(max_workers=len(self.sources), thread_name_prefix="althealth-load") as threads:
+                wait([threads.submit(self._load, name, processes) for name in self.sources])
+        finally:
+            if processes:
+                processes.shutdown(wait=False)
+            self._done.set()
+
+    def _load(self, name, processes):
+        source, sheet_name, postprocess, *outputs = self.sources[name]
+        try:
+            payload = self._download(name, source) if is_remote(source) else source
+            self._update(name, state="parsing")
+            result = None
+            if processes is not None and (isinstance(payload, bytes) or not os.path.isdir(payload)):
+                try:
+                    result = processes.submit(parse_source, payload, sheet_name, postprocess).result()
+                except BrokenProcessPool:
+                    pass  # worker processes unavailable (e.g. an unimportable __main__); parse on this thread
+            if result is None:
+                result = parse_source(payload, sheet_name, postprocess)
+            with self._lock:
+                self._results.update(zip(outputs[0], result) if outputs else [(name, result)])
+            self._update(name, state="ready", seconds=time.perf_counter() - self._start)
+        except Exception as e:
+            with self._lock:
+                self.errors[name] = e
+            self._update(name, state="failed", seconds=time.perf_counter() - self._start)
+
+    def _download(self, name, source):
+        """ Streams a remote workbook into memory, recording bytes received for the progress line. """
+        self._update(name, state="downloading")
+        with self.session.get(source, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            total = response.headers.get("Content-Length")
+            self._update(name, total=int(total) if total else None)
+            chunks, received = [], 0
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+                chunks.append(chunk)
+                received += len(chunk)
+                self._update(name, bytes=received)
+        return b"".join(chunks)
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """ Blocks until every source has loaded (or failed); returns False on timeout. """
+        return self._done.wait(timeout)
+
+    def describe(self):
+        """ One status fragment per source, e.g. 'metrics: downloading 3.1 / 12.0 MB'. """
+        with self._lock:
+            progress = {name: dict(p) for name, p in self.progress.items()}
+        parts = []
+        for name, p in progress.items():
+            if p["state"] == "downloading":
+                total = f" / {p['total'] / 1e6:.1f}" if p["total"] else ""
+                parts.append(f"{name}: downloading {p['bytes'] / 1e6:.1f}{total} MB")
+            elif p["state"] in ("ready", "failed"):
+                parts.append(f"{name}: {p['state']} ({p['seconds']:.1f}s)")
+            else:
+                parts.append(f"{name}: {p['state']}")
+        return " · ".join(parts)
+
+    def source_of(self, name):
+        """ The source that publishes `name` (itself or one of its outputs), or None. """
+        return next((source for source, (_, _, _, *outputs) in self.sources.items() if name in (outputs[0] if outputs else (source,))), None)
+
+    def result(self, name):
+        """ The parsed source (or one of its published outputs); waits for it and re-raises its load error, if any. """
+        self.wait()
+        source = self.source_of(name) or name
+        if source in self.errors:
+            raise self.errors[source]
+        return self._results[name]
+
+
+class StartupData:
+    """ The per-source loaders of the configured sources, behind one loader-like interface. """
+
+    def __init__(self, loaders):
+        self.loaders = loaders  # source name -> StartupLoader
+
+    @property
+    def errors(self):
+        return {name: error for loader in self.loaders.values() for name, error in loader.errors.items()}
+
+    def _selected(self, names):
+        return [loader for name, loader in self.loaders.items() if names is None or name in names]
+
+    def done(self, names=None):
+        return all(loader.done() for loader in self._selected(names))
+
+    def wait(self, timeout=None, names=None):
+        """ Blocks until the named sources (default all) have loaded or failed; returns False on timeout. """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for loader in self._selected(names):
+            if not loader.wait(None if deadline is None else max(deadline - time.monotonic(), 0)):
+                return False
+        return True
+
+    def describe(self, names=None):
+        return " · ".join(loader.describe() for loader in self._selected(names))
+
+    def result(self, name):
+        """ A source or published output by name; waits only for the loader that publishes it. """
+        loader = next((loader for loader in self.loaders.values() if loader.source_of(name)), None)
+        if loader is None:
+            raise KeyError(name)
+        return loader.result(name)
+
+
+@st.cache_resource(show_spinner=False)
+def _download_session():
+    return make_session(pool_size=len(SOURCE_OPTIONS))
+
+
+@st.cache_resource(show_spinner=False)
+def _source_loader(name, source):
+    """ Background load of one configured source, cached per source. """
+    return StartupLoader({name: (source, *SOURCE_OPTIONS[name])}, session=_download_session())
+
+
+def startup_data():
+    """ Process-wide loaders for the configured metrics and survey sources; a failed source is reloaded (alone) on the next call. """
+    loaders = {}
+    for name, source in [("metrics", metrics_source()), ("survey", survey_source())]:
+        loader = _source_loader(name, source)
+        if loader.done() and loader.errors:
+            _source_loader.clear(name, source)
+            loader = _source_loader(name, source)
+        loaders[name] = loader
+    return StartupData(loaders)
+
+
+def load_key(name):
+    """ (source, load number) of the configured source `name`; the cache key of what is built from its loaded data. """
+    loader = startup_data().loaders[name]
+    return loader.sources[name][0], loader.load_number
+
+
+def wait_for_data(loader, names=None):
+    """ Shows a spinner with a live per-source progress line until the named sources (default all) have loaded. """
+    if loader.done(names):
+        return
+    with st.spinner("Loading data, please wait..."):
+        progress = st.empty()
+        while not loader.wait(POLL_INTERVAL, names):
+            progress.caption(loader.describe(names))
+        progress.empty()
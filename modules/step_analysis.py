@@ -1,6 +1,13 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+from modules.perf import span, plotly_chart
+from modules.figures import chart, extend_query, figure
+from modules.photos import show_photo
+from modules.sections import lazy_mode, render_sections
+from modules.leaderboard import RANKINGS, top_participants
+from modules.export import export_controls
+from modules.forecasts import add_projection, projection_caption, selection_band
+from modules.bootstrap import group_intervals, interval_caption
 
 @st.cache_data
 def aggregate_steps(filtered_df, time_interval):
@@ -11,94 +18,107 @@ def aggregate_steps(filtered_df, time_interval):
         return filtered_df.groupby("Month")["Steps"].mean().reset_index(), "Month"
     return filtered_df.groupby("RecordDate")["Steps"].mean().reset_index(), "RecordDate"
 
-def show_page(filtered_df):
-    """ Displays the Steps Analysis Page with Hierarchical Filtering. """
+def trend_figure(filtered_df, time_interval, query=None):
+    """ Average steps line chart at the given interval (also replayed by the query-log prewarm). """
+    with span("aggregate_steps (cache_data)"):
+        grouped_df, x_col = aggregate_steps(filtered_df, time_interval)
+    return figure("line", grouped_df, extend_query(query, time_interval), x=x_col, y="Steps", title=f"Average Steps ({time_interval})")
+
+# ---- Page Sections ----
+def steps_trends(filtered_df, query):
+    """ Average steps over time at the selected aggregation level. """
+    # ---- User selection for aggregation level ----
+    time_interval = st.radio("Select Time Interval", ["Daily", "Weekly", "Monthly"], horizontal=True, key="time_interval_steps")
+
+    # Ensure the filtered dataset is used for calculations
+    fig = trend_figure(filtered_df, time_interval, query)
+    band = selection_band(filtered_df, "Steps") if time_interval == "Daily" else None
+    if band is not None:
+        add_projection(fig, band, "Projected Steps")
+    plotly_chart(fig)
+    if band is not None:
+        st.caption(projection_caption(band))
+
+def steps_distribution(filtered_df, query):
+    """ Histogram of daily step counts. """
+    chart("histogram", filtered_df, query, x="Steps", title="Steps Distribution (Histogram)", nbins=20)
+
+def steps_by(column, title):
+    """ Builds a section comparing average steps across the values of `column`. """
+    def render(filtered_df, query):
+        with span(f"bootstrap: Steps by {column}"):
+            grouped = group_intervals(filtered_df, column, "Steps", extend_query(query, column))
+        chart("bar", grouped, extend_query(query, column), x=column, y="Steps", color=column, error_y="Error+", error_y_minus="Error-", hover_data=["Participants", "p vs Rest"], title=title)
+        st.caption(interval_caption(grouped, column))
+    return render
+
+def steps_top_participants(filtered_df, query):
+    """ Participants ranked by total steps, daily average or improvement (served from the leaderboard). """
+    ranking = st.radio("Rank by", list(RANKINGS), horizontal=True, key="ranking_steps")
+    with span("leaderboard: Steps"):
+        top_steppers = top_participants(filtered_df, "Steps", ranking)
+    chart("bar", top_steppers, extend_query(query, ranking), x="Participant Name", y="Steps", color="Participant Name", title="Top 10 Participants" if ranking == "Total" else f"Top 10 Participants by Steps ({ranking})")
+
+SECTIONS = [
+    ("📈 Steps Trends", steps_trends),
+    ("📊 Steps Distribution", steps_distribution),
+    ("🏢 Steps by Organization", steps_by("OrganizationName", "Average Steps per Organization")),
+    ("👥 Steps by Age Group", steps_by("AgeGroup", "Average Steps per Age Group")),
+    ("⚤ Steps by Gender", steps_by("ParticipantGender", "Average Steps per Gender")),
+    ("🌎 Steps by Ethnicity", steps_by("Ethnicity", "Average Steps per Ethnicity")),
+    ("🏙️ Steps by City", steps_by("City", "Average Steps per City")),
+    ("🏆 Top 10 Participants with Highest Steps", steps_top_participants),
+]
+
+def show_page(filtered_df, query=None):
+    """ Displays the Steps Analysis Page with Hierarchical Filtering (`query`: the figure-cache query of the sidebar selection). """
     if filtered_df.empty:
         st.warning("⚠️ No data available for the selected filters.")
         return
 
     # ---- Hierarchical Filters ----
-    st.sidebar.header("🔍 Filter Selection")
-
-    # 1️⃣ Organization Filter (Unique Key)
-    org_filter = st.sidebar.selectbox("Select Organization", ["All"] + list(filtered_df["OrganizationName"].dropna().unique()), key="org_filter_steps")
-    if org_filter != "All":
-        filtered_df = filtered_df[filtered_df["OrganizationName"] == org_filter]
-
-    # 2️⃣ Physician Filter (Unique Key, Dependent on Organization)
-    physician_list = filtered_df["PhysicianName"].dropna().unique()
-    physician_filter = st.sidebar.selectbox("Select Physician", ["All"] + list(physician_list), key="physician_filter_steps")
-    if physician_filter != "All":
-        filtered_df = filtered_df[filtered_df["PhysicianName"] == physician_filter]
-
-    # 3️⃣ Participant Filter (Unique Key, Dependent on Physician)
-    participant_list = filtered_df["Participant Name"].dropna().unique()
-    participant_filter = st.sidebar.selectbox("Select Participant", ["All"] + list(participant_list), key="participant_filter_steps")
-    if participant_filter != "All":
-        filtered_df = filtered_df[filtered_df["Participant Name"] == participant_filter]
+    with span("Hierarchical Filters"):
+        st.sidebar.header("🔍 Filter Selection")
+
+        # 1️⃣ Organization Filter (Unique Key)
+        org_filter = st.sidebar.selectbox("Select Organization", ["All"] + list(filtered_df["OrganizationName"].unique()), key="org_filter_steps")
+        if org_filter != "All":
+            filtered_df = filtered_df[filtered_df["OrganizationName"] == org_filter]
+
+        # 2️⃣ Physician Filter (Unique Key, Dependent on Organization)
+        physician_list = filtered_df["PhysicianName"].unique()
+        physician_filter = st.sidebar.selectbox("Select Physician", ["All"] + list(physician_list), key="physician_filter_steps")
+        if physician_filter != "All":
+            filtered_df = filtered_df[filtered_df["PhysicianName"] == physician_filter]
+
+        # 3️⃣ Participant Filter (Unique Key, Dependent on Physician)
+        participant_list = filtered_df["Participant Name"].unique()
+        participant_filter = st.sidebar.selectbox("Select Participant", ["All"] + list(participant_list), key="participant_filter_steps")
+        if participant_filter != "All":
+            filtered_df = filtered_df[filtered_df["Participant Name"] == participant_filter]
+        query = extend_query(query, org_filter, physician_filter, participant_filter)
 
     # ---- Display Selected Profiles ----
-    st.subheader("👤 Selected Profiles")
-    col1, col2 = st.columns(2)
-
-    if physician_filter != "All":
-        physician_photo_url = filtered_df["PhysicianPhoto"].dropna().iloc[0].strip("'")  # Remove single quote prefix
-        with col1:
-            st.image(physician_photo_url, width=150, caption=f"Physician: {physician_filter}")
-
-    if participant_filter != "All":
-        participant_photo_url = filtered_df["ParticipantPhotoURL"].dropna().iloc[0].strip("'")  # Remove single quote prefix
-        with col2:
-            st.image(participant_photo_url, width=150, caption=f"Participant: {participant_filter}")
-
-    # ---- User selection for aggregation level ----
-    time_interval = st.radio("Select Time Interval", ["Daily", "Weekly", "Monthly"], horizontal=True)
-
-    # Ensure the filtered dataset is used for calculations
-    grouped_df, x_col = aggregate_steps(filtered_df, time_interval)
-
-    # ---- Steps Trends Visualization ----
-    st.subheader("📈 Steps Trends")
-    fig_steps = px.line(grouped_df, x=x_col, y="Steps", title=f"Average Steps ({time_interval})")
-    st.plotly_chart(fig_steps)
-
-    # ---- Steps Distribution ----
-    st.subheader("📊 Steps Distribution")
-    fig_dist = px.histogram(filtered_df, x="Steps", title="Steps Distribution (Histogram)", nbins=20)
-    st.plotly_chart(fig_dist)
-
-    # ---- Steps by Organization ----
-    st.subheader("🏢 Steps by Organization")
-    org_steps = filtered_df.groupby("OrganizationName")["Steps"].mean().reset_index()
-    fig_org_steps = px.bar(org_steps, x="OrganizationName", y="Steps", color="OrganizationName", title="Average Steps per Organization")
-    st.plotly_chart(fig_org_steps)
-
-    # ---- Steps by Age Group ----
-    st.subheader("👥 Steps by Age Group")
-    age_steps = filtered_df.groupby("AgeGroup")["Steps"].mean().reset_index()
-    fig_age_steps = px.bar(age_steps, x="AgeGroup", y="Steps", color="AgeGroup", title="Average Steps per Age Group")
-    st.plotly_chart(fig_age_steps)
-
-    # ---- Steps by Gender ----
-    st.subheader("⚤ Steps by Gender")
-    gender_steps = filtered_df.groupby("ParticipantGender")["Steps"].mean().reset_index()
-    fig_gender_steps = px.bar(gender_steps, x="ParticipantGender", y="Steps", color="ParticipantGender", title="Average Steps per Gender")
-    st.plotly_chart(fig_gender_steps)
-
-    # ---- Steps by Ethnicity ----
-    st.subheader("🌎 Steps by Ethnicity")
-    ethnicity_steps = filtered_df.groupby("Ethnicity")["Steps"].mean().reset_index()
-    fig_ethnicity_steps = px.bar(ethnicity_steps, x="Ethnicity", y="Steps", color="Ethnicity", title="Average Steps per Ethnicity")
-    st.plotly_chart(fig_ethnicity_steps)
-
-    # ---- City-Wise Steps Comparison ----
-    st.subheader("🏙️ Steps by City")
-    city_steps = filtered_df.groupby("City")["Steps"].mean().reset_index()
-    fig_city_steps = px.bar(city_steps, x="City", y="Steps", color="City", title="Average Steps per City")
-    st.plotly_chart(fig_city_steps)
-
-    # ---- Top 10 Participants by Steps ----
-    st.subheader("🏆 Top 10 Participants with Highest Steps")
-    top_participants = filtered_df.groupby("Participant Name")["Steps"].sum().reset_index().nlargest(10, "Steps")
-    fig_top_participants = px.bar(top_participants, x="Participant Name", y="Steps", color="Participant Name", title="Top 10 Participants")
-    st.plotly_chart(fig_top_participants)
+    with span("Display Selected Profiles"):
+        st.subheader("👤 Selected Profiles")
+        col1, col2 = st.columns(2)
+
+        if physician_filter != "All":
+            photos = filtered_df["PhysicianPhoto"].dropna()
+            if not photos.empty:
+                physician_photo_url = photos.iloc[0].strip("'")  # Remove single quote prefix
+                with col1:
+                    show_photo(physician_photo_url, width=150, caption=f"Physician: {physician_filter}")
+
+        if participant_filter != "All":
+            photos = filtered_df["ParticipantPhotoURL"].dropna()
+            if not photos.empty:
+                participant_photo_url = photos.iloc[0].strip("'")  # Remove single quote prefix
+                with col2:
+                    show_photo(participant_photo_url, width=150, caption=f"Participant: {participant_filter}")
+
+    # ---- Export (rows plus the trend aggregates, built on click) ----
+    export_controls("steps", filtered_df, {f"Steps ({interval})": (lambda interval=interval: aggregate_steps(filtered_df, interval)[0]) for interval in ["Daily", "Weekly", "Monthly"]}, file_stem="steps_analysis")
+
+    # ---- Steps Sections (computed on demand in lazy mode) ----
+    render_sections("steps", SECTIONS, filtered_df, lazy_mode("steps"), query)
@@ -4,87 +4,117 @@
 
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+from modules.perf import span
+from modules.figures import chart, extend_query
+from modules.photos import show_photo
+from modules.startup import load_key, startup_data, wait_for_data
+from modules.sketches import SURVEY_DIMENSIONS, survey_cube
+from modules.export import export_controls
+from modules.outcomes import ACTIVITY_LABELS, WINDOW_DAYS, survey_activity
+from modules.survey_items import item_matrix
+
+OUTCOME_PERIODS = {"START → END": ("START", "END"), "START → MID": ("START", "MID"), "MID → END": ("MID", "END")}
 
-@st.cache_data
 def load_survey_data():
-    """Load survey dataset from the uploaded Excel file."""
-    file_path = "https://althealth.s3.us-east-1.amazonaws.com/survey_responses_singlesheet_PowerBI_Friendly.xlsx"
-    df = pd.read_excel(file_path, sheet_name=None)
+    """Load survey dataset from the startup loader (fetched alongside the metrics workbook)."""
+    loader = startup_data()
+    wait_for_data(loader, ["survey"])
+    df = loader.result("survey")
     return df['Survey Responses'], df['Survey Scores']
 
-# Load the survey dataset
-survey_responses, survey_scores = load_survey_data()
-
 # Define function for displaying the survey analysis page
 def show_page():
+    # Load the survey dataset (shared with the startup loader, so importing this module never waits on it)
+    survey_responses, survey_scores = load_survey_data()
+
     # ---- Sidebar Filters ----
     st.sidebar.header("🔍 Survey Filters")
 
-    # Hierarchical Filters
-    org_filter = st.sidebar.selectbox("Select Organization", ["All"] + list(survey_responses["OrganizationName"].dropna().unique()), key="org_filter_survey")
-    filtered_df = survey_responses[survey_responses["OrganizationName"] == org_filter] if org_filter != "All" else survey_responses
+    with span("Survey Filters"):
+        # Hierarchical Filters
+        org_filter = st.sidebar.selectbox("Select Organization", ["All"] + list(survey_responses["OrganizationName"].dropna().unique()), key="org_filter_survey")
+        filtered_df = survey_responses[survey_responses["OrganizationName"] == org_filter] if org_filter != "All" else survey_responses
+
+        cohort_filter = st.sidebar.selectbox("Select Cohort", ["All"] + list(filtered_df["CohortName"].dropna().unique()), key="cohort_filter_survey")
+        filtered_df = filtered_df[filtered_df["CohortName"] == cohort_filter] if cohort_filter != "All" else filtered_df
 
-    cohort_filter = st.sidebar.selectbox("Select Cohort", ["All"] + list(filtered_df["CohortName"].dropna().unique()), key="cohort_filter_survey")
-    filtered_df = filtered_df[filtered_df["CohortName"] == cohort_filter] if cohort_filter != "All" else filtered_df
+        physician_filter = st.sidebar.selectbox("Select Physician", ["All"] + list(filtered_df["PhysicianName"].dropna().unique()), key="physician_filter_survey")
+        filtered_df = filtered_df[filtered_df["PhysicianName"] == physician_filter] if physician_filter != "All" else filtered_df
 
-    physician_filter = st.sidebar.selectbox("Select Physician", ["All"] + list(filtered_df["PhysicianName"].dropna().unique()), key="physician_filter_survey")
-    filtered_df = filtered_df[filtered_df["PhysicianName"] == physician_filter] if physician_filter != "All" else filtered_df
+        program_filter = st.sidebar.selectbox("Select Program", ["All"] + list(filtered_df["ProgramName"].dropna().unique()), key="program_filter_survey")
+        filtered_df = filtered_df[filtered_df["ProgramName"] == program_filter] if program_filter != "All" else filtered_df
 
-    program_filter = st.sidebar.selectbox("Select Program", ["All"] + list(filtered_df["ProgramName"].dropna().unique()), key="program_filter_survey")
-    filtered_df = filtered_df[filtered_df["ProgramName"] == program_filter] if program_filter != "All" else filtered_df
+        participant_filter = st.sidebar.selectbox("Select Participant", ["All"] + list(filtered_df["Participant Name"].dropna().unique()), key="participant_filter_survey")
+        filtered_df = filtered_df[filtered_df["Participant Name"] == participant_filter] if participant_filter != "All" else filtered_df
 
-    participant_filter = st.sidebar.selectbox("Select Participant", ["All"] + list(filtered_df["Participant Name"].dropna().unique()), key="participant_filter_survey")
-    filtered_df = filtered_df[filtered_df["Participant Name"] == participant_filter] if participant_filter != "All" else filtered_df
+        # Independent Filters
+        gender_filter = st.sidebar.selectbox("Select Gender", ["All"] + list(filtered_df["ParticipantGender"].dropna().unique()), key="gender_filter_survey")
+        filtered_df = filtered_df[filtered_df["ParticipantGender"] == gender_filter] if gender_filter != "All" else filtered_df
 
-    # Independent Filters
-    gender_filter = st.sidebar.selectbox("Select Gender", ["All"] + list(filtered_df["ParticipantGender"].dropna().unique()), key="gender_filter_survey")
-    filtered_df = filtered_df[filtered_df["ParticipantGender"] == gender_filter] if gender_filter != "All" else filtered_df
+        ethnicity_filter = st.sidebar.selectbox("Select Ethnicity", ["All"] + list(filtered_df["Ethnicity"].dropna().unique()), key="ethnicity_filter_survey")
+        filtered_df = filtered_df[filtered_df["Ethnicity"] == ethnicity_filter] if ethnicity_filter != "All" else filtered_df
 
-    ethnicity_filter = st.sidebar.selectbox("Select Ethnicity", ["All"] + list(filtered_df["Ethnicity"].dropna().unique()), key="ethnicity_filter_survey")
-    filtered_df = filtered_df[filtered_df["Ethnicity"] == ethnicity_filter] if ethnicity_filter != "All" else filtered_df
+        age_group_filter = st.sidebar.selectbox("Select Age Group", ["All"] + list(filtered_df["AgeGroup"].dropna().unique()), key="age_group_filter_survey")
+        filtered_df = filtered_df[filtered_df["AgeGroup"] == age_group_filter] if age_group_filter != "All" else filtered_df
 
-    age_group_filter = st.sidebar.selectbox("Select Age Group", ["All"] + list(filtered_df["AgeGroup"].dropna().unique()), key="age_group_filter_survey")
-    filtered_df = filtered_df[filtered_df["AgeGroup"] == age_group_filter] if age_group_filter != "All" else filtered_df
+        city_filter = st.sidebar.selectbox("Select City", ["All"] + list(filtered_df["City"].dropna().unique()), key="city_filter_survey")
+        filtered_df = filtered_df[filtered_df["City"] == city_filter] if city_filter != "All" else filtered_df
 
-    city_filter = st.sidebar.selectbox("Select City", ["All"] + list(filtered_df["City"].dropna().unique()), key="city_filter_survey")
-    filtered_df = filtered_df[filtered_df["City"] == city_filter] if city_filter != "All" else filtered_df
+        # Survey-Specific Filters
+        survey_filter = st.sidebar.selectbox("Select Survey", ["All"] + ["GAD-7", "SUS", "SF-12"], key="survey_filter")
+        filtered_df = filtered_df[filtered_df["SurveyName"] == survey_filter] if survey_filter != "All" else filtered_df
 
-    # Survey-Specific Filters
-    survey_filter = st.sidebar.selectbox("Select Survey", ["All"] + ["GAD-7", "SUS", "SF-12"], key="survey_filter")
-    filtered_df = filtered_df[filtered_df["SurveyName"] == survey_filter] if survey_filter != "All" else filtered_df
+        timepoint_filter = st.sidebar.selectbox("Select Timepoint", ["All"] + ["START", "MID", "END"], key="timepoint_filter")
+        filtered_df = filtered_df[filtered_df["SurveyTimepoint"] == timepoint_filter] if timepoint_filter != "All" else filtered_df
 
-    timepoint_filter = st.sidebar.selectbox("Select Timepoint", ["All"] + ["START", "MID", "END"], key="timepoint_filter")
-    filtered_df = filtered_df[filtered_df["SurveyTimepoint"] == timepoint_filter] if timepoint_filter != "All" else filtered_df
+    # Figure-cache query of this selection (see modules/figures.py).
+    query = (load_key("survey"), org_filter, cohort_filter, physician_filter, program_filter, participant_filter, gender_filter, ethnicity_filter, age_group_filter, city_filter, survey_filter, timepoint_filter)
+
+    # ---- Export (response rows plus submission summaries, built on click) ----
+    def submissions(rows=filtered_df):  # bound now: filtered_df is narrowed again further down
+        return rows.drop_duplicates(subset=["ParticipantID", "SurveyName", "SurveyTimepoint"])
+
+    export_controls("survey", filtered_df, {
+        "Submissions by Outcome": lambda: submissions().groupby(["SurveyName", "SurveyTimepoint", "Outcome Category"]).size().reset_index(name="Submission Count"),
+        "Average Total Score": lambda: submissions().groupby(["SurveyName", "SurveyTimepoint"])["Total Score"].mean().reset_index(),
+    }, file_stem="survey_analysis")
 
     # ---- Key Metrics ----
     st.title("📊 Survey Analysis Dashboard")
     st.markdown("### Key Metrics")
-    col1, col2, col3 = st.columns(3)
+    with span("Key Metrics"):
+        # Distinct counts are merged from the per-cell sketches of the survey cube instead of rescanning the rows.
+        selection = {column: value for column, value in zip(SURVEY_DIMENSIONS, [org_filter, cohort_filter, physician_filter, program_filter, participant_filter, gender_filter, ethnicity_filter, age_group_filter, city_filter, survey_filter, timepoint_filter]) if value != "All"}
+        distinct = survey_cube(load_key("survey"), survey_responses).totals(selection, fallback_df=filtered_df)
+        col1, col2, col3 = st.columns(3)
 
-    with col1:
-        st.metric("Total Participants", filtered_df["ParticipantID"].nunique())
-        st.metric("Total Surveys", filtered_df["SurveyName"].nunique())
+        with col1:
+            st.metric("Total Participants", distinct["participants"])
+            st.metric("Total Surveys", distinct["surveys"])
 
-    with col2:
-        st.metric("Total Submissions", filtered_df.groupby(['ParticipantID', 'SurveyName', 'SurveyTimepoint']).ngroups)
-        st.metric("Unique Cohorts", filtered_df["CohortName"].nunique())
+        with col2:
+            st.metric("Total Submissions", distinct["submissions"])
+            st.metric("Unique Cohorts", distinct["cohorts"])
 
-    with col3:
-        st.metric("Programs Covered", filtered_df.groupby(['OrganizationName', 'CohortName', 'ProgramName']).ngroups)
-        st.metric("Physicians Involved", filtered_df.groupby(['OrganizationName', 'PhysicianName']).ngroups)
+        with col3:
+            st.metric("Programs Covered", distinct["programs"])
+            st.metric("Physicians Involved", distinct["physicians"])
 
      # ---- Display Selected Physician & Participant Photos ----
     col1, col2 = st.columns(2)
     if physician_filter != "All":
-        physician_photo_url = filtered_df["PhysicianPhoto"].dropna().iloc[0].strip("'")
-        with col1:
-            st.image(physician_photo_url, width=150, caption=f"Physician: {physician_filter}")
+        photos = filtered_df["PhysicianPhoto"].dropna()
+        if not photos.empty:
+            physician_photo_url = photos.iloc[0].strip("'")
+            with col1:
+                show_photo(physician_photo_url, width=150, caption=f"Physician: {physician_filter}")
     
     if participant_filter != "All":
-        participant_photo_url = filtered_df["ParticipantPhotoURL"].dropna().iloc[0].strip("'")
-        with col2:
-            st.image(participant_photo_url, width=150, caption=f"Participant: {participant_filter}")
+        photos = filtered_df["ParticipantPhotoURL"].dropna()
+        if not photos.empty:
+            participant_photo_url = photos.iloc[0].strip("'")
+            with col2:
+                show_photo(participant_photo_url, width=150, caption=f"Participant: {participant_filter}")
     
 
 
@@ -101,44 +131,45 @@ def show_page():
     # Apply filter based on selected survey
     if selected_survey != "All":
         filtered_df = filtered_df[filtered_df["SurveyName"] == selected_survey]
+    query = extend_query(query, selected_survey)
 
     # ✅ Corrected Grouping: Count each submission only once per survey & timepoint
-    grouped_df = (
-        filtered_df
-        .drop_duplicates(subset=["ParticipantID", "SurveyName", "SurveyTimepoint"])  # Ensures one count per submission
-        .groupby(["SurveyName", "SurveyTimepoint", "Outcome Category"])
-        .size()
-        .reset_index(name="Submission Count")
-    )
-
-    # Aggregate to get total submissions per Outcome Category
-    outcome_summary = (
-        grouped_df
-        .groupby(["Outcome Category"])
-        ["Submission Count"]
-        .sum()
-        .reset_index()
-    )
+    with span("Survey Outcome Distribution (aggregate)"):
+        grouped_df = (
+            filtered_df
+            .drop_duplicates(subset=["ParticipantID", "SurveyName", "SurveyTimepoint"])  # Ensures one count per submission
+            .groupby(["SurveyName", "SurveyTimepoint", "Outcome Category"])
+            .size()
+            .reset_index(name="Submission Count")
+        )
+
+        # Aggregate to get total submissions per Outcome Category
+        outcome_summary = (
+            grouped_df
+            .groupby(["Outcome Category"])
+            ["Submission Count"]
+            .sum()
+            .reset_index()
+        )
 
     if outcome_summary.empty:
         st.warning("No data available for the selected survey.")
         return
 
     # ✅ Corrected Bar Chart with Proper Summed Counts
-    fig_outcome = px.bar(
-        outcome_summary, 
+    chart(
+        "bar",
+        outcome_summary,
+        query,
         x="Outcome Category", 
         y="Submission Count",  # ✅ Now matches Total Submissions logic
         color="Outcome Category",
         title=f"Survey Outcome Distribution ({selected_survey})",
         labels={"Outcome Category": "Survey Outcome", "Submission Count": "Number of Submissions"},
-        text_auto=True
+        text_auto=True,
+        # ✅ Adjust Y-axis to correctly reflect large counts
+        layout=dict(yaxis=dict(title="Total Submissions", tickformat=","))  # Adds comma formatting
     )
-
-    # ✅ Adjust Y-axis to correctly reflect large counts
-    fig_outcome.update_layout(yaxis=dict(title="Total Submissions", tickformat=","))  # Adds comma formatting
-
-    st.plotly_chart(fig_outcome)
     
     
     st.subheader("📉 Survey Outcome Progression (Start → Mid → End)")
@@ -148,20 +179,23 @@ def show_page():
         return
 
     # Ensure correct grouping to track progression over time
-    progression_df = (
-        filtered_df
-        .groupby(["SurveyName", "SurveyTimepoint", "Outcome Category"])
-        .size()
-        .reset_index(name="Submission Count")
-    )
+    with span("Survey Outcome Progression (aggregate)"):
+        progression_df = (
+            filtered_df
+            .groupby(["SurveyName", "SurveyTimepoint", "Outcome Category"])
+            .size()
+            .reset_index(name="Submission Count")
+        )
 
     if progression_df.empty:
         st.warning("No data available after grouping.")
         return
 
     # Create a line chart to show how outcome categories progress over time
-    fig_progression = px.line(
+    chart(
+        "line",
         progression_df,
+        query,
         x="SurveyTimepoint",
         y="Submission Count",
         color="Outcome Category",
@@ -170,8 +204,79 @@ def show_page():
         labels={"SurveyTimepoint": "Survey Phase", "Submission Count": "Number of Submissions"}
     )
 
-    st.plotly_chart(fig_progression)
-    
+    # ---- Per-Question Analysis (row subsets of the prebuilt submission x item matrix) ----
+    st.subheader("🧩 Per-Question Analysis")
+    with span("Per-Question Analysis"):
+        items = item_matrix(survey_responses)
+        surveys = list(survey_options)
+        item_survey = st.selectbox("Survey", surveys, index=surveys.index(selected_survey) if selected_survey in surveys else 0, key="item_survey")
+        participants = filtered_df["ParticipantID"].unique()
+        timepoint = None if timepoint_filter == "All" else timepoint_filter
+        distribution = items.distribution(item_survey, participants, timepoint)
+        distribution["Answer"] = distribution["Response"].astype(str)
+        item_total = items.item_total(item_survey, participants, timepoint)
+        item_change = items.item_change(item_survey, participants)
+
+    chart(
+        "bar",
+        distribution,
+        extend_query(query, item_survey),
+        x="Question",
+        y="Share",
+        color="Answer",
+        title=f"{item_survey} Answers per Question" + (f" ({timepoint})" if timepoint else ""),
+        labels={"Share": "Share of Answers"},
+        layout=dict(yaxis=dict(tickformat=".0%")),
+    )
+    col1, col2 = st.columns(2)
+    with col1:
+        chart("bar", item_total, extend_query(query, item_survey), x="Question", y="Correlation", title=f"Item-to-Total Correlation (n = {item_total['Submissions'].iloc[0] if len(item_total) else 0} submissions)", labels={"Correlation": "r with the other items"})
+    with col2:
+        chart("bar", item_change, extend_query(query, item_survey), x="Question", y="Change", hover_data=["Start", "End", "Participants"], title="Average Answer Change per Question (START → END)")
+
+    # ---- Outcomes vs Activity (prebuilt join of submissions with the wearable days before them) ----
+    st.subheader("🔗 Survey Outcomes vs Activity")
+    with span("Outcomes vs Activity"):
+        metrics_df = startup_data().result("metrics")
+        index = survey_activity(load_key("metrics"), load_key("survey"), metrics_df, survey_scores)
+        col1, col2, col3 = st.columns(3)
+        outcome_survey = col1.selectbox("Survey", surveys, index=surveys.index(selected_survey) if selected_survey in surveys else 0, key="outcome_activity_survey")
+        activity_label = col2.selectbox("Activity Metric", list(ACTIVITY_LABELS), index=1, key="outcome_activity_metric")
+        period = col3.selectbox("Compare", list(OUTCOME_PERIODS), key="outcome_activity_period")
+        metric, scale = ACTIVITY_LABELS[activity_label]
+        changes = index.changes(outcome_survey, participants, *OUTCOME_PERIODS[period]).dropna(subset=["Total Score Change", f"{metric} Change"])
+        changes[f"{activity_label} Change"] = changes[f"{metric} Change"] / scale
+        by_outcome = index.submissions(outcome_survey, participants).groupby(["SurveyTimepoint", "Outcome Category"])[metric].mean().div(scale).reset_index(name=activity_label)
+        activity_query = extend_query(query, load_key("metrics"), outcome_survey, activity_label, period)
+
+    st.caption(f"Average daily {activity_label.lower()} over the {WINDOW_DAYS} days before each submission.")
+    if changes.empty:
+        st.info(f"No participant has wearable data before both {period.replace(' → ', ' and ')} submissions.")
+    else:
+        chart(
+            "scatter",
+            changes,
+            activity_query,
+            x=f"{activity_label} Change",
+            y="Total Score Change",
+            hover_data=["Participant Name"],
+            title=f"{outcome_survey} Score Change vs {activity_label} Change ({period})",
+        )
+        r = changes[f"{activity_label} Change"].corr(changes["Total Score Change"]) if len(changes) > 1 else float("nan")
+        st.caption(f"r = {r:.3f}, n = {len(changes)} participants")
+    chart(
+        "line",
+        by_outcome,
+        activity_query,
+        x="SurveyTimepoint",
+        y=activity_label,
+        color="Outcome Category",
+        markers=True,
+        category_orders={"SurveyTimepoint": ["START", "MID", "END"]},
+        title=f"{activity_label} Before Each {outcome_survey} Submission, by Outcome",
+        labels={"SurveyTimepoint": "Survey Phase"},
+    )
+
     
     # # Display Selected Physician & Participant Info Side-by-Side
     # if physician_filter != "All" or participant_filter != "All":
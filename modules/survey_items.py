@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from modules.startup import load_key
+
+# 'Survey Responses' holds one row per answered question. Per-question analysis used to mean
+# pivoting those long rows for every view, so the responses are instead packed once, at load, into
+# an int8 matrix with one row per submission (participant, survey, timepoint) and one column per
+# survey question. Questions a submission has no answer for are MISSING. Per-survey item metadata
+# maps each survey to its columns in question order. A filtered participant set is a row subset, so
+# response distributions, item-to-total correlations and per-item change between two timepoints
+# are numpy reductions over matrix[rows][:, columns].
+SUBMISSION_KEY = ["ParticipantID", "SurveyName", "SurveyTimepoint"]
+ITEM_KEY = ["SurveyName", "QuestionNumber"]
+MISSING = -1
+
+
+class ItemMatrix:
+    """ Submission x item int8 response matrix with per-survey item metadata. """
+
+    def __init__(self, responses):
+        responses = responses.dropna(subset=[*SUBMISSION_KEY, *ITEM_KEY, "Response"])
+        rows, submissions = pd.MultiIndex.from_frame(responses[SUBMISSION_KEY]).factorize()
+        columns, items = pd.MultiIndex.from_frame(responses[ITEM_KEY]).factorize()
+        values = responses["Response"].to_numpy()
+        if len(values) and (values.min() <= MISSING or values.max() > np.iinfo(np.int8).max):
+            raise ValueError(f"Survey responses must lie in 0..{np.iinfo(np.int8).max} to fit the int8 item matrix")
+        self.matrix = np.full((len(submissions), len(items)), MISSING, dtype=np.int8)
+        self.matrix[rows, columns] = values  # a repeated answer keeps the last row
+        self.submissions = submissions.to_frame(index=False, name=SUBMISSION_KEY)
+        texts = responses.drop_duplicates(ITEM_KEY).set_index(ITEM_KEY)["QuestionText"] if "QuestionText" in responses.columns else None
+        self.items = items.to_frame(index=False, name=ITEM_KEY).assign(Column=np.arange(len(items)))
+        self.items["QuestionText"] = texts.reindex(items).to_numpy() if texts is not None else self.items["QuestionNumber"].map("Q{}".format)
+        self.items = self.items.sort_values(ITEM_KEY, kind="stable").reset_index(drop=True)
+        self.survey_items = {survey: group for survey, group in self.items.groupby("SurveyName", sort=False)}
+        survey_codes, self.surveys = pd.factorize(self.submissions["SurveyName"])
+        self._survey_rows = {survey: np.flatnonzero(survey_codes == code) for code, survey in enumerate(self.surveys)}
+
+    @property
+    def nbytes(self):
+        """ Size of the response matrix in bytes. """
+        return self.matrix.nbytes
+
+    def rows(self, survey, participants=None, timepoint=None):
+        """ Row numbers of `survey`'s submissions, optionally restricted to participant IDs and a timepoint. """
+        rows = self._survey_rows.get(survey, np.empty(0, dtype=np.int64))
+        if participants is not None:
+            rows = rows[np.isin(self.submissions["ParticipantID"].to_numpy()[rows], np.asarray(participants))]
+        if timepoint is not None:
+            rows = rows[self.submissions["SurveyTimepoint"].to_numpy()[rows] == timepoint]
+        return rows
+
+    def responses(self, survey, rows):
+        """ (item metadata, responses as float with NaN for missing answers) of `survey` at `rows`. """
+        items = self.survey_items.get(survey, self.items.iloc[:0])
+        values = self.matrix[np.ix_(rows, items["Column"].to_numpy())].astype(np.float64)
+        values[values == MISSING] = np.nan
+        return items, values
+
+    def distribution(self, survey, participants=None, timepoint=None):
+        """ Question/Response/Count/Share frame: how often each answer was given to each question. """
+        items, values = self.responses(survey, self.rows(survey, participants, timepoint))
+        levels = np.unique(values[~np.isnan(values)])
+        counts = (values[:, :, None] == levels).sum(axis=0)  # item x level
+        answered = counts.sum(axis=1, keepdims=True)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            share = counts / answered
+        return pd.DataFrame({
+            "Question": np.repeat(items["QuestionText"].to_numpy(), len(levels)),
+            "Response": np.tile(levels.astype(int), len(items)),
+            "Count": counts.ravel(),
+            "Share": share.ravel(),
+        })
+
+    def item_total(self, survey, participants=None, timepoint=None):
+        """ Question/Correlation/Submissions frame: each item's correlation with the total of the other items. """
+        items, values = self.responses(survey, self.rows(survey, participants, timepoint))
+        values = values[~np.isnan(values).any(axis=1)]  # complete submissions only
+        rest = values.sum(axis=1, keepdims=True) - values
+        centred, rest = values - values.mean(axis=0), rest - rest.mean(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = (centred * rest).sum(axis=0) / np.sqrt((centred ** 2).sum(axis=0) * (rest ** 2).sum(axis=0))
+        return pd.DataFrame({"Question": items["QuestionText"].to_numpy(), "Correlation": r, "Submissions": len(values)})
+
+    def item_change(self, survey, participants=None, start="START", end="END"):
+        """ Question/Start/End/Change/Participants frame: mean answer per item at both timepoints, over participants with both. """
+        before, after = self.rows(survey, participants, start), self.rows(survey, participants, end)
+        ids = self.submissions["ParticipantID"].to_numpy()
+        _, first, second = np.intersect1d(ids[before], ids[after], return_indices=True)
+        items, start_values = self.responses(survey, before[first])
+        _, end_values = self.responses(survey, after[second])
+        paired = ~np.isnan(start_values) & ~np.isnan(end_values)
+        n = paired.sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            start_mean = np.where(paired, start_values, 0).sum(axis=0) / n
+            end_mean = np.where(paired, end_values, 0).sum(axis=0) / n
+        return pd.DataFrame({"Question": items["QuestionText"].to_numpy(), "Start": start_mean, "End": end_mean, "Change": end_mean - start_mean, "Participants": n})
+
+
+@st.cache_resource(show_spinner=False)
+def survey_items(load, _responses):
+    """ Item matrix of the survey responses of `load` (see startup.load_key), shared by all sessions. """
+    return ItemMatrix(_responses)
+
+
+def item_matrix(responses):
+    """ The shared item matrix for the configured survey source. """
+    return survey_items(load_key("survey"), responses)
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+# The metrics workbook is validated once, at ingest, in one vectorised pass: every check is a
+# boolean mask over all rows. Rows failing any check are moved to a quarantine table that lists
+# their issues, and the pass publishes a data-quality summary (checks, counts, null rates). Pages
+# then get typed columns, parsed dates, unique participant-days and non-null REQUIRED_COLUMNS, so
+# they can skip their own defensive dropna() scans. Nulls in the metric columns are normal (a night
+# without sleep data) and are reported as null rates rather than quarantined, as are missing photo
+# URLs: a row without a photo is still a valid reading, so pages keep their dropna() before a photo.
+REQUIRED_COLUMNS = ["ParticipantID", "Participant Name", "RecordDate", "OrganizationName", "CohortName", "ProgramName",
+                    "ParticipantGender", "Ethnicity", "AgeGroup", "City", "PhysicianName"]
+NUMERIC_COLUMNS = ["Age", "WeightKg", "HeightCm", "Steps", "Calories", "DurationAsleep", "DeepSleep", "LightSleep",
+                   "REMSleep", "AwakeTime", "SleepEfficiency", "RestingHeartRate", "HeartRateAvg", "minHR", "maxHR",
+                   "HRZones_Fatburn", "HRZones_Cardio", "HRZones_Peak", "HRV-avgHRV"]
+RANGES = {
+    "WeightKg": (10, 350),
+    "HeightCm": (50, 250),
+    "RestingHeartRate": (20, 220),
+    "HeartRateAvg": (20, 250),
+    "minHR": (20, 250),
+    "maxHR": (20, 250),
+}
+KEY_COLUMNS = ["ParticipantID", "RecordDate"]
+_NUMBER = r"\s*(?:-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|nan)\s*"
+# Well-formed intraday sample strings: "[(unix_ts, bpm), ...]" and "{seconds_since_midnight: ms, ...}".
+SAMPLE_FORMATS = {
+    "HeartRateSamples": rf"\[\s*(?:\({_NUMBER},{_NUMBER}\)\s*,?\s*)*\]",
+    "HRVValues": rf"\{{(?:{_NUMBER}:{_NUMBER},?)*\}}",
+}
+
+
+def _checks(df):
+    """ {issue: row mask} of every failed check; coerces the numeric and date columns of `df` in place. """
+    checks = {}
+    for column in REQUIRED_COLUMNS:
+        if column in df.columns and column != "RecordDate":
+            checks[f"Missing {column}"] = df[column].isna().to_numpy()
+    for column in NUMERIC_COLUMNS:
+        if column in df.columns and not pd.api.types.is_numeric_dtype(df[column]):
+            given = df[column].notna().to_numpy()
+            df[column] = pd.to_numeric(df[column], errors="coerce")
+            checks[f"Non-numeric {column}"] = given & df[column].isna().to_numpy()
+    given = df["RecordDate"].notna().to_numpy()
+    df["RecordDate"] = pd.to_datetime(df["RecordDate"], errors="coerce")
+    parsed = df["RecordDate"].notna().to_numpy()
+    checks["Missing RecordDate"] = ~given
+    checks["Unparseable RecordDate"] = given & ~parsed
+    for column, (low, high) in RANGES.items():
+        if column in df.columns:
+            values = df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+            checks[f"{column} out of range"] = (values < low) | (values > high)
+    for column, pattern in SAMPLE_FORMATS.items():
+        if column in df.columns:
+            present = df[column].notna().to_numpy()
+            checks[f"Unparseable {column}"] = present & ~df[column].astype(str).str.fullmatch(pattern).to_numpy(dtype=bool)
+    return checks
+
+
+def validate_metrics(df):
+    """ (clean frame, quarantine frame, quality summary) of the raw metrics rows.
+
+    The quarantine keeps the rows as loaded plus an Issues column. The summary holds row counts,
+    a Check/Rows table and the null rate of every column of the clean frame.
+    """
+    raw = df
+    df = df.copy()
+    checks = _checks(df)
+    bad = np.logical_or.reduce(list(checks.values())) if checks else np.zeros(len(df), dtype=bool)
+    # Repeated participant-days: the first valid row of each key is kept.
+    duplicate = np.zeros(len(df), dtype=bool)
+    duplicate[~bad] = df.loc[~bad].duplicated(KEY_COLUMNS).to_numpy()
+    checks["Duplicate participant-day"] = duplicate
+    bad |= duplicate
+
+    issues = np.full(int(bad.sum()), "", dtype=object)
+    for issue, mask in checks.items():
+        issues[mask[bad]] += issue + "; "
+    quarantine = raw.loc[bad].assign(Issues=[text.rstrip("; ") for text in issues])
+    clean = df.loc[~bad].reset_index(drop=True)
+    summary = {
+        "rows": len(df),
+        "clean": len(clean),
+        "quarantined": len(quarantine),
+        "checks": pd.DataFrame({"Check": list(checks), "Rows": [int(mask.sum()) for mask in checks.values()]}),
+        "null_rates": clean.isna().mean().rename("Null Rate").rename_axis("Column").reset_index(),
+    }
+    return clean, quarantine, summary
@@ -0,0 +1,130 @@
+import importlib
+import logging
+import os
+import threading
+import time
+
+import streamlit as st
+
+from modules.startup import load_key, startup_data
+from modules.sketches import survey_cube
+from modules.querylog import QUERY_PAGES, prewarm_budget, query_frame, query_log, replay_queries, replay_query
+
+# Page modules are imported on their first visit and the shared engines are built on first use,
+# so every page's first visit used to pay for its own imports, index builds and aggregates. Once
+# the first rerun has painted, a background thread imports every page module and builds what each
+# page shows first: the survey cube behind the survey totals and the trend aggregates of the metric
+# pages for the view that rerun showed. Last come the most frequent views of the query log (see
+# modules/querylog.py), replayed within the prewarm budget. Engines behind collapsed sections
+# (intraday pyramid, forecasts, caseload, ...) are left to their first use, and the steps stop once
+# the thread has used ALTHEALTH_WARMUP_CPU_SECONDS of CPU, so the warm-up can't starve the sessions
+# it shares the process with. The steps run once per loaded dataset; set ALTHEALTH_WARMUP=0 to
+# disable them.
+WARMUP_ENV = "ALTHEALTH_WARMUP"
+WARMUP_CPU_SECONDS_ENV = "ALTHEALTH_WARMUP_CPU_SECONDS"
+DEFAULT_WARMUP_CPU_SECONDS = 20
+PAGE_MODULES = {
+    "Steps Analysis": "modules.step_analysis",
+    "Sleep Analysis": "modules.sleep_analysis",
+    "Heart Rate Analysis": "modules.heart_rate_analysis",
+    "Comparison Analysis": "modules.comparison_analysis",
+    "Physician Caseload": "modules.caseload_analysis",
+    "Survey Analysis": "modules.survey_analysis",
+}
+
+logger = logging.getLogger("althealth.warmup")
+
+
+def _first_view_aggregates(filtered_df):
+    """ (name, fn) steps building the cached aggregates each metric page shows first for `filtered_df`. """
+    return [
+        ("aggregate_steps", lambda: importlib.import_module("modules.step_analysis").aggregate_steps(filtered_df, "Daily")),
+        ("aggregate_sleep", lambda: importlib.import_module("modules.sleep_analysis").aggregate_sleep(filtered_df, "Daily")),
+        ("aggregate_heart_rate", lambda: importlib.import_module("modules.heart_rate_analysis").aggregate_heart_rate(filtered_df, "Daily")),
+    ]
+
+
+def _replay_view(df, query):
+    """ Builds the cached trend aggregate and figure of one logged page view (under the query its page uses). """
+    frame = query_frame(df, query)
+    if frame.empty:
+        return
+    module = importlib.import_module(PAGE_MODULES[query["page"]])
+    try:
+        module.trend_figure(frame, query["interval"], replay_query(query))
+    except Exception as e:  # e.g. a logged selection the new dataset no longer supports
+        logger.warning("prewarm of %s failed: %s", query, e)
+
+
+def prewarm_queries(df):
+    """ Replays the most frequent logged views within the prewarm budget; returns how many ran. """
+    top_k, seconds, cpu_seconds = prewarm_budget()
+    queries = [query for query in query_log().top(top_k) if query.get("page") in QUERY_PAGES]
+    done = replay_queries(queries, lambda query: _replay_view(df, query), seconds, cpu_seconds)
+    logger.info("prewarmed %d of %d frequent views", done, len(queries))
+    return done
+
+
+def warmup_steps(df, filtered_df=None):
+    """ Ordered (name, fn) warm-up steps: page imports, the survey cube, then first-view aggregates. """
+    steps = [(f"import {name}", lambda name=name: importlib.import_module(name)) for name in PAGE_MODULES.values()]
+    steps.append(("import plotly.express", lambda: importlib.import_module("plotly.express")))
+    steps.append(("survey cube", lambda: survey_cube(load_key("survey"), startup_data().result("survey")["Survey Responses"])))
+    if filtered_df is not None and not filtered_df.empty:
+        steps += _first_view_aggregates(filtered_df)
+    steps.append(("prewarm frequent views", lambda: prewarm_queries(df)))
+    return steps
+
+
+class Warmup:
+    """ Runs warm-up steps in order on a background thread, recording how long each took.
+
+    Steps left when the thread has used `cpu_seconds` of CPU are skipped (listed in `skipped`).
+    """
+
+    def __init__(self, steps, cpu_seconds=float("inf")):
+        self.steps = steps
+        self.cpu_seconds = cpu_seconds
+        self.timings = {}
+        self.errors = {}
+        self.skipped = []
+        self._done = threading.Event()
+        threading.Thread(target=self._run, name="althealth-warmup", daemon=True).start()
+
+    def _run(self):
+        cpu = time.thread_time()
+        try:
+            for name, step in self.steps:
+                if time.thread_time() - cpu >= self.cpu_seconds:
+                    self.skipped.append(name)
+                    continue
+                start = time.perf_counter()
+                try:
+                    step()
+                except Exception as e:  # a failed step only means that page warms up on its first visit
+                    self.errors[name] = e
+                    logger.warning("warm-up step %r failed: %s", name, e)
+                self.timings[name] = time.perf_counter() - start
+            if self.skipped:
+                logger.info("warm-up CPU budget spent; skipped %s", ", ".join(self.skipped))
+        finally:
+            self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _warmup(load, _df, _filtered_df):
+    return Warmup(warmup_steps(_df, _filtered_df), float(os.environ.get(WARMUP_CPU_SECONDS_ENV, DEFAULT_WARMUP_CPU_SECONDS)))
+
+
+def start_warmup(df, filtered_df=None):
+    """ Starts the warm-up of the loaded dataset (once per dataset); returns it, or None when disabled. """
+    if os.environ.get(WARMUP_ENV, "1") == "0":
+        return None
+    # A reload gets a new load key, so the new dataset is warmed in turn (and its engines rebuilt).
+    return _warmup(load_key("metrics"), df, filtered_df)
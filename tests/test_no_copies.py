@@ -0,0 +1,60 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic_data import write_dataset
+from modules.data_sources import METRICS_SOURCE_ENV, SURVEY_SOURCE_ENV
+from modules.sections import LAZY_SECTIONS_ENV
+from modules.startup import startup_data
+from modules.warmup import PAGE_MODULES, WARMUP_ENV
+
+# Pages read the shared metrics frame through views and cached aggregates (see modules/derived.py);
+# none of them may copy it. The shared engines copy what they need once, when they are built, so
+# every page is rendered once to build them, and the check runs on a second pass under a new
+# selection, which misses the aggregate and figure caches but not the engine caches. Sections
+# render eagerly so each one is covered.
+PAGES = ["Main Dashboard", *PAGE_MODULES]
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    metrics_dir, survey_dir = write_dataset(str(tmp_path), samples_per_day=4)
+    monkeypatch.setenv(METRICS_SOURCE_ENV, metrics_dir)
+    monkeypatch.setenv(SURVEY_SOURCE_ENV, survey_dir)
+    monkeypatch.setenv(WARMUP_ENV, "0")
+    monkeypatch.setenv(LAZY_SECTIONS_ENV, "0")
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=300)
+    at.run()
+    assert not at.exception
+    return at
+
+
+def test_pages_do_not_copy_the_metrics_frame(app, monkeypatch):
+    for page in PAGES:
+        app.radio[0].set_value(page).run()
+        assert not app.exception, page
+    rows = len(startup_data().result("metrics"))
+
+    copied = []
+    copy = pd.DataFrame.copy
+
+    def recording_copy(self, *args, **kwargs):
+        if len(self) == rows:
+            copied.append(page)
+        return copy(self, *args, **kwargs)
+
+    monkeypatch.setattr(pd.DataFrame, "copy", recording_copy)
+    page = PAGES[0]
+    app.radio[0].set_value(page).run()
+    gender = app.selectbox(key="gender_filter")
+    gender.set_value(gender.options[1]).run()
+    for page in PAGES:
+        app.radio[0].set_value(page).run()
+        assert not app.exception, page
+    assert copied == []
@@ -0,0 +1,67 @@
+import os
+import shutil
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.local_server import serve_directory
+from benchmarks.synthetic_data import write_photos
+from modules.photos import PhotoCache
+
+# The photo cache against photos served over HTTP by the benchmarks' local server: a second render
+# of a photo is served from disk without a request, and a failed URL is only fetched again once its
+# backoff (doubling per consecutive failure) has expired.
+RETRY_SECONDS = 0.2
+
+
+@pytest.fixture
+def photos(tmp_path):
+    names = write_photos(str(tmp_path / "photos"), count=2, size=64)
+    with serve_directory(str(tmp_path / "photos")) as server:
+        yield server, names
+
+
+def test_second_render_is_a_hit(photos, tmp_path):
+    server, names = photos
+    cache = PhotoCache(str(tmp_path / "cache"), max_bytes=1024 * 1024)
+    first = cache.thumbnail(server.url(names[0]), 32)
+    assert first is not None
+    assert (cache.stats["misses"], cache.stats["hits"], server.request_count) == (1, 0, 1)
+
+    assert cache.thumbnail(server.url(names[0]), 32) == first
+    assert (cache.stats["misses"], cache.stats["hits"], server.request_count) == (1, 1, 1)
+
+    # A new process finds the thumbnail on disk.
+    reopened = PhotoCache(str(tmp_path / "cache"), max_bytes=1024 * 1024)
+    assert reopened.thumbnail(server.url(names[0]), 32) == first
+    assert server.request_count == 1
+
+
+def test_failed_url_backs_off_then_retries(photos, tmp_path):
+    server, names = photos
+    cache = PhotoCache(str(tmp_path / "cache"), max_bytes=1024 * 1024, retry_seconds=RETRY_SECONDS)
+    url = server.url("late.jpg")
+    assert cache.thumbnail(url, 32) is None
+    assert (cache.stats["errors"], server.request_count) == (1, 1)
+
+    # Within the backoff the URL is not fetched again.
+    assert cache.thumbnail(url, 32) is None
+    assert server.request_count == 1
+
+    # The second failure doubles the backoff.
+    time.sleep(RETRY_SECONDS * 1.5)
+    assert cache.thumbnail(url, 32) is None
+    assert (cache.stats["errors"], server.request_count) == (2, 2)
+    time.sleep(RETRY_SECONDS * 1.5)
+    assert cache.thumbnail(url, 32) is None
+    assert server.request_count == 2
+
+    shutil.copy(tmp_path / "photos" / names[0], tmp_path / "photos" / "late.jpg")
+    time.sleep(RETRY_SECONDS)
+    assert cache.thumbnail(url, 32) is not None
+    assert server.request_count == 3
+    assert url not in cache._failed
@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.local_server import serve_directory
+from benchmarks.synthetic_data import write_workbooks
+from modules import startup
+from modules.data_sources import METRICS_SOURCE_ENV, SURVEY_SOURCE_ENV
+
+# The startup loaders against workbooks served over HTTP by the benchmarks' local server: a source
+# that fails leaves the other loaded, and the next startup_data() call loads the failed source
+# again on its own while the other keeps its result.
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    write_workbooks(str(tmp_path), samples_per_day=4)
+    os.rename(tmp_path / "survey.xlsx", tmp_path / "survey.pending")
+    startup._source_loader.clear()
+    with serve_directory(str(tmp_path)) as server:
+        monkeypatch.setenv(METRICS_SOURCE_ENV, server.url("metrics.xlsx"))
+        monkeypatch.setenv(SURVEY_SOURCE_ENV, server.url("survey.xlsx"))
+        yield server
+    startup._source_loader.clear()
+
+
+def test_failed_source_is_retried_alone(server, tmp_path):
+    data = startup.startup_data()
+    assert data.wait(timeout=120)
+    assert list(data.errors) == ["survey"]
+    metrics = data.result("metrics")
+    assert len(metrics) > 0
+    with pytest.raises(requests.HTTPError):
+        data.result("survey")
+    assert server.request_count == 2
+
+    os.rename(tmp_path / "survey.pending", tmp_path / "survey.xlsx")
+    retried = startup.startup_data()
+    assert retried.loaders["metrics"] is data.loaders["metrics"]
+    assert retried.wait(timeout=120)
+    assert retried.errors == {}
+    assert set(retried.result("survey")) == {"Survey Responses", "Survey Scores"}
+    assert retried.result("metrics") is metrics
+    assert server.request_count == 3  # only the survey workbook was downloaded again
+    assert startup.load_key("metrics") == (server.url("metrics.xlsx"), data.loaders["metrics"].load_number)
+    assert startup.load_key("survey")[1] != data.loaders["survey"].load_number